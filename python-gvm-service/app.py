@@ -1,36 +1,135 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Path, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-from gvm.connections import TLSConnection
-from gvm.protocols.gmp import Gmp
-from lxml import etree
-from icalendar import Calendar, Event
+from typing import AsyncIterator, Optional
+from gvm.errors import GvmResponseError
+from gvm.transforms import check_command_status
 from datetime import datetime
-from typing import Any, Dict
 import pytz
+import asyncio
+import json
 import os
+from collections import deque
 
-def element_to_dict(element: etree._Element) -> Dict[str, Any]:
-    """Recursively converts an XML element into a dictionary, handling repeated tags."""
-    result = {}
-    for child in element:
-        child_dict = element_to_dict(child) if len(child) else child.text
-        if child.tag in result:
-            if not isinstance(result[child.tag], list):
-                result[child.tag] = [result[child.tag]]
-            result[child.tag].append(child_dict)
-        else:
-            result[child.tag] = child_dict
-    result.update(element.attrib)
-    return result
+from gmp_admission import PRIORITIES, TEAM_PATTERN, AdmissionQueue, AdmissionStore
+from gmp_async import AsyncGmp, AsyncGmpPool
+from gmp_batch import run_batch
+from gmp_cache import LIST, ResponseCache, etag_matches
+from gmp_export import (
+    COMPRESSION_PATTERN, EXPORT_FORMAT_PATTERN, EXPORT_FORMATS, ResultBatchBuilder, ResultExportWriter,
+)
+from gmp_diff import CHANGES, CHANGES_PATTERN, INDEX_FIELDS, ReportDiff, ReportIndexBuilder, ReportIndexCache
+from gmp_convert import convert_entity, convert_response, element_to_dict, validate_fields
+from gmp_filters import FILTER_VALUE_PATTERN, SORT_PATTERN, build_results_filter
+from gmp_metrics import REGISTRY, CallbackGauge, MetricsMiddleware, timed
+from gmp_managers import MANAGER_NAME_PATTERN, PLACEMENTS, Manager, ManagerRegistry, merge_responses
+from gmp_summary import (
+    CRITICAL, FINISHED_STATUSES, REPORT_COUNT_FIELDS, RESULT_FIELDS, SUMMARY_FILTER,
+    ResultColumns, classes_from_result_count, summarize,
+)
+from gmp_sync import ResultSync, open_result_store
+from gmp_watch import TaskWatcher
+from gmp_schedules import ForecastTooLarge, build_icalendar, forecast
+from gmp_reports import DEFAULT_REPORT_FORMATS, REPORT_ID_PATTERN, ReportDecoder, ReportSpool
 
 # Configuration
-GVM_HOST = "192.168.0.233"
-GVM_PORT = 9390
+GVM_HOST = os.getenv("GVM_HOST", "192.168.0.233")
+GVM_PORT = int(os.getenv("GVM_PORT", "9390"))
+# Connects to the default manager over this Unix socket instead of TLS
+GVM_SOCKET = os.getenv("GVM_SOCKET")
 gvmUsername = "admin"
 gvmPassword = "admin"
 
-app = FastAPI()
+GVM_POOL_SIZE = int(os.getenv("GVM_POOL_SIZE", "8"))
+GVM_POOL_TIMEOUT = float(os.getenv("GVM_POOL_TIMEOUT", "30"))
+GVM_POOL_HEALTH_CHECK_AFTER = float(os.getenv("GVM_POOL_HEALTH_CHECK_AFTER", "30"))
+GVM_POOL_MAX_LIFETIME = float(os.getenv("GVM_POOL_MAX_LIFETIME", "3600"))
+
+# Further gvmd managers as JSON, e.g.
+# '{"scan2": {"host": "10.0.0.2", "port": 9390, "username": "admin", "password": "..."}}'
+# ("path" instead of host and port connects over a Unix socket). Ids of
+# their entities are prefixed with the manager name, e.g. "scan2.<uuid>".
+GVM_MANAGERS = json.loads(os.getenv("GVM_MANAGERS", "{}"))
+GVM_MANAGER_NAME = os.getenv("GVM_MANAGER_NAME", "default")
+# Where new targets go: least_loaded or hash. Schedules are created on the
+# manager of their target_id
+GVM_PLACEMENT = os.getenv("GVM_PLACEMENT", "least_loaded")
+
+# Upper bound of histogram buckets in a schedule forecast
+GVM_FORECAST_MAX_BUCKETS = int(os.getenv("GVM_FORECAST_MAX_BUCKETS", "10000"))
+
+# Items per batch request and how many of them run against gvmd at once
+GVM_BATCH_MAX_ITEMS = int(os.getenv("GVM_BATCH_MAX_ITEMS", "1000"))
+GVM_BATCH_CONCURRENCY = int(os.getenv("GVM_BATCH_CONCURRENCY", str(GVM_POOL_SIZE)))
+
+GVM_CACHE_SIZE = int(os.getenv("GVM_CACHE_SIZE", "1024"))
+# Seconds each entity stays cached; 0 disables caching for it
+GVM_CACHE_TTLS = {
+    "port_list": float(os.getenv("GVM_CACHE_TTL_PORT_LIST", "3600")),
+    "scan_config": float(os.getenv("GVM_CACHE_TTL_SCAN_CONFIG", "3600")),
+    "scanner": float(os.getenv("GVM_CACHE_TTL_SCANNER", "3600")),
+    "target": float(os.getenv("GVM_CACHE_TTL_TARGET", "60")),
+    "schedule": float(os.getenv("GVM_CACHE_TTL_SCHEDULE", "60")),
+    "task": float(os.getenv("GVM_CACHE_TTL_TASK", "5")),
+    # Summaries of running scans use the task TTL instead
+    "report_summary": float(os.getenv("GVM_CACHE_TTL_REPORT_SUMMARY", "3600")),
+}
+
+# Bounds of the adaptive task status polling interval, in seconds
+GVM_WATCH_MIN_INTERVAL = float(os.getenv("GVM_WATCH_MIN_INTERVAL", "2"))
+GVM_WATCH_MAX_INTERVAL = float(os.getenv("GVM_WATCH_MAX_INTERVAL", "30"))
+# Seconds between keep-alive comments on idle event streams
+GVM_WATCH_KEEPALIVE = float(os.getenv("GVM_WATCH_KEEPALIVE", "15"))
+
+# Directory of the service's own databases, created on startup
+GVM_DATA_DIR = os.path.expanduser(os.getenv("GVM_DATA_DIR", "~/.local/share/gvm-service"))
+
+# Local copy of results kept up to date by the sync endpoints
+GVM_RESULT_STORE = os.getenv("GVM_RESULT_STORE", f"sqlite://{os.path.join(GVM_DATA_DIR, 'results.db')}")
+GVM_SYNC_PAGE_SIZE = int(os.getenv("GVM_SYNC_PAGE_SIZE", "1000"))
+
+# Results per record batch (and Parquet row group) of a results export
+GVM_EXPORT_BATCH_ROWS = int(os.getenv("GVM_EXPORT_BATCH_ROWS", "65536"))
+
+# Finding indexes of reports kept for diffs, bounded by their estimated size
+GVM_DIFF_INDEX_TTL = float(os.getenv("GVM_DIFF_INDEX_TTL", "3600"))
+GVM_DIFF_CACHE_BYTES = int(os.getenv("GVM_DIFF_CACHE_BYTES", str(512 * 2**20)))
+
+# Extra or overridden report formats as JSON, e.g. '{"html": "<format id>"}'
+GVM_REPORT_FORMATS = {**DEFAULT_REPORT_FORMATS, **json.loads(os.getenv("GVM_REPORT_FORMATS", "{}"))}
+# Directory for spooled downloads of finished (Done) reports; unset disables spooling
+GVM_REPORT_SPOOL_DIR = os.getenv("GVM_REPORT_SPOOL_DIR")
+GVM_REPORT_SPOOL_TTL = float(os.getenv("GVM_REPORT_SPOOL_TTL", "3600"))
+# Upper bound for the spool directory in bytes; 0 means unbounded
+GVM_REPORT_SPOOL_MAX_BYTES = int(os.getenv("GVM_REPORT_SPOOL_MAX_BYTES", "0"))
+
+# Admission queue for task starts. Limits on concurrently running scans,
+# in total and per scanner; 0 means no limit, and with no limit at all
+# tasks start right away.
+GVM_ADMISSION_MAX_RUNNING = int(os.getenv("GVM_ADMISSION_MAX_RUNNING", "0"))
+GVM_ADMISSION_MAX_RUNNING_PER_SCANNER = int(os.getenv("GVM_ADMISSION_MAX_RUNNING_PER_SCANNER", "0"))
+# Limits of single scanners as JSON, e.g. '{"<scanner id>": 4, "scan2.<scanner id>": 2}';
+# limits and counts are per manager, a bare id being the default manager's scanner
+GVM_ADMISSION_SCANNER_LIMITS = json.loads(os.getenv("GVM_ADMISSION_SCANNER_LIMITS", "{}"))
+# Fair share weights as JSON, e.g. '{"red-team": 2}'; other teams weigh 1
+GVM_ADMISSION_TEAM_WEIGHTS = json.loads(os.getenv("GVM_ADMISSION_TEAM_WEIGHTS", "{}"))
+GVM_ADMISSION_DB = os.getenv("GVM_ADMISSION_DB", os.path.join(GVM_DATA_DIR, "admission.db"))
+
+PRIORITY_PATTERN = f"^({'|'.join(PRIORITIES)})$"
+
+# Share of requests whose time per phase is kept for /debug/profiles
+GVM_PROFILE_SAMPLE_RATE = float(os.getenv("GVM_PROFILE_SAMPLE_RATE", "0"))
+GVM_PROFILE_KEEP = int(os.getenv("GVM_PROFILE_KEEP", "100"))
+
+class TimedJSONResponse(JSONResponse):
+    @timed("serialize")
+    def render(self, content) -> bytes:
+        return super().render(content)
+
+app = FastAPI(default_response_class=TimedJSONResponse)
+
+request_profiles = deque(maxlen=GVM_PROFILE_KEEP)
+app.add_middleware(MetricsMiddleware, sample_rate=GVM_PROFILE_SAMPLE_RATE, profiles=request_profiles)
 
 class TargetRequest(BaseModel):
     name: str
@@ -43,6 +142,8 @@ class ScheduleRequest(BaseModel):
     period: Optional[str] = "FREQ=DAILY"
     timezone: Optional[str] = "UTC"
     until: Optional[str] = None  # Format: YYYYMMDDTHHMMSSZ (UTC)
+    # Target of the tasks that will use the schedule; places the schedule
+    target_id: Optional[str] = None
 
 class TaskRequest(BaseModel):
     name: str
@@ -52,388 +153,1231 @@ class TaskRequest(BaseModel):
     scanner_id: Optional[str] ="08b69003-5fc2-4037-a479-93b440211c73"
     
 
-def connect_to_gvm():
-    connection = TLSConnection(
-        hostname=GVM_HOST,
-        port=GVM_PORT,
+def make_async_pool(factory, username: str, password: str) -> AsyncGmpPool:
+    # The pool size caps concurrent commands sent to one gvmd
+    return AsyncGmpPool(
+        factory,
+        username,
+        password,
+        max_size=GVM_POOL_SIZE,
+        checkout_timeout=GVM_POOL_TIMEOUT,
+        health_check_after=GVM_POOL_HEALTH_CHECK_AFTER,
+        max_lifetime=GVM_POOL_MAX_LIFETIME,
+    )
+
+def manager_pool(config: dict) -> AsyncGmpPool:
+    return make_async_pool(
+        lambda: AsyncGmp(hostname=config.get("host"), port=config.get("port", 9390), path=config.get("path")),
+        config.get("username", gvmUsername),
+        config.get("password", gvmPassword),
     )
-    return Gmp(connection)
+
+# Pool of the default manager
+async_gmp_pool = make_async_pool(
+    lambda: AsyncGmp(hostname=GVM_HOST, port=GVM_PORT, path=GVM_SOCKET), gvmUsername, gvmPassword
+)
+
+managers = ManagerRegistry(
+    [Manager(GVM_MANAGER_NAME, async_gmp_pool, prefixed=False)]
+    + [Manager(name, manager_pool(config)) for name, config in GVM_MANAGERS.items()],
+    PLACEMENTS[GVM_PLACEMENT](),
+)
+
+response_cache = ResponseCache(GVM_CACHE_TTLS, max_entries=GVM_CACHE_SIZE)
+report_index_cache = ReportIndexCache(GVM_DIFF_INDEX_TTL, max_bytes=GVM_DIFF_CACHE_BYTES)
+
+report_spool = (
+    ReportSpool(GVM_REPORT_SPOOL_DIR, max_age=GVM_REPORT_SPOOL_TTL, max_bytes=GVM_REPORT_SPOOL_MAX_BYTES)
+    if GVM_REPORT_SPOOL_DIR
+    else None
+)
+
+WATCHED_TASK_FIELDS = "id,name,status,progress,scanner.id,current_report.report.id,last_report.report.id"
+
+# Last state seen per manager, kept while a manager cannot be reached so its
+# tasks are not reported as removed
+last_task_status = {}
+
+async def fetch_task_status():
+    async def fetch(manager: Manager):
+        async with manager.pool.session() as gmp:
+            return {
+                manager.global_id(task.get("id")): manager.globalize(convert_entity(task, "task", WATCHED_TASK_FIELDS))
+                async for task in gmp.iter_elements("get_tasks", "task", filter_string="rows=-1")
+            }
+
+    results, _ = await managers.gather(fetch)
+    last_task_status.update((manager.name, tasks) for manager, tasks in results)
+    snapshot = {}
+    for tasks in last_task_status.values():
+        snapshot.update(tasks)
+    return snapshot
+
+task_watcher = TaskWatcher(
+    fetch_task_status,
+    min_interval=GVM_WATCH_MIN_INTERVAL,
+    max_interval=GVM_WATCH_MAX_INTERVAL,
+)
+
+async def start_task_now(task_id: str):
+    owner, local_id = managers.route(task_id)
+    async with owner.pool.session() as gmp:
+        response = await gmp.start_task(local_id)
+    try:
+        root = checked_root(response)
+    except GvmResponseError as e:
+        if e.status == "404":
+            raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
+        raise
+    response_cache.invalidate("task", task_id)
+    task_watcher.poke()
+    return {"report_id": owner.global_id(root.findtext("report_id"))}
+
+admission_queue = AdmissionQueue(
+    task_watcher,
+    start_task_now,
+    max_running=GVM_ADMISSION_MAX_RUNNING,
+    max_running_per_scanner=GVM_ADMISSION_MAX_RUNNING_PER_SCANNER,
+    scanner_limits={
+        (owner.name, scanner_id): limit
+        for key, limit in GVM_ADMISSION_SCANNER_LIMITS.items()
+        for owner, scanner_id in (managers.route(key),)
+    },
+    team_weights=GVM_ADMISSION_TEAM_WEIGHTS,
+    manager_of=lambda task_id: managers.route(task_id)[0].name,
+)
+
+result_sync = ResultSync(managers, page_size=GVM_SYNC_PAGE_SIZE)
+
+@app.on_event("startup")
+def open_stores():
+    # Opened here rather than on import, so importing app touches no files
+    os.makedirs(GVM_DATA_DIR, exist_ok=True)
+    result_sync.store = open_result_store(GVM_RESULT_STORE)
+    admission_queue.open(AdmissionStore(GVM_ADMISSION_DB))
+
+@app.on_event("startup")
+async def start_task_watcher():
+    task_watcher.start()
+    admission_queue.start()
+
+@app.on_event("shutdown")
+async def close_gmp_pools():
+    await admission_queue.stop()
+    await task_watcher.stop()
+    await managers.close()
+    result_sync.store.close()
+    admission_queue.close()
+
+REGISTRY.register(CallbackGauge(
+    "gmp_pool_sessions", "GMP sessions per manager and state.", ("manager", "state"),
+    lambda: [
+        ((manager.name, state), stats[state])
+        for manager in managers
+        for stats in (manager.pool.stats(),)
+        for state in ("in_use", "idle")
+    ],
+))
+REGISTRY.register(CallbackGauge(
+    "gvm_cache_entries", "Cached responses.", (), lambda: [((), response_cache.stats()["entries"])]
+))
+REGISTRY.register(CallbackGauge(
+    "gvm_diff_index_bytes", "Estimated size of cached report indexes.", (),
+    lambda: [((), report_index_cache.stats()["bytes"])],
+))
+REGISTRY.register(CallbackGauge(
+    "gvm_watch_subscribers", "Task status subscribers.", (), lambda: [((), task_watcher.stats()["subscribers"])]
+))
+REGISTRY.register(CallbackGauge(
+    "gvm_admission_tasks", "Tasks in the admission queue and running.", ("state",),
+    lambda: [((state,), stats[state]) for stats in (admission_queue.stats(),) for state in ("queued", "running")],
+))
+
+def check_fields(entity: str, fields: Optional[str]):
+    try:
+        validate_fields(entity, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def place(key: str, manager: Optional[str]) -> Manager:
+    try:
+        return await managers.place(key, manager)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def local_ref(manager: Manager, entity_id: Optional[str]) -> Optional[str]:
+    try:
+        return managers.local_ref(manager, entity_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def list_all(entity: str, fetch, fields: Optional[str] = None):
+    """Runs ``fetch(gmp)`` on every manager and merges the converted lists."""
+
+    async def load_one(manager: Manager):
+        async with manager.pool.session() as gmp:
+            response = await fetch(gmp)
+            return manager.globalize(convert_response(response, entity, fields))
+
+    results, errors = await managers.gather(load_one)
+    merged = merge_responses(entity, [response for _, response in results])
+    if errors:
+        merged["unavailable_managers"] = errors
+    return merged
+
+def complete_only(data, ttl: float) -> float:
+    # Lists missing an unreachable manager are not cached
+    return 0 if "unavailable_managers" in data else ttl
+
+async def cached_json(request: Request, key, load, ttl_for=None) -> Response:
+    """Serves ``load()`` through the response cache. Loads check gvmd's
+    status, so error responses raise instead of being cached."""
+    try:
+        entry = await response_cache.get_or_load(key, load, ttl_for)
+    except GvmResponseError as e:
+        # gvmd answers 404 for an unknown id
+        if e.status != "404":
+            raise
+        raise HTTPException(status_code=404, detail=f"{key[0].split('_')[0].capitalize()} {key[1]} not found")
+    headers = {"ETag": entry.etag}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+async def primed_stream(agen) -> AsyncIterator:
+    """Pulls the first item of ``agen`` before the response starts, so gvmd
+    errors still become a 500, and returns an iterator over all of it."""
+    try:
+        head = [await agen.__anext__()]
+    except StopAsyncIteration:
+        head = []
+
+    async def body():
+        for item in head:
+            yield item
+        async for item in agen:
+            yield item
+
+    return body()
 
 # ---------------------- TARGET ----------------------
 
 @app.post("/targets")
-def create_target(request: TargetRequest):
+async def create_target(
+    request: TargetRequest,
+    manager: Optional[str] = Query(None, pattern=MANAGER_NAME_PATTERN),
+):
+    owner = await place(",".join(sorted(request.hosts)), manager)
+    port_list_id = local_ref(owner, request.port_list_id)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.create_target(
+        async with owner.pool.session() as gmp:
+            root = await gmp.create_target(
                 name=request.name,
                 hosts=request.hosts,
-                port_list_id=request.port_list_id
+                port_list_id=port_list_id
             )
-            root = etree.fromstring(response)
             if root is None:
                 raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+            response_cache.invalidate("target", owner.global_id(root.get("id")))
+            return owner.globalize(element_to_dict(root))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/targets")
-def get_all_targets():
+async def get_all_targets(request: Request, fields: Optional[str] = None):
+    check_fields("target", fields)
+
+    async def load():
+        return await list_all("target", lambda gmp: gmp.get_targets(), fields)
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_targets()
-            root = etree.fromstring(response)
-            if root is None:
-                raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+        return await cached_json(request, ("target", LIST, fields), load, complete_only)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/targets/{target_id}")
-def get_target(target_id: str):
+async def get_target(request: Request, target_id: str, fields: Optional[str] = None):
+    check_fields("target", fields)
+    owner, local_id = managers.route(target_id)
+
+    async def load():
+        async with owner.pool.session() as gmp:
+            response = await gmp.get_target(local_id)
+            return owner.globalize(convert_response(checked_root(response), "target", fields))
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_target(target_id)
-            root = etree.fromstring(response) 
-            if root is None:
-                raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+        return await cached_json(request, ("target", target_id, fields), load)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.put("/targets/{target_id}")
-def update_target(target_id: str, request: TargetRequest):
+async def update_target(target_id: str, request: TargetRequest):
+    owner, local_id = managers.route(target_id)
+    port_list_id = local_ref(owner, request.port_list_id)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            gmp.modify_target(
-                target_id=target_id,
+        async with owner.pool.session() as gmp:
+            await gmp.modify_target(
+                target_id=local_id,
                 name=request.name,
                 hosts=request.hosts,
-                port_list_id=request.port_list_id
+                port_list_id=port_list_id
             )
+            response_cache.invalidate("target", target_id)
             return {"message": f"Target {target_id} updated"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.delete("/targets/{target_id}")
-def delete_target(target_id: str):
+async def delete_target(target_id: str):
+    owner, local_id = managers.route(target_id)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            gmp.delete_target(target_id)
+        async with owner.pool.session() as gmp:
+            await gmp.delete_target(local_id)
+            response_cache.invalidate("target", target_id)
             return {"message": f"Target {target_id} deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # ---------------------- SCHEDULE ----------------------
 
-@app.post("/schedules")
-def create_schedule(request: ScheduleRequest):
-    try:
-        # Create iCalendar structure
-        cal = Calendar()
-        cal.add('prodid', '-//OpenVOC Scheduler//')
-        cal.add('version', '2.0')
-
-        event = Event()
-        event.add('dtstamp', datetime.now(tz=pytz.UTC))
+def schedule_icalendar(request: ScheduleRequest) -> str:
+    return build_icalendar(request.time, request.period, request.until)
 
-        dtstart = datetime.strptime(request.time, "%Y%m%dT%H%M%SZ").replace(tzinfo=pytz.UTC)
-        event.add('dtstart', dtstart)
+def schedule_owner(request: ScheduleRequest, manager: Optional[str]) -> Manager:
+    """The manager a new schedule is created on.
 
-        # Build RRULE
-        rrule_dict = {"FREQ": request.period.split('=')[1]}
-        if request.until:
-            until_dt = datetime.strptime(request.until, "%Y%m%dT%H%M%SZ").replace(tzinfo=pytz.UTC)
-            rrule_dict["UNTIL"] = until_dt
-        event.add('rrule', rrule_dict)
+    A task can only use a schedule of its own manager, and tasks live with
+    their target, so the schedule goes to its target's manager.
+    """
+    owner = managers.get(manager) if manager else None
+    if request.target_id:
+        target_owner, _ = managers.route(request.target_id)
+        if owner is not None and owner is not target_owner:
+            raise ValueError(f"{request.target_id} belongs to manager '{target_owner.name}', not '{owner.name}'")
+        return target_owner
+    if owner is not None:
+        return owner
+    if len(managers) == 1:
+        return managers.default
+    raise ValueError("Pass target_id or manager to choose where the schedule is created")
 
-        cal.add_component(event)
-        ical = cal.to_ical().decode("utf-8")
+@app.post("/schedules")
+async def create_schedule(
+    request: ScheduleRequest,
+    manager: Optional[str] = Query(None, pattern=MANAGER_NAME_PATTERN),
+):
+    try:
+        owner = schedule_owner(request, manager)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        ical = schedule_icalendar(request)
 
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.create_schedule(
+        async with owner.pool.session() as gmp:
+            root = await gmp.create_schedule(
                 name=request.name,
                 icalendar=ical,
                 timezone=request.timezone or "UTC"
             )
-            root = etree.fromstring(response)
             if root is None:
                 raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+            response_cache.invalidate("schedule", owner.global_id(root.get("id")))
+            return owner.globalize(element_to_dict(root))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/schedules")
-def get_all_schedules():
+async def get_all_schedules(request: Request, fields: Optional[str] = None):
+    check_fields("schedule", fields)
+
+    async def load():
+        return await list_all("schedule", lambda gmp: gmp.get_schedules(), fields)
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_schedules()
-            root = etree.fromstring(response)
-            if root is None:
-                raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+        return await cached_json(request, ("schedule", LIST, fields), load, complete_only)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+SCHEDULE_FORECAST_FIELDS = {
+    "schedule": "id,name,icalendar,timezone",
+    "task": "id,name,schedule.id,target.id,average_duration",
+    "target": "id,max_hosts",
+}
+
+@app.get("/schedules/forecast")
+async def forecast_schedules(
+    start: datetime = Query(..., alias="from"),
+    end: datetime = Query(..., alias="to"),
+    bucket: int = Query(3600, ge=60),
+    duration: int = Query(3600, ge=0),
+):
+    """Expected scan load from [from, to): task starts, running tasks and
+    hosts being scanned per ``bucket`` seconds. Tasks without an average
+    duration are assumed to run ``duration`` seconds."""
+    start = start if start.tzinfo else start.replace(tzinfo=pytz.UTC)
+    end = end if end.tzinfo else end.replace(tzinfo=pytz.UTC)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if (end - start).total_seconds() / bucket > GVM_FORECAST_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"More than {GVM_FORECAST_MAX_BUCKETS} buckets")
+
+    async def load(manager: Manager):
+        async with manager.pool.session() as gmp:
+            schedules = [
+                manager.globalize(convert_entity(schedule, "schedule", SCHEDULE_FORECAST_FIELDS["schedule"]))
+                async for schedule in gmp.iter_elements("get_schedules", "schedule", filter_string="rows=-1")
+            ]
+            tasks = [
+                manager.globalize(convert_entity(task, "task", SCHEDULE_FORECAST_FIELDS["task"]))
+                async for task in gmp.iter_elements(
+                    "get_tasks", "task", filter_string="rows=-1", schedules_only=True
+                )
+            ]
+            targets = [
+                manager.globalize(convert_entity(target, "target", SCHEDULE_FORECAST_FIELDS["target"]))
+                async for target in gmp.iter_elements("get_targets", "target", filter_string="rows=-1")
+            ]
+        return schedules, tasks, targets
+
+    try:
+        results, errors = await managers.gather(load)
+        schedules, tasks, targets = ([item for _, loaded in results for item in loaded[i]] for i in range(3))
+        data = await asyncio.to_thread(forecast, schedules, tasks, targets, start, end, bucket, duration)
+    except ForecastTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if errors:
+        data["unavailable_managers"] = errors
+    return data
+
 @app.get("/schedules/{schedule_id}")
-def get_schedule(schedule_id: str):
+async def get_schedule(request: Request, schedule_id: str, fields: Optional[str] = None):
+    check_fields("schedule", fields)
+    owner, local_id = managers.route(schedule_id)
+
+    async def load():
+        async with owner.pool.session() as gmp:
+            response = await gmp.get_schedule(local_id)
+            return owner.globalize(convert_response(checked_root(response), "schedule", fields))
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_schedule(schedule_id)
-            root = etree.fromstring(response)
-            if root is None:
-                raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+        return await cached_json(request, ("schedule", schedule_id, fields), load)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.put("/schedules/{schedule_id}")
-def update_schedule(schedule_id: str, request: ScheduleRequest):
+async def update_schedule(schedule_id: str, request: ScheduleRequest):
+    owner, local_id = managers.route(schedule_id)
     try:
-        cal = Calendar()
-        cal.add('prodid', '-//OpenVOC Scheduler//')
-        cal.add('version', '2.0')
-
-        event = Event()
-        event.add('dtstamp', datetime.now(tz=pytz.UTC))
-
-        dtstart = datetime.strptime(request.time, "%Y%m%dT%H%M%SZ").replace(tzinfo=pytz.UTC)
-        event.add('dtstart', dtstart)
-
-        rrule_dict = {"FREQ": request.period.split('=')[1]}
-        if request.until:
-            until_dt = datetime.strptime(request.until, "%Y%m%dT%H%M%SZ").replace(tzinfo=pytz.UTC)
-            rrule_dict["UNTIL"] = until_dt
-        event.add('rrule', rrule_dict)
+        ical = schedule_icalendar(request)
 
-        cal.add_component(event)
-        ical = cal.to_ical().decode("utf-8")
-
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            gmp.modify_schedule(
-                schedule_id=schedule_id,
+        async with owner.pool.session() as gmp:
+            await gmp.modify_schedule(
+                schedule_id=local_id,
                 name=request.name,
                 icalendar=ical,
                 timezone=request.timezone or "UTC"
             )
+            response_cache.invalidate("schedule", schedule_id)
             return {"message": f"Schedule {schedule_id} updated"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.delete("/schedules/{schedule_id}")
-def delete_schedule(schedule_id: str):
+async def delete_schedule(schedule_id: str):
+    owner, local_id = managers.route(schedule_id)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            gmp.delete_schedule(schedule_id)
+        async with owner.pool.session() as gmp:
+            await gmp.delete_schedule(local_id)
+            response_cache.invalidate("schedule", schedule_id)
             return {"message": f"Schedule {schedule_id} deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 # ---------------------- TASK ----------------------
 
+def task_refs(owner: Manager, request: TaskRequest) -> dict:
+    """The ids referenced by ``request`` as known to ``owner``."""
+    return {
+        "config_id": local_ref(owner, request.config_id),
+        "target_id": local_ref(owner, request.target_id),
+        "schedule_id": local_ref(owner, request.schedule_id),
+        "scanner_id": local_ref(owner, request.scanner_id),
+    }
+
 @app.post("/tasks")
-def create_task(request: TaskRequest):
+async def create_task(request: TaskRequest):
+    # gvmd needs the target locally, so a task lives with its target
+    owner, _ = managers.route(request.target_id)
+    refs = task_refs(owner, request)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.create_task(
-                name=request.name,
-                config_id=request.config_id,
-                target_id=request.target_id,
-                schedule_id=request.schedule_id,
-                scanner_id=request.scanner_id
-            )
-            root = etree.fromstring(response)
+        async with owner.pool.session() as gmp:
+            root = await gmp.create_task(name=request.name, **refs)
             if root is None:
                 raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+            response_cache.invalidate("task", owner.global_id(root.get("id")))
+            return owner.globalize(element_to_dict(root))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/tasks")
-def get_all_tasks():
+async def get_all_tasks(request: Request, fields: Optional[str] = None):
+    check_fields("task", fields)
+
+    async def load():
+        return await list_all("task", lambda gmp: gmp.get_tasks(), fields)
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_tasks()
-            root = etree.fromstring(response)
-            if root is None:
-                raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+        return await cached_json(request, ("task", LIST, fields), load, complete_only)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/tasks/{task_id}")
-def get_task(task_id: str):
+async def get_task(request: Request, task_id: str, fields: Optional[str] = None):
+    check_fields("task", fields)
+    owner, local_id = managers.route(task_id)
+
+    async def load():
+        async with owner.pool.session() as gmp:
+            response = await gmp.get_task(local_id)
+            return owner.globalize(convert_response(checked_root(response), "task", fields))
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_task(task_id)
-            root = etree.fromstring(response)
-            if root is None:
-                raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+        return await cached_json(request, ("task", task_id, fields), load)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.put("/tasks/{task_id}")
-def update_task(task_id: str, request: TaskRequest):
+async def update_task(task_id: str, request: TaskRequest):
+    owner, local_id = managers.route(task_id)
+    refs = task_refs(owner, request)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            gmp.modify_task(
-                task_id=task_id,
-                name=request.name,
-                config_id=request.config_id,
-                target_id=request.target_id,
-                schedule_id=request.schedule_id,
-                scanner_id=request.scanner_id
-            )
+        async with owner.pool.session() as gmp:
+            await gmp.modify_task(task_id=local_id, name=request.name, **refs)
+            response_cache.invalidate("task", task_id)
             return {"message": f"Task {task_id} updated"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/tasks/{task_id}")
-def delete_task(task_id: str):
+async def delete_task(task_id: str):
+    owner, local_id = managers.route(task_id)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            gmp.delete_task(task_id)
-            return {"message": f"Task {task_id} deleted"}
+        async with owner.pool.session() as gmp:
+            await gmp.delete_task(local_id)
+            response_cache.invalidate("task", task_id)
+            report_index_cache.invalidate_task(task_id)
+            task_watcher.poke()
+        await admission_queue.discard(task_id)
+        return {"message": f"Task {task_id} deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def admit_task(task_id: str, priority: str, team: str):
+    """Starts the task through the admission queue."""
+    owner, local_id = managers.route(task_id)
+    async with owner.pool.session() as gmp:
+        response = await gmp.get_task(local_id)
+    try:
+        tasks = owner.globalize(convert_response(checked_root(response), "task", "scanner.id"))["task"]
+    except GvmResponseError as e:
+        # gvmd answers 404 for an unknown task id
+        if e.status != "404":
+            raise
+        tasks = []
+    if not tasks:
+        raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
+    scanner_id = (tasks[0]["scanner"] or {}).get("id")
+    return await admission_queue.submit(task_id, scanner_id, team, PRIORITIES[priority])
+
 @app.post("/tasks/{task_id}/start")
-def start_task(task_id: str):
+async def start_task(
+    task_id: str,
+    priority: str = Query("normal", pattern=PRIORITY_PATTERN),
+    team: str = Query("default", pattern=TEAM_PATTERN),
+):
+    """Starts the task, or queues it while the admission limits are reached
+    (202 with its queue position)."""
+    if admission_queue.enabled:
+        try:
+            admitted = await admit_task(task_id, priority, team)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if not admitted["started"]:
+            return JSONResponse(status_code=202, content={"message": f"Task {task_id} queued", **admitted})
+        return {"message": f"Task {task_id} started", **admitted}
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            gmp.start_task(task_id)
-            return {"message": f"Task {task_id} started"}
+        started = await start_task_now(task_id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"message": f"Task {task_id} started", **started}
     
+# ---------------------- BATCH ----------------------
+
+def checked_root(root):
+    check_command_status(root)
+    return root
+
+def check_batch_size(items: list):
+    if len(items) > GVM_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(items)} items exceeds the limit of {GVM_BATCH_MAX_ITEMS}",
+        )
+
+@app.post("/targets:batch")
+async def create_targets_batch(
+    requests: list[TargetRequest],
+    manager: Optional[str] = Query(None, pattern=MANAGER_NAME_PATTERN),
+):
+    check_batch_size(requests)
+
+    async def create(request: TargetRequest):
+        owner = await place(",".join(sorted(request.hosts)), manager)
+        port_list_id = local_ref(owner, request.port_list_id)
+        async with owner.pool.session() as gmp:
+            response = await gmp.create_target(
+                name=request.name,
+                hosts=request.hosts,
+                port_list_id=port_list_id
+            )
+            target_id = owner.global_id(checked_root(response).get("id"))
+            response_cache.invalidate("target", target_id)
+            return {"id": target_id}
+
+    return await run_batch(requests, create, GVM_BATCH_CONCURRENCY)
+
+@app.post("/schedules:batch")
+async def create_schedules_batch(
+    requests: list[ScheduleRequest],
+    manager: Optional[str] = Query(None, pattern=MANAGER_NAME_PATTERN),
+):
+    check_batch_size(requests)
+
+    async def create(request: ScheduleRequest):
+        ical = schedule_icalendar(request)
+        try:
+            owner = schedule_owner(request, manager)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        async with owner.pool.session() as gmp:
+            response = await gmp.create_schedule(
+                name=request.name,
+                icalendar=ical,
+                timezone=request.timezone or "UTC"
+            )
+            schedule_id = owner.global_id(checked_root(response).get("id"))
+            response_cache.invalidate("schedule", schedule_id)
+            return {"id": schedule_id}
+
+    return await run_batch(requests, create, GVM_BATCH_CONCURRENCY)
+
+@app.post("/tasks:batch")
+async def create_tasks_batch(requests: list[TaskRequest]):
+    check_batch_size(requests)
+
+    async def create(request: TaskRequest):
+        owner, _ = managers.route(request.target_id)
+        refs = task_refs(owner, request)
+        async with owner.pool.session() as gmp:
+            response = await gmp.create_task(name=request.name, **refs)
+            task_id = owner.global_id(checked_root(response).get("id"))
+            response_cache.invalidate("task", task_id)
+            return {"id": task_id}
+
+    return await run_batch(requests, create, GVM_BATCH_CONCURRENCY)
+
+@app.post("/tasks:start-batch")
+async def start_tasks_batch(
+    task_ids: list[str],
+    priority: str = Query("normal", pattern=PRIORITY_PATTERN),
+    team: str = Query("default", pattern=TEAM_PATTERN),
+):
+    check_batch_size(task_ids)
+
+    async def start(task_id: str):
+        if admission_queue.enabled:
+            return {"id": task_id, **await admit_task(task_id, priority, team)}
+        return {"id": task_id, **await start_task_now(task_id)}
+
+    return await run_batch(task_ids, start, GVM_BATCH_CONCURRENCY)
+
+# ---------------------- QUEUE ----------------------
+
+@app.get("/queue")
+def get_queue():
+    """Queued task starts in expected start order, with wait times and
+    throughput."""
+    return {"queue": admission_queue.queued(), "stats": admission_queue.stats()}
+
+@app.get("/queue/{task_id}")
+def get_queue_entry(task_id: str):
+    entry = admission_queue.position(task_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Task {task_id} is not queued")
+    return entry
+
+@app.delete("/queue/{task_id}")
+async def remove_queue_entry(task_id: str):
+    if not await admission_queue.discard(task_id):
+        raise HTTPException(status_code=404, detail=f"Task {task_id} is not queued")
+    return {"message": f"Task {task_id} removed from the queue"}
+
+# ---------------------- WATCH ----------------------
+
+@app.get("/tasks:watch")
+async def watch_tasks_sse():
+    """Server-Sent Events: a "snapshot" event with every task, then
+    "changes" events with the tasks whose status or progress changed."""
+
+    async def events():
+        async with task_watcher.subscribe() as subscription:
+            while True:
+                event = await subscription.get(GVM_WATCH_KEEPALIVE)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/tasks:watch")
+async def watch_tasks_ws(websocket: WebSocket):
+    """Same events as the SSE stream, one JSON message each."""
+    await websocket.accept()
+    async with task_watcher.subscribe() as subscription:
+
+        async def send_events():
+            while True:
+                await websocket.send_json(await subscription.get())
+
+        sender = asyncio.create_task(send_events())
+        try:
+            # Incoming messages are ignored; receiving notices the disconnect
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+
+# ---------------------- SYNC ----------------------
+
+@app.post("/tasks/{task_id}/results:sync")
+async def sync_task_results(task_id: str = Path(..., pattern=FILTER_VALUE_PATTERN)):
+    try:
+        return await result_sync.sync_task(task_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/results:sync")
+async def sync_all_results():
+    async def list_task_ids(manager: Manager):
+        async with manager.pool.session() as gmp:
+            return [
+                manager.global_id(task.get("id"))
+                async for task in gmp.iter_elements("get_tasks", "task", filter_string="rows=-1")
+            ]
+
+    try:
+        results, errors = await managers.gather(list_task_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    task_ids = [task_id for _, ids in results for task_id in ids]
+    synced = await run_batch(task_ids, result_sync.sync_task, GVM_BATCH_CONCURRENCY)
+    if errors:
+        synced["unavailable_managers"] = errors
+    return synced
+
+@app.get("/results/changes")
+async def get_result_changes(
+    since: int = Query(0, ge=0),
+    task_id: Optional[str] = Query(None, pattern=FILTER_VALUE_PATTERN),
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """Synced results changed after cursor ``since``; pass the returned
+    ``next`` as ``since`` to continue."""
+    try:
+        rows = await asyncio.to_thread(result_sync.store.changes, since, task_id, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "results": rows,
+        "next": rows[-1]["seq"] if rows else since,
+        "more": len(rows) == limit,
+    }
+
 #------------------- results ----------------------------------
 
+async def stream_results(owner: Manager, task_id: str, filter_string: Optional[str], fields: Optional[str]):
+    async with owner.pool.session() as gmp:
+        async for result in gmp.iter_elements(
+            "get_results", "result", task_id=task_id, filter_string=filter_string
+        ):
+            yield json.dumps(owner.globalize(convert_entity(result, "result", fields))) + "\n"
+
 @app.get("/tasks/{task_id}/results")
-def get_results_for_task(task_id: str):
+async def get_results_for_task(
+    task_id: str = Path(..., pattern=FILTER_VALUE_PATTERN),
+    first: Optional[int] = Query(None, ge=1),
+    rows: Optional[int] = Query(None, ge=-1),
+    min_severity: Optional[float] = Query(None, ge=0, le=10),
+    host: Optional[str] = Query(None, pattern=FILTER_VALUE_PATTERN),
+    sort: Optional[str] = Query(None, pattern=SORT_PATTERN),
+    stream: bool = False,
+    fields: Optional[str] = None,
+):
+    check_fields("result", fields)
+    owner, task_id = managers.route(task_id)
+    # Without an explicit page size a stream returns every result
+    if stream and rows is None:
+        rows = -1
+    filter_string = build_results_filter(
+        first=first,
+        rows=rows,
+        min_severity=min_severity,
+        host=host,
+        sort=sort,
+        terms=[f"task_id={task_id}"],
+    )
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_results(task_id=task_id)
-            root = etree.fromstring(response)
+        if stream:
+            lines = await primed_stream(stream_results(owner, task_id, filter_string, fields))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+
+        async with owner.pool.session() as gmp:
+            root = await gmp.get_results(task_id=task_id, filter_string=filter_string)
             if root is None:
                 raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+            return owner.globalize(convert_response(root, "result", fields))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+async def export_results(owner: Manager, filter_string: str, writer: ResultExportWriter, **kwargs):
+    builder = ResultBatchBuilder(owner.global_id)
+    async with owner.pool.session() as gmp:
+        async for result in gmp.iter_elements("get_results", "result", filter_string=filter_string, **kwargs):
+            builder.append(result)
+            if len(builder) >= GVM_EXPORT_BATCH_ROWS:
+                # Building the batch runs in the worker too, and pyarrow
+                # releases the GIL while encoding and compressing
+                yield await asyncio.to_thread(lambda: writer.write(builder.flush()))
+    yield await asyncio.to_thread(lambda: writer.close(builder.flush()))
+
+async def export_response(chunks, export_format: str, name: str):
+    media_type, extension = EXPORT_FORMATS[export_format]
+    try:
+        body = await primed_stream(chunks)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
+
+@app.get("/tasks/{task_id}/results:export")
+async def export_task_results(
+    task_id: str = Path(..., pattern=FILTER_VALUE_PATTERN),
+    format: str = Query("arrow", pattern=EXPORT_FORMAT_PATTERN),
+    compression: Optional[str] = Query(None, pattern=COMPRESSION_PATTERN),
+    min_severity: Optional[float] = Query(None, ge=0, le=10),
+    host: Optional[str] = Query(None, pattern=FILTER_VALUE_PATTERN),
+):
+    """Every result of the task as an Arrow IPC stream or a Parquet file,
+    with typed and dictionary-encoded columns (see gmp_export)."""
+    owner, local_id = managers.route(task_id)
+    filter_string = build_results_filter(
+        rows=-1, min_severity=min_severity, host=host, terms=[f"task_id={local_id}"]
+    )
+    writer = ResultExportWriter(format, compression)
+    chunks = export_results(owner, filter_string, writer, task_id=local_id)
+    return await export_response(chunks, format, f"results-{task_id}")
+
+@app.get("/reports/{report_id}/results:export")
+async def export_report_results(
+    report_id: str = Path(..., pattern=REPORT_ID_PATTERN),
+    format: str = Query("arrow", pattern=EXPORT_FORMAT_PATTERN),
+    compression: Optional[str] = Query(None, pattern=COMPRESSION_PATTERN),
+    min_severity: Optional[float] = Query(None, ge=0, le=10),
+    host: Optional[str] = Query(None, pattern=FILTER_VALUE_PATTERN),
+):
+    """Every result of the report, like the task export."""
+    owner, local_id = managers.route(report_id)
+    filter_string = build_results_filter(
+        rows=-1, min_severity=min_severity, host=host, terms=[f"report_id={local_id}"]
+    )
+    writer = ResultExportWriter(format, compression)
+    chunks = export_results(owner, filter_string, writer)
+    return await export_response(chunks, format, f"results-{report_id}")
+
 @app.get("/results/{result_id}")
-def get_result_detail(result_id: str):
+async def get_result_detail(result_id: str, fields: Optional[str] = None):
+    check_fields("result", fields)
+    owner, local_id = managers.route(result_id)
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_result(result_id)
-            root = etree.fromstring(response)
+        async with owner.pool.session() as gmp:
+            root = await gmp.get_result(local_id)
             if root is None:
                 raise HTTPException(status_code=404, detail="Target not found")
-            return element_to_dict(root)
+            return owner.globalize(convert_response(root, "result", fields))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+async def stream_report(report_id: str, report_format_id: str, decoder: ReportDecoder):
+    owner, local_id = managers.route(report_id)
+    async with owner.pool.session() as gmp:
+        # Without ignore_pagination gvmd only renders the first page of results
+        async for chunk in gmp.iter_raw(
+            "get_report",
+            report_id=local_id,
+            report_format_id=report_format_id,
+            ignore_pagination=True,
+            details=True,
+        ):
+            body = decoder.feed(chunk)
+            if body:
+                yield body
+        body = decoder.finish()
+        if body:
+            yield body
+
+async def report_is_done(report_id: str) -> bool:
+    # The report of a running scan still grows, so it is not spooled
+    owner, local_id = managers.route(report_id)
+    async with owner.pool.session() as gmp:
+        response = await gmp.get_report(local_id, details=False)
+    reports = convert_response(checked_root(response), "report", "report.scan_run_status")["report"]
+    return bool(reports) and (reports[0]["report"] or {}).get("scan_run_status") == "Done"
+
 @app.get("/reports/{report_id}")
-def get_report(report_id: str, format: Optional[str] = "xml"):
+async def get_report(
+    report_id: str = Path(..., pattern=REPORT_ID_PATTERN),
+    format: Optional[str] = "xml",
+    refresh: bool = False,
+):
+    report_format = format.lower()
+    report_format_id = GVM_REPORT_FORMATS.get(report_format)
+    if report_format_id is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown report format '{format}', expected one of: {', '.join(sorted(GVM_REPORT_FORMATS))}",
+        )
+
+    if report_spool and not refresh:
+        path = report_spool.lookup(report_id, report_format)
+        if path:
+            # Served with sendfile where the server supports it
+            extension = path.rsplit(".", 1)[1]
+            return FileResponse(path, filename=f"report-{report_id}.{extension}")
+
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            report_format_id = {
-                "pdf": "c402cc3e-b531-11e1-9163-406186ea4fc5",
-                "xml": "a994b278-1f62-11e1-96ac-406186ea4fc5"
-            }.get(format.lower(), "c402cc3e-b531-11e1-9163-406186ea4fc5")
+        decoder = ReportDecoder()
+        chunks = stream_report(report_id, report_format_id, decoder)
+        if report_spool and await report_is_done(report_id):
+            chunks = report_spool.tee(chunks, report_id, report_format, decoder)
+        # The decoder knows the content type once the first chunk is in
+        body = await primed_stream(chunks)
+        return StreamingResponse(
+            body,
+            media_type=decoder.content_type,
+            headers={"Content-Disposition": f'attachment; filename="report-{report_id}.{decoder.extension}"'},
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ---------------------- SUMMARY ----------------------
+
+async def load_report_summary(global_id: str, breakdown: bool, top: int):
+    owner, report_id = managers.route(global_id)
+    async with owner.pool.session() as gmp:
+        response = await gmp.get_report(report_id, filter_string=SUMMARY_FILTER, details=False)
+        report = convert_response(checked_root(response), "report", REPORT_COUNT_FIELDS)["report"][0]
+        counts = report["report"] or {}
+        summary = {
+            "report_id": global_id,
+            "task_id": owner.global_id((report["task"] or {}).get("id")),
+            "scan_run_status": counts.get("scan_run_status"),
+        }
+
+        if not breakdown:
+            # gvmd already counts results per level; only critical needs a query
+            response = await gmp.get_results(filter_string=build_results_filter(
+                first=1,
+                rows=1,
+                min_severity=CRITICAL,
+                terms=[f"report_id={report_id}", SUMMARY_FILTER],
+            ))
+            critical = convert_response(checked_root(response), "result", "id")["result_count"]["filtered"]
+            result_count = counts.get("result_count") or {}
+            summary["total"] = result_count.get("filtered")
+            summary["by_severity"] = classes_from_result_count(result_count, critical or 0)
+            return summary
+
+        columns = ResultColumns()
+        async for result in gmp.iter_elements(
+            "get_results",
+            "result",
+            filter_string=build_results_filter(rows=-1, terms=[f"report_id={report_id}", SUMMARY_FILTER]),
+        ):
+            columns.append(convert_entity(result, "result", RESULT_FIELDS))
+
+    summary.update(summarize(columns, top))
+    return summary
+
+def summary_ttl(summary, ttl: float) -> float:
+    if summary["scan_run_status"] in FINISHED_STATUSES:
+        return ttl
+    return min(ttl, GVM_CACHE_TTLS["task"])
+
+@app.get("/reports/{report_id}/summary")
+async def get_report_summary(
+    request: Request,
+    report_id: str = Path(..., pattern=REPORT_ID_PATTERN),
+    breakdown: bool = True,
+    top: int = Query(10, ge=1, le=100),
+):
+    """Severity classes and histogram, counts by host, port and NVT family
+    and the most frequent NVTs. ``breakdown=false`` returns only the
+    severity classes, counted by gvmd."""
+    try:
+        return await cached_json(
+            request,
+            ("report_summary", report_id, breakdown, top),
+            lambda: load_report_summary(report_id, breakdown, top),
+            summary_ttl,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/tasks/{task_id}/summary")
+async def get_task_summary(
+    request: Request,
+    task_id: str = Path(..., pattern=FILTER_VALUE_PATTERN),
+    breakdown: bool = True,
+    top: int = Query(10, ge=1, le=100),
+):
+    """Summary of the task's running report, or else its last one."""
+    owner, local_id = managers.route(task_id)
+    try:
+        async with owner.pool.session() as gmp:
+            response = await gmp.get_task(local_id)
+        tasks = owner.globalize(convert_response(
+            checked_root(response), "task", "current_report.report.id,last_report.report.id"
+        ))["task"]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    report_id = None
+    if tasks:
+        for ref in (tasks[0]["current_report"], tasks[0]["last_report"]):
+            if ref and ref["report"] and ref["report"]["id"]:
+                report_id = ref["report"]["id"]
+                break
+    if report_id is None:
+        raise HTTPException(status_code=404, detail=f"Task {task_id} has no report")
+    return await get_report_summary(request, report_id, breakdown, top)
+
+# ---------------------- DIFF ----------------------
 
-            response = gmp.get_report(report_id=report_id, report_format_id=report_format_id, details=True)
-            return {"report": response}
+async def load_report_index(owner: Manager, global_id: str, report_id: str):
+    async with owner.pool.session() as gmp:
+        response = await gmp.get_report(report_id, filter_string=SUMMARY_FILTER, details=False)
+        report = convert_response(checked_root(response), "report", REPORT_COUNT_FIELDS)["report"][0]
+        builder = ReportIndexBuilder(
+            global_id,
+            owner.global_id((report["task"] or {}).get("id")),
+            (report["report"] or {}).get("scan_run_status"),
+            owner.global_id,
+        )
+        async for result in gmp.iter_elements(
+            "get_results",
+            "result",
+            filter_string=build_results_filter(rows=-1, terms=[f"report_id={report_id}", SUMMARY_FILTER]),
+        ):
+            builder.append(convert_entity(result, "result", INDEX_FIELDS))
+    return await asyncio.to_thread(builder.build)
+
+def index_ttl(index, ttl: float) -> float:
+    if index.scan_run_status in FINISHED_STATUSES:
+        return ttl
+    return min(ttl, GVM_CACHE_TTLS["task"])
+
+async def task_report_index(owner: Manager, task_id: str, report_id: str):
+    if managers.route(report_id)[0] is not owner:
+        raise HTTPException(status_code=400, detail=f"Report {report_id} does not belong to task {task_id}")
+    local_id = local_ref(owner, report_id)
+    try:
+        index = await report_index_cache.get_or_load(
+            report_id, lambda: load_report_index(owner, report_id, local_id), index_ttl
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if index.task_id != task_id:
+        raise HTTPException(status_code=400, detail=f"Report {report_id} does not belong to task {task_id}")
+    return index
+
+@app.get("/tasks/{task_id}/diff")
+async def diff_task_reports(
+    task_id: str = Path(..., pattern=FILTER_VALUE_PATTERN),
+    base_report: str = Query(..., pattern=REPORT_ID_PATTERN),
+    compare_report: str = Query(..., pattern=REPORT_ID_PATTERN),
+    changes: str = Query(",".join(CHANGES), pattern=CHANGES_PATTERN),
+):
+    """Findings that are new in ``compare_report``, resolved since
+    ``base_report`` or changed severity, as NDJSON with the most severe
+    first. Findings are matched by host, port and NVT OID (see gmp_diff);
+    the counts of each kind are in the X-Diff-* headers."""
+    owner, _ = managers.route(task_id)
+    base = await task_report_index(owner, task_id, base_report)
+    compare = await task_report_index(owner, task_id, compare_report)
+    diff = ReportDiff(base, compare)
+    selected = changes.split(",")
+
+    def body():
+        for finding in diff.findings(selected):
+            yield json.dumps(finding) + "\n"
+
+    headers = {f"X-Diff-{change.capitalize()}": str(count) for change, count in diff.counts().items()}
+    return StreamingResponse(body(), media_type="application/x-ndjson", headers=headers)
 
 #----------------------- other ---------------------------------
 
 @app.get("/port-lists")
-def get_all_port_lists():
-    try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_port_lists()
-            root = etree.fromstring(response)
-            port_lists = [
+async def get_all_port_lists(request: Request):
+    async def load(manager: Manager):
+        async with manager.pool.session() as gmp:
+            root = await gmp.get_port_lists()
+            return [
                 {
-                    "id": pl.get("id"),
+                    "id": manager.global_id(pl.get("id")),
                     "name": pl.findtext("name")
                 }
                 for pl in root.findall("port_list")
             ]
-            return {"port_lists": port_lists}
+
+    async def load_all():
+        results, errors = await managers.gather(load)
+        port_lists = {"port_lists": [item for _, items in results for item in items]}
+        if errors:
+            port_lists["unavailable_managers"] = errors
+        return port_lists
+
+    try:
+        return await cached_json(request, ("port_list", LIST), load_all, complete_only)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/scan-configs")
-def get_all_scan_configs():
-    try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_scan_configs()
-            root = etree.fromstring(response)
-            configs = [
+async def get_all_scan_configs(request: Request):
+    async def load(manager: Manager):
+        async with manager.pool.session() as gmp:
+            root = await gmp.get_scan_configs()
+            return [
                 {
-                    "id": config.get("id"),
+                    "id": manager.global_id(config.get("id")),
                     "name": config.findtext("name")
                 }
                 for config in root.findall("config")
             ]
-            return {"scan_configs": configs}
+
+    async def load_all():
+        results, errors = await managers.gather(load)
+        scan_configs = {"scan_configs": [item for _, items in results for item in items]}
+        if errors:
+            scan_configs["unavailable_managers"] = errors
+        return scan_configs
+
+    try:
+        return await cached_json(request, ("scan_config", LIST), load_all, complete_only)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/scanners")
-def get_all_scanners():
-    try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            response = gmp.get_scanners()
-            root = etree.fromstring(response)
-            scanners = [
+async def get_all_scanners(request: Request):
+    async def load(manager: Manager):
+        async with manager.pool.session() as gmp:
+            root = await gmp.get_scanners()
+            return [
                 {
-                    "id": scanner.get("id"),
+                    "id": manager.global_id(scanner.get("id")),
                     "name": scanner.findtext("name")
                 }
                 for scanner in root.findall("scanner")
             ]
-            return {"scanners": scanners}
+
+    async def load_all():
+        results, errors = await managers.gather(load)
+        scanners = {"scanners": [item for _, items in results for item in items]}
+        if errors:
+            scanners["unavailable_managers"] = errors
+        return scanners
+
+    try:
+        return await cached_json(request, ("scanner", LIST), load_all, complete_only)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-     
+    
 @app.get("/debug")
-def debug_connection():
+async def debug_connection():
     try:
-        with connect_to_gvm() as gmp:
-            gmp.authenticate(gvmUsername, gvmPassword)
-            version_info = gmp.get_version()
+        async with async_gmp_pool.session() as gmp:
+            version_info = element_to_dict(checked_root(await gmp.get_version()))
+            connection = {"socket": GVM_SOCKET} if GVM_SOCKET else {"host": GVM_HOST, "port": GVM_PORT}
             return {
-                "host": GVM_HOST,
-                "port": GVM_PORT,
+                **connection,
                 "user": gvmUsername,
                 "version": version_info
             }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/debug/cache")
+def debug_cache():
+    return response_cache.stats()
+
+@app.get("/debug/watch")
+def debug_watch():
+    return task_watcher.stats()
+
+@app.get("/debug/pool")
+def debug_pool():
+    return async_gmp_pool.stats()
+
+@app.get("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/diff")
+def debug_diff():
+    return report_index_cache.stats()
+
+@app.get("/debug/profiles")
+def debug_profiles():
+    return {"sample_rate": GVM_PROFILE_SAMPLE_RATE, "profiles": list(request_profiles)}
+
+@app.get("/debug/managers")
+def debug_managers():
+    return managers.stats()
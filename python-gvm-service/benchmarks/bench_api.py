@@ -0,0 +1,306 @@
+"""Load test of the API against the GMP simulator.
+
+For every result set size a simulator and a uvicorn server running app.py
+are started, and each scenario is driven at every concurrency level for
+``--duration`` seconds. Latency percentiles, requests per second and the
+server's peak RSS are written as JSON; ``--compare`` prints the change
+between two such files.
+
+    python benchmarks/bench_api.py --sizes 10,1000,100000 --concurrency 1,8,32 --output run.json
+    python benchmarks/bench_api.py --compare baseline.json run.json
+
+Responses are not cached unless ``--cache`` is given, so every request
+reaches the simulator. Peak RSS is reset before each run where the kernel
+allows it (/proc/<pid>/clear_refs) and is cumulative otherwise; memory the
+process kept from earlier runs counts towards it, which ``rss_start_mb``
+shows. The load generator, simulator and API share the machine, so pin
+them to separate CPUs (taskset) for numbers that compare well. Runs with
+a million results take minutes each.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from gmp_simulator import report_id, task_id
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gmp_simulator.py")
+
+TASK = task_id(0)
+REPORT = report_id(0)
+
+# name -> (path, largest result set it runs against or None)
+SCENARIOS = {
+    "tasks": ("/tasks", None),
+    "task": (f"/tasks/{TASK}", None),
+    "results_page": (f"/tasks/{TASK}/results?rows=100", None),
+    "results_all": (f"/tasks/{TASK}/results?rows=-1", 100_000),
+    "results_stream": (f"/tasks/{TASK}/results?stream=true", None),
+    "report_summary": (f"/reports/{REPORT}/summary", None),
+    "report_xml": (f"/reports/{REPORT}?format=xml", None),
+}
+DEFAULT_SCENARIOS = "tasks,task,results_page,results_all,results_stream,report_summary"
+CACHED_ENTITIES = ("PORT_LIST", "SCAN_CONFIG", "SCANNER", "TARGET", "SCHEDULE", "TASK", "REPORT_SUMMARY")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(ordered: List[float], share: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def read_status(pid: int, field: str) -> Optional[int]:
+    """A /proc/<pid>/status memory field in bytes, None where there is no
+    /proc."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Servers:
+    """A simulator with ``size`` results per task and the API in front of it."""
+
+    def __init__(self, size: int, args, directory: str):
+        self.size = size
+        self.args = args
+        self.socket = os.path.join(directory, f"gmp-{size}.sock")
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            "GVM_SOCKET": self.socket,
+            "GVM_POOL_SIZE": str(args.pool_size),
+            "GVM_RESULT_STORE": f"sqlite://{os.path.join(directory, f'results-{size}.db')}",
+            "GVM_ADMISSION_DB": os.path.join(directory, f"admission-{size}.db"),
+        }
+        if not args.cache:
+            self.env.update({f"GVM_CACHE_TTL_{entity}": "0" for entity in CACHED_ENTITIES})
+        self.simulator: Optional[subprocess.Popen] = None
+        self.api: Optional[subprocess.Popen] = None
+
+    def __enter__(self):
+        command = [sys.executable, SIMULATOR, "--socket", self.socket, "--results", str(self.size)]
+        for latency in self.args.latency or ():
+            command += ["--latency", latency]
+        self.simulator = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        # Printed once the socket accepts connections
+        self.simulator.stdout.readline()
+        self.api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=SERVICE_DIR,
+            env=self.env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(self.url + "/metrics", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            if self.api.poll() is not None:
+                break
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("The API did not start")
+
+    def __exit__(self, *exc):
+        for process in (self.api, self.simulator):
+            if process is not None and process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+async def drive(url: str, path: str, concurrency: int, duration: float) -> Dict[str, Any]:
+    """Requests ``path`` from ``concurrency`` workers until ``duration``
+    is up. Every worker sends at least one request, and requests in flight
+    are allowed to finish."""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    received = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=None) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+
+        async def worker():
+            nonlocal received
+            while True:
+                sent = time.perf_counter()
+                try:
+                    async with client.stream("GET", path) as response:
+                        async for chunk in response.aiter_raw():
+                            received += len(chunk)
+                    status = response.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - sent)
+                if status != 200:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+                if time.perf_counter() >= deadline:
+                    break
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(ordered) / elapsed, 2),
+        "bytes_per_request": int(received / len(ordered)) if ordered else 0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p90": round(percentile(ordered, 0.90) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        },
+    }
+
+
+def run(args) -> Dict[str, Any]:
+    sizes = [int(size) for size in args.sizes.split(",")]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    scenarios = args.scenarios.split(",")
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}; known: {', '.join(SCENARIOS)}")
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            with Servers(size, args, directory) as servers:
+                pid = servers.api.pid
+                # Opens the GMP sessions the runs will use
+                asyncio.run(drive(servers.url, "/tasks", max(levels), 0))
+                for name in scenarios:
+                    path, max_size = SCENARIOS[name]
+                    for level in levels:
+                        entry = {"size": size, "scenario": name, "path": path, "concurrency": level}
+                        if max_size is not None and size > max_size:
+                            entry["skipped"] = f"only runs up to {max_size} results"
+                            report["runs"].append(entry)
+                            continue
+                        exact = reset_peak_rss(pid)
+                        start = read_status(pid, "VmRSS")
+                        entry["rss_start_mb"] = round(start / 2**20, 1) if start else None
+                        entry.update(asyncio.run(drive(servers.url, path, level, args.duration)))
+                        peak = read_status(pid, "VmHWM")
+                        entry["rss_peak_mb"] = round(peak / 2**20, 1) if peak else None
+                        entry["rss_peak_cumulative"] = not exact
+                        report["runs"].append(entry)
+                        print(format_run(entry), flush=True)
+    return report
+
+
+def format_run(entry: Dict[str, Any]) -> str:
+    latency = entry["latency_ms"]
+    errors = sum(entry["errors"].values())
+    return (
+        f"{entry['size']:>9} {entry['scenario']:<16} c={entry['concurrency']:<4}"
+        f" {entry['rps']:>9.1f} req/s  p50 {latency['p50']:>9.1f} ms  p99 {latency['p99']:>9.1f} ms"
+        f"  rss {entry['rss_peak_mb'] or 0:>7.1f} MB" + (f"  {errors} errors" if errors else "")
+    )
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def key(entry):
+        return entry["size"], entry["scenario"], entry["concurrency"]
+
+    baseline = {key(entry): entry for entry in before["runs"] if "skipped" not in entry}
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    for entry in after["runs"]:
+        old = baseline.get(key(entry))
+        if old is None or "skipped" in entry:
+            continue
+        changes = []
+        for label, get in (
+            ("rps", lambda run: run["rps"]),
+            ("p50", lambda run: run["latency_ms"]["p50"]),
+            ("p99", lambda run: run["latency_ms"]["p99"]),
+            ("rss", lambda run: run["rss_peak_mb"]),
+        ):
+            if get(old) and get(entry) is not None:
+                changes.append(f"{label} {(get(entry) / get(old) - 1) * 100:+6.1f}%")
+        print(f"{entry['size']:>9} {entry['scenario']:<16} c={entry['concurrency']:<4} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,1000,100000,1000000", help="results per task, comma separated")
+    parser.add_argument("--concurrency", default="1,8,32", help="concurrent clients, comma separated")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help=f"any of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario and concurrency")
+    parser.add_argument("--pool-size", type=int, default=8, help="GVM_POOL_SIZE of the API")
+    parser.add_argument("--latency", action="append", metavar="[COMMAND=]SECONDS", help="passed to the simulator")
+    parser.add_argument("--cache", action="store_true", help="keep the API's response cache enabled")
+    parser.add_argument("--output", default="bench_api.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compares element_to_dict with the schema converter on a synthetic
+get_results payload.
+
+    python benchmarks/bench_convert.py --results 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gmp_convert import ALL_FIELDS, convert_response, element_to_dict  # noqa: E402
+
+RESULT_XML = (
+    '<result id="{i:08d}-0000-4000-8000-000000000000">'
+    "<name>NVT check {nvt}</name>"
+    "<owner><name>admin</name></owner>"
+    "<modification_time>2024-05-01T10:00:00Z</modification_time>"
+    "<comment></comment>"
+    "<creation_time>2024-05-01T10:00:00Z</creation_time>"
+    "<host>10.{a}.{b}.{c}<asset asset_id=\"{i:08d}-asset\"/><hostname>host-{i}</hostname></host>"
+    "<port>{port}/tcp</port>"
+    '<nvt oid="1.3.6.1.4.1.25623.1.0.{nvt}">'
+    "<type>nvt</type><name>NVT check {nvt}</name><family>Family {family}</family>"
+    "<cvss_base>{severity}</cvss_base>"
+    '<severities score="{severity}"><severity type="cvss_base_v3"><origin/><date>2020-01-01T00:00:00Z</date>'
+    "<score>{severity}</score><value>CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H</value></severity></severities>"
+    "<tags>cvss_base_vector=AV:N/AC:L/Au:N/C:P/I:P/A:P|summary=Synthetic finding|insight=None|affected=All|impact=High|solution_type=VendorFix</tags>"
+    '<solution type="VendorFix">Update to the latest version.</solution>'
+    '<refs><ref type="cve" id="CVE-2024-{nvt:04d}"/><ref type="url" id="https://example.com/{nvt}"/></refs>'
+    "</nvt>"
+    "<scan_nvt_version>2024-04-01T00:00:00Z</scan_nvt_version>"
+    "<threat>High</threat><severity>{severity}</severity>"
+    "<qod><value>80</value><type>remote_banner</type></qod>"
+    "<description>Installed version: 1.{nvt}\nFixed version: 2.0\nInstallation path / port: /usr/lib</description>"
+    "<original_threat>High</original_threat><original_severity>{severity}</original_severity>"
+    '<detection><result id="{i:08d}-det"><details>'
+    "<detail><name>product</name><value>cpe:/a:vendor:product:1.{nvt}</value></detail>"
+    "<detail><name>location</name><value>/usr/lib</value></detail>"
+    "</details></result></detection>"
+    "</result>"
+)
+
+
+def build_payload(count: int) -> bytes:
+    parts = ['<get_results_response status="200" status_text="OK">']
+    for i in range(count):
+        parts.append(
+            RESULT_XML.format(
+                i=i,
+                a=(i >> 16) & 255,
+                b=(i >> 8) & 255,
+                c=i & 255,
+                port=i % 1024,
+                nvt=i % 5000,
+                family=i % 60,
+                severity=f"{(i % 101) / 10:.1f}",
+            )
+        )
+    parts.append(
+        f'<filters id=""><term>rows=-1</term></filters><results start="1" max="{count}"/>'
+        f"<result_count>{count}<filtered>{count}</filtered><page>{count}</page></result_count>"
+        "</get_results_response>"
+    )
+    return "".join(parts).encode()
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--results", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fields", default="id,host,port,severity,qod.value,nvt.oid")
+    args = parser.parse_args()
+
+    payload = build_payload(args.results)
+    root = etree.fromstring(payload, parser=etree.XMLParser(huge_tree=True))
+
+    cases = [
+        ("element_to_dict", lambda: element_to_dict(root)),
+        (f"convert_response fields={ALL_FIELDS}", lambda: convert_response(root, "result", ALL_FIELDS)),
+        (f"convert_response fields={args.fields}", lambda: convert_response(root, "result", args.fields)),
+    ]
+    print(f"{args.results} results, {len(payload) / 1e6:.1f} MB of XML, best of {args.repeat}")
+    baseline = None
+    for name, fn in cases:
+        seconds = timed(fn, args.repeat)
+        baseline = baseline or seconds
+        print(f"  {name:<60} {seconds * 1000:9.1f} ms  {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
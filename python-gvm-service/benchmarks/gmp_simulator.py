@@ -0,0 +1,804 @@
+"""Offline stand-in for gvmd that speaks GMP over TLS or a Unix socket.
+
+Every task owns the same ``--results`` synthetic results, generated on the
+fly, so result sets of a million rows cost no memory. Targets, schedules
+and tasks can be created, modified, deleted and started; a started task
+runs for ``--scan-duration`` seconds. Latency can be added to every
+response or to single commands.
+
+    python benchmarks/gmp_simulator.py --socket /tmp/gmp.sock --results 100000
+    python benchmarks/gmp_simulator.py --port 9390 --latency 0.005 --latency get_reports=0.2
+
+Filters understand first, rows, task_id, report_id, host, severity>,
+modified> and sort-reverse; results come in modification order.
+"""
+import argparse
+import asyncio
+import calendar
+import functools
+import itertools
+import logging
+import os
+import random
+import re
+import ssl
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from lxml import etree
+
+logger = logging.getLogger("gmp_simulator")
+
+GMP_VERSION = "22.4"
+CHUNK_SIZE = 64 * 1024
+
+# Synthetic results are created and modified one second apart from here
+BASE_TIME = calendar.timegm((2024, 1, 1, 0, 0, 0))
+# Findings per host, each on a port of its own
+RESULTS_PER_HOST = 20
+PORTS = ("22/tcp", "80/tcp", "443/tcp", "3306/tcp", "5432/tcp", "8080/tcp", "25/tcp", "53/udp", "161/udp",
+         "123/udp", "445/tcp", "139/tcp", "21/tcp", "23/tcp", "110/tcp", "143/tcp", "389/tcp", "636/tcp",
+         "993/tcp", "general/tcp")
+NVTS = 5000
+
+XML_FORMAT_ID = "a994b278-1f62-11e1-96ac-406186ea4fc5"
+PORT_LISTS = {
+    "33d0cd82-57c6-11e1-8ed1-406186ea4fc5": "All IANA assigned TCP",
+    "4a4717fe-57d2-11e1-9a26-406186ea4fc5": "All IANA assigned TCP and UDP",
+}
+SCAN_CONFIGS = {
+    "daba56c8-73ec-11df-a475-002264764cea": "Full and fast",
+    "8715c877-47a0-438d-98a3-27c7a6ab2196": "Discovery",
+}
+SCANNERS = {
+    "08b69003-5fc2-4037-a479-93b440211c73": "OpenVAS Default",
+    "6acd0832-df90-11e4-b9d5-28d24461215b": "CVE",
+}
+PERIODS = ("FREQ=DAILY", "FREQ=HOURLY;INTERVAL=6", "FREQ=WEEKLY;BYDAY=MO,FR", "FREQ=MONTHLY")
+TIMEZONES = ("UTC", "Europe/Berlin", "America/New_York")
+
+# Commands answered before authenticating
+OPEN_COMMANDS = {"get_version", "authenticate"}
+ENTITIES = ("target", "schedule", "task")
+
+
+def _time(seconds: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+def _id(kind: int, index: int) -> str:
+    return f"00000000-0000-4000-{kind:04x}-{index:012x}"
+
+
+def task_id(index: int) -> str:
+    return _id(0x8000, index)
+
+
+def report_id(index: int) -> str:
+    return _id(0x9000, index)
+
+
+def result_id(task_index: int, i: int) -> str:
+    return f"{task_index:08x}-0000-4000-a000-{i:012x}"
+
+
+def _index(value: str, kind: int) -> Optional[int]:
+    prefix = _id(kind, 0)[:-12]
+    if not value.startswith(prefix):
+        return None
+    try:
+        return int(value[len(prefix):], 16)
+    except ValueError:
+        return None
+
+
+def severity(i: int) -> float:
+    return (i % 101) / 10
+
+
+def threat(value: float) -> str:
+    if value >= 7:
+        return "High"
+    if value >= 4:
+        return "Medium"
+    if value > 0:
+        return "Low"
+    return "Log"
+
+
+# Parts of a result that only depend on its NVT or severity
+_NVT_HEAD = [
+    f'<nvt oid="1.3.6.1.4.1.25623.1.0.{100000 + nvt}"><type>nvt</type><name>NVT check {nvt}</name>'
+    f"<family>Family {nvt % 60}</family>"
+    for nvt in range(NVTS)
+]
+_NVT_TAIL = [
+    "<tags>cvss_base_vector=AV:N/AC:L/Au:N/C:P/I:P/A:P|summary=Synthetic finding|solution_type=VendorFix</tags>"
+    '<solution type="VendorFix">Update to the latest version.</solution>'
+    f'<refs><ref type="cve" id="CVE-2024-{nvt:04d}"/></refs></nvt>'
+    "<scan_nvt_version>2024-01-01T00:00:00Z</scan_nvt_version>"
+    for nvt in range(NVTS)
+]
+_DESCRIPTIONS = [
+    f"<description>Installed version: 1.{nvt}\nFixed version: 2.0\nInstallation path / port: /usr/lib</description>"
+    for nvt in range(NVTS)
+]
+_SEVERITIES = [(f"{r / 10:.1f}", threat(r / 10)) for r in range(101)]
+
+
+@functools.lru_cache(maxsize=64)
+def _day(days: int) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(BASE_TIME + days * 86400))
+
+
+def _result_time(i: int) -> str:
+    days, seconds = divmod(i, 86400)
+    return f"{_day(days)}T{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}Z"
+
+
+def parse_filter(term: str) -> Dict[str, str]:
+    """``keyword=value`` and ``keyword>value`` terms; the latter are keyed
+    as ``keyword>``."""
+    terms = {}
+    for match in re.finditer(r"(\S+?)([=>])(\S+)", term or ""):
+        key, operator, value = match.groups()
+        terms[key if operator == "=" else key + ">"] = value
+    return terms
+
+
+def _residue_count(start: int, stop: int, residue: int, modulus: int) -> int:
+    """How many i in [start, stop) have i % modulus == residue."""
+    if stop <= start:
+        return 0
+    return (residue - start) // modulus - (residue - stop) // modulus
+
+
+class GmpError(Exception):
+    def __init__(self, status: int, text: str):
+        super().__init__(text)
+        self.status = status
+        self.text = text
+
+
+class Scan:
+    def __init__(self, started_at: float, duration: float):
+        self.started_at = started_at
+        self.duration = duration
+        self.stopped_at: Optional[float] = None
+
+    def status(self, now: float) -> Tuple[str, int]:
+        if self.stopped_at is not None:
+            return "Stopped", -1
+        elapsed = now - self.started_at
+        if elapsed >= self.duration:
+            return "Done", -1
+        return "Running", int(100 * elapsed / self.duration)
+
+
+class GmpSimulator:
+    def __init__(
+        self,
+        results: int = 1000,
+        tasks: int = 10,
+        targets: int = 5,
+        schedules: int = 4,
+        report_bytes: int = 1024 * 1024,
+        scan_duration: float = 60.0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        command_latency: Optional[Dict[str, float]] = None,
+        bandwidth: int = 0,
+        username: str = "admin",
+        password: str = "admin",
+    ):
+        self.results = results
+        self.report_bytes = report_bytes
+        self.scan_duration = scan_duration
+        self.latency = latency
+        self.jitter = jitter
+        self.command_latency = command_latency or {}
+        self.bandwidth = bandwidth
+        self.username = username
+        self.password = password
+
+        self.entities: Dict[str, Dict[str, Dict[str, Any]]] = {kind: {} for kind in ENTITIES}
+        self.scans: Dict[str, Scan] = {}
+        self._next_index = tasks
+        self._created = 0
+        self._result_tasks: Dict[int, str] = {}
+        self.commands: Dict[str, int] = {}
+        self.bytes_sent = 0
+
+        for i in range(targets):
+            self.entities["target"][_id(0xB000, i)] = {
+                "name": f"target {i}",
+                "hosts": f"10.{i}.0.0/24",
+                "max_hosts": 256,
+                "port_list_id": next(iter(PORT_LISTS)),
+            }
+        for i in range(schedules):
+            self.entities["schedule"][_id(0xC000, i)] = {
+                "name": f"schedule {i}",
+                "icalendar": (
+                    "BEGIN:VCALENDAR\nVERSION:2.0\nBEGIN:VEVENT\n"
+                    f"DTSTART:202401{1 + i % 28:02d}T{i % 24:02d}0000Z\nRRULE:{PERIODS[i % len(PERIODS)]}\n"
+                    "END:VEVENT\nEND:VCALENDAR"
+                ),
+                "timezone": TIMEZONES[i % len(TIMEZONES)],
+            }
+        target_ids = list(self.entities["target"])
+        schedule_ids = list(self.entities["schedule"])
+        for i in range(tasks):
+            self.entities["task"][task_id(i)] = {
+                "name": f"task {i}",
+                "index": i,
+                "target_id": target_ids[i % len(target_ids)] if target_ids else "",
+                "schedule_id": schedule_ids[i % len(schedule_ids)] if schedule_ids and i % 2 == 0 else "",
+                "config_id": next(iter(SCAN_CONFIGS)),
+                "scanner_id": list(SCANNERS)[i % len(SCANNERS)],
+            }
+
+    # ---------------------- server ----------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Commands are parsed as children of one synthetic root, so several
+        # of them in one read are no problem
+        parser = etree.XMLPullParser(events=("start", "end"), huge_tree=True)
+        parser.feed(b"<commands>")
+        depth = 0
+        authenticated = False
+        try:
+            while True:
+                data = await reader.read(CHUNK_SIZE)
+                if not data:
+                    break
+                parser.feed(data)
+                for event, element in parser.read_events():
+                    if event == "start":
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth != 1:
+                        continue
+                    if element.tag == "authenticate":
+                        authenticated = self._authenticate(element)
+                    await self._respond(writer, element, authenticated)
+                    element.getparent().remove(element)
+        except (ConnectionError, etree.XMLSyntaxError) as e:
+            logger.debug("Connection closed: %s", e)
+        finally:
+            writer.close()
+
+    def _authenticate(self, element) -> bool:
+        return (
+            element.findtext("credentials/username") == self.username
+            and element.findtext("credentials/password") == self.password
+        )
+
+    async def _respond(self, writer: asyncio.StreamWriter, command, authenticated: bool) -> None:
+        name = command.tag
+        self.commands[name] = self.commands.get(name, 0) + 1
+        delay = self.command_latency.get(name, self.latency)
+        if delay or self.jitter:
+            await asyncio.sleep(delay + random.uniform(0, self.jitter))
+        try:
+            if name not in OPEN_COMMANDS and not authenticated:
+                raise GmpError(401, "Authenticate first")
+            parts = self.dispatch(command)
+        except GmpError as e:
+            parts = iter([self._status(name, e.status, e.text)])
+        buffered = []
+        size = 0
+        for part in itertools.chain(parts, [""]):
+            if part:
+                buffered.append(part)
+                size += len(part)
+                if size < CHUNK_SIZE:
+                    continue
+            elif not buffered:
+                break
+            data = "".join(buffered).encode()
+            buffered, size = [], 0
+            writer.write(data)
+            await writer.drain()
+            self.bytes_sent += len(data)
+            if self.bandwidth:
+                await asyncio.sleep(len(data) / self.bandwidth)
+
+    def dispatch(self, command) -> Iterator[str]:
+        name = command.tag
+        handler = getattr(self, "cmd_" + name, None)
+        if handler is not None:
+            parts = handler(command)
+        else:
+            action, _, kind = name.partition("_")
+            if kind not in ENTITIES or action not in ("create", "modify", "delete"):
+                return iter([self._status(name, 400, "Bogus command name")])
+            parts = getattr(self, action)(kind, command)
+        # Argument errors are raised here rather than after the first chunk
+        first = next(parts, None)
+        return itertools.chain([first] if first is not None else [], parts)
+
+    @staticmethod
+    def _status(name: str, status: int, text: str, attributes: str = "") -> str:
+        return f'<{name}_response status="{status}" status_text={quoteattr(text)}{attributes}/>'
+
+    # ---------------------- commands ----------------------
+
+    def cmd_get_version(self, command) -> Iterator[str]:
+        yield f'<get_version_response status="200" status_text="OK"><version>{GMP_VERSION}</version></get_version_response>'
+
+    def cmd_authenticate(self, command) -> Iterator[str]:
+        if not self._authenticate(command):
+            yield self._status("authenticate", 400, "Authentication failed")
+            return
+        yield (
+            '<authenticate_response status="200" status_text="OK"><role>Admin</role>'
+            "<timezone>UTC</timezone><severity>nist</severity></authenticate_response>"
+        )
+
+    def cmd_get_tasks(self, command) -> Iterator[str]:
+        wanted = command.get("task_id")
+        if wanted and wanted not in self.entities["task"]:
+            raise GmpError(404, f"Failed to find task '{wanted}'")
+        tasks = [wanted] if wanted else list(self.entities["task"])
+        if command.get("schedules_only") == "1":
+            tasks = [task for task in tasks if self.entities["task"][task]["schedule_id"]]
+        yield '<get_tasks_response status="200" status_text="OK">'
+        now = time.time()
+        for task in tasks:
+            yield self._task(task, now)
+        yield self._page("task", command, len(tasks), len(tasks))
+        yield "</get_tasks_response>"
+
+    def _task(self, task: str, now: float) -> str:
+        entity = self.entities["task"][task]
+        index = entity["index"]
+        scan = self.scans.get(task)
+        status, progress = scan.status(now) if scan else ("Done", -1)
+        target = self.entities["target"].get(entity["target_id"], {})
+        schedule = self.entities["schedule"].get(entity["schedule_id"], {})
+        report = f'<report id="{report_id(index)}">'
+        last_report = (
+            f"<last_report>{report}<timestamp>{_time(BASE_TIME)}</timestamp>"
+            f"<scan_start>{_time(BASE_TIME)}</scan_start><scan_end>{_time(BASE_TIME + 3600)}</scan_end>"
+            f"<result_count>{self.results}</result_count><severity>10.0</severity></report></last_report>"
+        )
+        current_report = f"<current_report>{report}</report></current_report>" if status == "Running" else ""
+        return (
+            f'<task id="{task}"><owner><name>admin</name></owner><name>{escape(entity["name"])}</name>'
+            f"<comment>{escape(entity.get('comment', ''))}</comment>"
+            f"<creation_time>{_time(BASE_TIME)}</creation_time><modification_time>{_time(BASE_TIME)}</modification_time>"
+            f'<usage_type>scan</usage_type><config id="{entity["config_id"]}">'
+            f"<name>{SCAN_CONFIGS.get(entity['config_id'], '')}</name></config>"
+            f'<target id="{entity["target_id"]}"><name>{escape(target.get("name", ""))}</name></target>'
+            f'<scanner id="{entity["scanner_id"]}"><name>{SCANNERS.get(entity["scanner_id"], "")}</name><type>2</type></scanner>'
+            f'<schedule id="{entity["schedule_id"]}"><name>{escape(schedule.get("name", ""))}</name></schedule>'
+            f"<status>{status}</status><progress>{progress}</progress>"
+            f"<report_count>1<finished>1</finished></report_count>"
+            f"{current_report}{last_report}<average_duration>{3600 if index % 3 else 1800}</average_duration>"
+            "</task>"
+        )
+
+    def _page(self, kind: str, command, count: int, filtered: int, shown: Optional[int] = None) -> str:
+        term = command.get("filter", "")
+        shown = filtered if shown is None else shown
+        return (
+            f'<filters id=""><term>{escape(term)}</term></filters>'
+            f'<{kind}s start="1" max="{filtered}"/>'
+            f"<{kind}_count>{count}<filtered>{filtered}</filtered><page>{shown}</page></{kind}_count>"
+        )
+
+    def cmd_get_targets(self, command) -> Iterator[str]:
+        wanted = command.get("target_id")
+        yield from self._list("target", wanted, command, lambda target, entity: (
+            f"<hosts>{escape(entity['hosts'])}</hosts><max_hosts>{entity['max_hosts']}</max_hosts>"
+            f'<port_list id="{entity["port_list_id"]}"><name>{PORT_LISTS.get(entity["port_list_id"], "")}</name></port_list>'
+        ))
+
+    def cmd_get_schedules(self, command) -> Iterator[str]:
+        wanted = command.get("schedule_id")
+        yield from self._list("schedule", wanted, command, lambda schedule, entity: (
+            f"<icalendar>{escape(entity['icalendar'])}</icalendar><timezone>{escape(entity['timezone'])}</timezone>"
+        ))
+
+    def _list(self, kind: str, wanted: Optional[str], command, body) -> Iterator[str]:
+        entities = self.entities[kind]
+        if wanted and wanted not in entities:
+            raise GmpError(404, f"Failed to find {kind} '{wanted}'")
+        ids = [wanted] if wanted else list(entities)
+        yield f'<get_{kind}s_response status="200" status_text="OK">'
+        for entity_id in ids:
+            entity = entities[entity_id]
+            yield (
+                f'<{kind} id="{entity_id}"><owner><name>admin</name></owner><name>{escape(entity["name"])}</name>'
+                f"<comment>{escape(entity.get('comment', ''))}</comment>{body(entity_id, entity)}</{kind}>"
+            )
+        yield self._page(kind, command, len(ids), len(ids))
+        yield f"</get_{kind}s_response>"
+
+    def _fixed(self, name: str, kind: str, entities: Dict[str, str]) -> Iterator[str]:
+        yield f'<{name}_response status="200" status_text="OK">'
+        for entity_id, entity_name in entities.items():
+            yield f'<{kind} id="{entity_id}"><name>{entity_name}</name><comment/></{kind}>'
+        yield f"<{kind}_count>{len(entities)}<filtered>{len(entities)}</filtered></{kind}_count>"
+        yield f"</{name}_response>"
+
+    def cmd_get_port_lists(self, command) -> Iterator[str]:
+        return self._fixed("get_port_lists", "port_list", PORT_LISTS)
+
+    def cmd_get_configs(self, command) -> Iterator[str]:
+        return self._fixed("get_configs", "config", SCAN_CONFIGS)
+
+    def cmd_get_scanners(self, command) -> Iterator[str]:
+        return self._fixed("get_scanners", "scanner", SCANNERS)
+
+    # ---------------------- results ----------------------
+
+    def _task_index(self, terms: Dict[str, str], command) -> int:
+        task = command.get("task_id") or terms.get("task_id")
+        if task:
+            entity = self.entities["task"].get(task)
+            if entity is None:
+                raise GmpError(404, f"Failed to find task '{task}'")
+            return entity["index"]
+        report = terms.get("report_id")
+        if report:
+            index = _index(report, 0x9000)
+            if index is None or index >= self._next_index:
+                raise GmpError(404, f"Failed to find report '{report}'")
+            return index
+        return 0
+
+    def select(self, terms: Dict[str, str]) -> Tuple[int, Iterator[int]]:
+        """Count and indices of the results matching ``terms``, before
+        paging."""
+        start, stop = 0, self.results
+        if "modified>" in terms:
+            start = max(start, int(float(terms["modified>"])) - BASE_TIME + 1)
+        if "host" in terms:
+            parts = terms["host"].split(".")
+            if len(parts) == 4 and parts[0] == "10" and all(part.isdigit() for part in parts):
+                h = (int(parts[1]) << 16) | (int(parts[2]) << 8) | int(parts[3])
+                start, stop = max(start, h * RESULTS_PER_HOST), min(stop, (h + 1) * RESULTS_PER_HOST)
+            else:
+                stop = start
+        indices = range(start, stop)
+        if terms.get("sort-reverse"):
+            indices = indices[::-1]
+        if "severity>" not in terms:
+            return max(0, stop - start), iter(indices)
+        minimum = float(terms["severity>"])
+        residues = [r for r in range(101) if r / 10 > minimum]
+        count = sum(_residue_count(start, stop, r, 101) for r in residues)
+        return count, (i for i in indices if severity(i) > minimum)
+
+    def _paged(self, terms: Dict[str, str], indices: Iterator[int]) -> Iterator[int]:
+        first = max(int(terms.get("first", 1)), 1) - 1
+        rows = int(terms.get("rows", -1))
+        return itertools.islice(indices, first, None if rows < 0 else first + rows)
+
+    def result(self, task_index: int, i: int, details: bool = True) -> str:
+        nvt = (i * 7919) % NVTS
+        value, level = _SEVERITIES[i % 101]
+        timestamp = _result_time(i)
+        h = i // RESULTS_PER_HOST
+        return "".join((
+            f'<result id="{task_index:08x}-0000-4000-a000-{i:012x}"><name>NVT check {nvt}</name>'
+            f"<owner><name>admin</name></owner><comment/><creation_time>{timestamp}</creation_time>"
+            f"<modification_time>{timestamp}</modification_time>",
+            self._result_task(task_index),
+            f"<host>10.{(h >> 16) & 255}.{(h >> 8) & 255}.{h & 255}<asset asset_id=\"\"/>"
+            f"<hostname>host-{h}</hostname></host><port>{PORTS[i % RESULTS_PER_HOST]}</port>",
+            _NVT_HEAD[nvt],
+            f"<cvss_base>{value}</cvss_base>",
+            _NVT_TAIL[nvt],
+            f"<threat>{level}</threat><severity>{value}</severity><qod><value>80</value><type>remote_banner</type></qod>",
+            _DESCRIPTIONS[nvt] if details else "",
+            f"<original_threat>{level}</original_threat><original_severity>{value}</original_severity></result>",
+        ))
+
+    def _result_task(self, task_index: int) -> str:
+        fragment = self._result_tasks.get(task_index)
+        if fragment is None:
+            task = task_id(task_index)
+            name = self.entities["task"].get(task, {}).get("name", "")
+            fragment = f'<report id="{report_id(task_index)}"/><task id="{task}"><name>{escape(name)}</name></task>'
+            self._result_tasks[task_index] = fragment
+        return fragment
+
+    def cmd_get_results(self, command) -> Iterator[str]:
+        wanted = command.get("result_id")
+        if wanted:
+            task_index, i = self._parse_result_id(wanted)
+            yield '<get_results_response status="200" status_text="OK">'
+            yield self.result(task_index, i)
+            yield "</get_results_response>"
+            return
+        terms = parse_filter(command.get("filter", ""))
+        task_index = self._task_index(terms, command)
+        details = command.get("details") != "0"
+        filtered, indices = self.select(terms)
+        yield '<get_results_response status="200" status_text="OK">'
+        shown = 0
+        for i in self._paged(terms, indices):
+            shown += 1
+            yield self.result(task_index, i, details)
+        yield self._page("result", command, self.results, filtered, shown)
+        yield "</get_results_response>"
+
+    def _parse_result_id(self, value: str) -> Tuple[int, int]:
+        match = re.fullmatch(r"([0-9a-f]{8})-0000-4000-a000-([0-9a-f]{12})", value)
+        if match:
+            task_index, i = int(match.group(1), 16), int(match.group(2), 16)
+            if task_index < self._next_index and i < self.results:
+                return task_index, i
+        raise GmpError(404, f"Failed to find result '{value}'")
+
+    def cmd_get_reports(self, command) -> Iterator[str]:
+        report = command.get("report_id", "")
+        index = _index(report, 0x9000)
+        if index is None or index >= self._next_index:
+            raise GmpError(404, "Failed to find report")
+        format_id = command.get("format_id")
+        yield '<get_reports_response status="200" status_text="OK">'
+        if format_id and format_id != XML_FORMAT_ID:
+            yield from self._report_file(report, format_id)
+        else:
+            yield from self._report_xml(report, index, command)
+        yield '<filters id=""><term/></filters><sort><field>severity<order>descending</order></field></sort>'
+        yield "</get_reports_response>"
+
+    def _report_file(self, report: str, format_id: str) -> Iterator[str]:
+        yield (
+            f'<report id="{report}" format_id="{format_id}" extension="pdf" content_type="application/pdf">'
+            f'<owner><name>admin</name></owner><name>{_time(BASE_TIME)}</name><report_format id="{format_id}"/>'
+        )
+        # 57 bytes encode to one 76 character base64 line
+        line = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/ABCDEFGHIJKL\n"
+        lines, rest = divmod(self.report_bytes, 57)
+        block = line * 1000
+        for _ in range(lines // 1000):
+            yield block
+        yield line * (lines % 1000)
+        if rest:
+            # A multiple of 3 bytes, padded out with zero bytes
+            yield "A" * (4 * -(-rest // 3)) + "\n"
+        yield "</report>"
+
+    def _report_xml(self, report: str, index: int, command) -> Iterator[str]:
+        terms = parse_filter(command.get("filter", ""))
+        if command.get("ignore_pagination") == "1":
+            terms.pop("first", None)
+            terms.pop("rows", None)
+        filtered, indices = self.select(terms)
+        task = task_id(index)
+        status, _ = self.scans[task].status(time.time()) if task in self.scans else ("Done", -1)
+        yield (
+            f'<report id="{report}" format_id="{XML_FORMAT_ID}" extension="xml" content_type="text/xml">'
+            f'<owner><name>admin</name></owner><name>{_time(BASE_TIME)}</name>'
+            f'<task id="{task}"><name>{escape(self.entities["task"].get(task, {}).get("name", ""))}</name></task>'
+            f'<report id="{report}"><scan_run_status>{status}</scan_run_status>'
+            f"<scan_start>{_time(BASE_TIME)}</scan_start><scan_end>{_time(BASE_TIME + 3600)}</scan_end>"
+        )
+        yield self._result_count(terms, filtered)
+        if command.get("details") != "0":
+            yield f'<results start="1" max="{filtered}">'
+            for i in self._paged(terms, indices):
+                yield self.result(index, i)
+            yield "</results>"
+        yield "</report></report>"
+
+    def _result_count(self, terms: Dict[str, str], filtered: int) -> str:
+        """gvmd's per level counts of a report; only severity> narrows them
+        down here."""
+        minimum = float(terms.get("severity>", -1))
+        levels = {"hole": (7.0, 10.0), "warning": (4.0, 6.9), "info": (0.1, 3.9), "log": (0.0, 0.0)}
+        parts = []
+        for level, (low, high) in levels.items():
+            residues = [r for r in range(101) if low <= r / 10 <= high]
+            full = sum(_residue_count(0, self.results, r, 101) for r in residues)
+            matching = sum(_residue_count(0, self.results, r, 101) for r in residues if r / 10 > minimum)
+            parts.append(f"<{level}><full>{full}</full><filtered>{matching}</filtered></{level}>")
+        return (
+            f"<result_count>{self.results}<full>{self.results}</full><filtered>{filtered}</filtered>"
+            f"{''.join(parts)}<false_positive><full>0</full><filtered>0</filtered></false_positive></result_count>"
+        )
+
+    # ---------------------- changes ----------------------
+
+    def create(self, kind: str, command) -> Iterator[str]:
+        name = command.findtext("name")
+        if not name:
+            raise GmpError(400, "A name is required")
+        if any(entity["name"] == name for entity in self.entities[kind].values()):
+            raise GmpError(400, f"{kind.capitalize()} exists already")
+        entity = {"name": name}
+        self._apply(entity, command)
+        if kind == "target":
+            entity.setdefault("max_hosts", len(entity.get("hosts", "").split(",")))
+            entity.setdefault("port_list_id", next(iter(PORT_LISTS)))
+        elif kind == "schedule":
+            entity.setdefault("icalendar", "")
+            entity.setdefault("timezone", "UTC")
+        elif kind == "task":
+            for reference in ("target_id", "schedule_id", "config_id", "scanner_id"):
+                entity.setdefault(reference, "")
+            if entity["target_id"] not in self.entities["target"]:
+                raise GmpError(404, f"Failed to find target '{entity['target_id']}'")
+            entity["index"] = self._next_index
+            self._next_index += 1
+        self._created += 1
+        entity_id = task_id(entity["index"]) if kind == "task" else _id(0xD000, self._created)
+        self.entities[kind][entity_id] = entity
+        yield self._status(f"create_{kind}", 201, "OK, resource created", f' id="{entity_id}"')
+
+    def modify(self, kind: str, command) -> Iterator[str]:
+        entity_id = command.get(f"{kind}_id")
+        entity = self.entities[kind].get(entity_id)
+        if entity is None:
+            raise GmpError(404, f"Failed to find {kind} '{entity_id}'")
+        self._apply(entity, command)
+        yield self._status(f"modify_{kind}", 200, "OK")
+
+    def delete(self, kind: str, command) -> Iterator[str]:
+        entity_id = command.get(f"{kind}_id")
+        if self.entities[kind].pop(entity_id, None) is None:
+            raise GmpError(404, f"Failed to find {kind} '{entity_id}'")
+        self.scans.pop(entity_id, None)
+        yield self._status(f"delete_{kind}", 200, "OK")
+
+    @staticmethod
+    def _apply(entity: Dict[str, Any], command) -> None:
+        for child in command:
+            if child.get("id") is not None:
+                entity[f"{child.tag}_id"] = child.get("id")
+            elif child.text is not None:
+                entity[child.tag] = child.text
+
+    def cmd_start_task(self, command) -> Iterator[str]:
+        task = command.get("task_id")
+        entity = self.entities["task"].get(task)
+        if entity is None:
+            raise GmpError(404, f"Failed to find task '{task}'")
+        now = time.time()
+        scan = self.scans.get(task)
+        if scan is not None and scan.status(now)[0] == "Running":
+            raise GmpError(400, "Task is active already")
+        self.scans[task] = Scan(now, self.scan_duration)
+        yield (
+            '<start_task_response status="202" status_text="OK, request submitted">'
+            f"<report_id>{report_id(entity['index'])}</report_id></start_task_response>"
+        )
+
+    def cmd_stop_task(self, command) -> Iterator[str]:
+        task = command.get("task_id")
+        scan = self.scans.get(task)
+        if scan is None or scan.status(time.time())[0] != "Running":
+            raise GmpError(400, "Task is not active")
+        scan.stopped_at = time.time()
+        yield self._status("stop_task", 202, "OK, request submitted")
+
+
+def self_signed_context() -> ssl.SSLContext:
+    """Server context with a throwaway certificate for localhost."""
+    from datetime import datetime, timedelta, timezone
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=30))
+        .sign(key, hashes.SHA256())
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        with open(certfile, "wb") as f:
+            f.write(certificate.public_bytes(serialization.Encoding.PEM))
+        with open(keyfile, "wb") as f:
+            f.write(key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ))
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+    return context
+
+
+def parse_latency(values) -> Tuple[float, Dict[str, float]]:
+    """``--latency`` values: seconds for every command, or
+    ``command=seconds`` for one."""
+    default, per_command = 0.0, {}
+    for value in values or ():
+        command, _, seconds = value.rpartition("=")
+        if command:
+            per_command[command] = float(seconds)
+        else:
+            default = float(seconds)
+    return default, per_command
+
+
+async def serve(simulator: GmpSimulator, socket_path: Optional[str], host: str, port: int, context) -> None:
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(simulator.handle, socket_path, limit=CHUNK_SIZE)
+        where = socket_path
+    else:
+        server = await asyncio.start_server(simulator.handle, host, port, ssl=context, limit=CHUNK_SIZE)
+        where = f"{host}:{port} (TLS)"
+    # Benchmarks wait for this line
+    print(f"GMP simulator listening on {where}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--socket", help="Unix socket path; TLS on --host/--port otherwise")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9390)
+    parser.add_argument("--certfile", help="TLS certificate; a self-signed one is made if omitted")
+    parser.add_argument("--keyfile")
+    parser.add_argument("--results", type=int, default=1000, help="results per task and report")
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--targets", type=int, default=5)
+    parser.add_argument("--schedules", type=int, default=4)
+    parser.add_argument("--report-bytes", type=int, default=1024 * 1024, help="size of non-XML reports")
+    parser.add_argument("--scan-duration", type=float, default=60.0)
+    parser.add_argument(
+        "--latency", action="append", metavar="[COMMAND=]SECONDS",
+        help="delay before each response, or before one command's; repeatable",
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay of up to this many seconds")
+    parser.add_argument("--bandwidth", type=int, default=0, help="bytes per second per connection, 0 for no limit")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    latency, command_latency = parse_latency(args.latency)
+    simulator = GmpSimulator(
+        results=args.results,
+        tasks=args.tasks,
+        targets=args.targets,
+        schedules=args.schedules,
+        report_bytes=args.report_bytes,
+        scan_duration=args.scan_duration,
+        latency=latency,
+        jitter=args.jitter,
+        command_latency=command_latency,
+        bandwidth=args.bandwidth,
+        username=args.username,
+        password=args.password,
+    )
+    context = None
+    if not args.socket:
+        if args.certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(args.certfile, args.keyfile)
+        else:
+            context = self_signed_context()
+    try:
+        asyncio.run(serve(simulator, args.socket, args.host, args.port, context))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
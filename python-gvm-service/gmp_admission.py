@@ -0,0 +1,378 @@
+import asyncio
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from gmp_watch import IDLE_STATUSES, TaskWatcher
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"low": 0, "normal": 1, "high": 2}
+TEAM_PATTERN = r"^[A-Za-z0-9_\-]+$"
+
+# Window for the throughput figures, in seconds
+THROUGHPUT_WINDOW = 3600
+
+
+class AdmissionStore:
+    """SQLite copy of the queue and of the tasks it started, so neither is
+    lost on restart."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS queue ("
+                "task_id TEXT PRIMARY KEY, team TEXT, priority INTEGER, scanner_id TEXT,"
+                " enqueued_at REAL, seq INTEGER)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS started ("
+                "task_id TEXT PRIMARY KEY, team TEXT, scanner_id TEXT, started_at REAL)"
+            )
+
+    def load(self, table: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._db.execute(f"SELECT * FROM {table}")]
+
+    def put(self, table: str, row: Dict[str, Any]) -> None:
+        columns = ", ".join(row)
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({', '.join('?' * len(row))})",
+                tuple(row.values()),
+            )
+
+    def delete(self, table: str, task_id: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(f"DELETE FROM {table} WHERE task_id = ?", (task_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class AdmissionQueue:
+    """Holds task starts back until gvmd has room for them.
+
+    A task is started once fewer than ``max_running`` tasks run in total and
+    fewer than its scanner's limit run on its scanner (0 means no limit).
+    Scanners are told apart by ``(manager name, scanner id)``, since every
+    gvmd has its own copy of the built-in scanners under the same id;
+    ``manager_of`` names the manager of a task id.
+    Among the queued tasks the highest priority goes first; within a
+    priority the team with the fewest running tasks per unit of weight
+    goes first, and a team's own tasks go in submission order.
+
+    Running counts come from the task watcher's snapshot, so scans started
+    by gvmd schedules or other clients take up capacity too. The watcher
+    keeps polling while the queue is not empty and the queue re-checks
+    after every poll, which is how finished scans make room.
+    """
+
+    def __init__(
+        self,
+        watcher: TaskWatcher,
+        start: Callable[[str], Awaitable[Dict[str, Any]]],
+        max_running: int = 0,
+        max_running_per_scanner: int = 0,
+        scanner_limits: Optional[Dict[Tuple[str, str], int]] = None,
+        team_weights: Optional[Dict[str, float]] = None,
+        manager_of: Callable[[str], str] = lambda task_id: "",
+    ):
+        self._store: Optional[AdmissionStore] = None
+        self._watcher = watcher
+        self._start = start
+        self.max_running = max_running
+        self.max_running_per_scanner = max_running_per_scanner
+        self.scanner_limits = scanner_limits or {}
+        self.team_weights = team_weights or {}
+        self.manager_of = manager_of
+
+        self._queue: Dict[str, Dict[str, Any]] = {}
+        self._started: Dict[str, Dict[str, Any]] = {}
+        # Done once the start of a task taken off the queue has been answered
+        self._starting: Dict[str, asyncio.Future] = {}
+        self._seq = 0
+        self._lock = asyncio.Lock()
+        self._pending = asyncio.Event()
+        self._watching_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._starts: deque = deque()
+        self._finishes: deque = deque()
+        self._waits: deque = deque(maxlen=1000)
+        self._failures: deque = deque(maxlen=20)
+
+    def open(self, store: AdmissionStore) -> None:
+        """Loads the queue kept in ``store`` and keeps it there from now on.
+        Call before ``start``."""
+        self._store = store
+        self._queue = {row["task_id"]: row for row in store.load("queue")}
+        self._started = {row["task_id"]: row for row in store.load("started")}
+        self._seq = max((row["seq"] for row in self._queue.values()), default=0)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_running or self.max_running_per_scanner or self.scanner_limits)
+
+    def start(self) -> None:
+        if self._task is None:
+            if self._queue:
+                self._pending.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+
+    # ---------------------- queue ----------------------
+
+    async def submit(self, task_id: str, scanner_id: Optional[str], team: str, priority: int) -> Dict[str, Any]:
+        """Queues ``task_id`` and starts what fits right away. Returns the
+        task's start result, or its queue entry if it still waits."""
+        async with self._lock:
+            if task_id not in self._queue:
+                self._seq += 1
+                entry = {
+                    "task_id": task_id,
+                    "team": team,
+                    "priority": priority,
+                    "scanner_id": scanner_id,
+                    "enqueued_at": time.time(),
+                    "seq": self._seq,
+                }
+                await asyncio.to_thread(self._store.put, "queue", entry)
+                self._queue[task_id] = entry
+            self._pending.set()
+        if not self._fresh():
+            # The worker is only now starting to watch; one poll is usually
+            # quick, and saves queueing when there is room
+            await self._watcher.next_poll(self._watcher.min_interval)
+        if self._fresh():
+            await self._promote()
+        if task_id in self._queue:
+            return {**self.position(task_id), "started": False}
+        starting = self._starting.get(task_id)
+        if starting is not None:
+            # Taken off the queue by another caller's _promote
+            await asyncio.shield(starting)
+        started = self._started.get(task_id)
+        if started is not None and "result" in started:
+            return {"task_id": task_id, "started": True, **started["result"]}
+        # Taken out by a failed start
+        raise RuntimeError(self._failure(task_id) or f"Task {task_id} could not be started")
+
+    async def discard(self, task_id: str) -> bool:
+        async with self._lock:
+            if self._queue.pop(task_id, None) is None:
+                return False
+            await asyncio.to_thread(self._store.delete, "queue", task_id)
+            return True
+
+    def _weight(self, team: Optional[str]) -> float:
+        return self.team_weights.get(team, 1.0)
+
+    def _ordered(self, entries: List[Dict[str, Any]], team_running: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+        """``entries`` in start order, assuming each one starts in turn."""
+        counts = dict(team_running)
+        levels: Dict[int, Dict[str, deque]] = {}
+        for entry in sorted(entries, key=lambda entry: entry["seq"]):
+            levels.setdefault(entry["priority"], {}).setdefault(entry["team"], deque()).append(entry)
+        for priority in sorted(levels, reverse=True):
+            teams = levels[priority]
+            heap = [(counts.get(team, 0) / self._weight(team), queue[0]["seq"], team) for team, queue in teams.items()]
+            heapq.heapify(heap)
+            while heap:
+                _, _, team = heapq.heappop(heap)
+                queue = teams[team]
+                entry = queue.popleft()
+                counts[team] = counts.get(team, 0) + 1
+                yield entry
+                if queue:
+                    heapq.heappush(heap, (counts[team] / self._weight(team), queue[0]["seq"], team))
+
+    def queued(self) -> List[Dict[str, Any]]:
+        """Queue entries in the order they are expected to start, each with
+        its 1-based ``position`` and ``waiting`` seconds."""
+        _, _, team_running = self._counts()
+        now = time.time()
+        return [
+            {**entry, "position": position, "waiting": round(now - entry["enqueued_at"], 3)}
+            for position, entry in enumerate(self._ordered(list(self._queue.values()), team_running), 1)
+        ]
+
+    def position(self, task_id: str) -> Optional[Dict[str, Any]]:
+        if task_id not in self._queue:
+            return None
+        return next(entry for entry in self.queued() if entry["task_id"] == task_id)
+
+    # ---------------------- admission ----------------------
+
+    def _fresh(self) -> bool:
+        # Only decide on a snapshot polled since the queue started waiting,
+        # since the watcher does not poll while nobody needs it
+        return self._watching_since is not None and self._watcher.polled_at >= self._watching_since
+
+    def _counts(self):
+        """Running tasks in total, per scanner and per team."""
+        snapshot = self._watcher.snapshot or {}
+        running = {
+            task_id: self._scanner(task_id, (task.get("scanner") or {}).get("id"))
+            for task_id, task in snapshot.items()
+            if task.get("status") not in IDLE_STATUSES
+        }
+        for task_id, started in self._started.items():
+            # Being started, or started after the snapshot was taken, so not in it yet
+            if task_id in self._starting or started["started_at"] >= self._watcher.polled_at:
+                running[task_id] = self._scanner(task_id, started["scanner_id"])
+        per_scanner: Dict[Tuple[str, Optional[str]], int] = {}
+        for scanner in running.values():
+            per_scanner[scanner] = per_scanner.get(scanner, 0) + 1
+        per_team: Dict[str, int] = {}
+        for task_id, started in self._started.items():
+            if task_id in running:
+                per_team[started["team"]] = per_team.get(started["team"], 0) + 1
+        return len(running), per_scanner, per_team
+
+    def _scanner(self, task_id: str, scanner_id: Optional[str]) -> Tuple[str, Optional[str]]:
+        return self.manager_of(task_id), scanner_id
+
+    def _scanner_limit(self, scanner: Tuple[str, Optional[str]]) -> int:
+        return self.scanner_limits.get(scanner, self.max_running_per_scanner)
+
+    async def _forget_finished(self) -> None:
+        snapshot = self._watcher.snapshot or {}
+        now = time.time()
+        for task_id, started in list(self._started.items()):
+            if started["started_at"] >= self._watcher.polled_at or task_id in self._starting:
+                continue
+            task = snapshot.get(task_id)
+            if task is None or task.get("status") in IDLE_STATUSES:
+                del self._started[task_id]
+                await asyncio.to_thread(self._store.delete, "started", task_id)
+                self._finishes.append(now)
+
+    @staticmethod
+    def _record(entry: Dict[str, Any], started_at: float) -> Dict[str, Any]:
+        return {
+            "task_id": entry["task_id"],
+            "team": entry["team"],
+            "scanner_id": entry["scanner_id"],
+            "started_at": started_at,
+        }
+
+    async def _admit(self) -> List[Dict[str, Any]]:
+        """Takes the queued tasks there is room for off the queue. They count
+        as running from here on. Call with the lock held."""
+        await self._forget_finished()
+        running, per_scanner, per_team = self._counts()
+        admitted = []
+        for entry in self._ordered(list(self._queue.values()), per_team):
+            if self.max_running and running >= self.max_running:
+                break
+            task_id = entry["task_id"]
+            scanner = self._scanner(task_id, entry["scanner_id"])
+            limit = self._scanner_limit(scanner)
+            if limit and per_scanner.get(scanner, 0) >= limit:
+                continue
+            del self._queue[task_id]
+            await asyncio.to_thread(self._store.delete, "queue", task_id)
+            self._started[task_id] = self._record(entry, time.time())
+            self._starting[task_id] = asyncio.get_running_loop().create_future()
+            admitted.append(entry)
+            running += 1
+            per_scanner[scanner] = per_scanner.get(scanner, 0) + 1
+        return admitted
+
+    async def _promote(self) -> None:
+        """Starts queued tasks while there is room. The starts go to gvmd
+        without the lock held, so submits and removals do not wait on them."""
+        async with self._lock:
+            admitted = await self._admit()
+        await asyncio.gather(*(self._start_admitted(entry) for entry in admitted))
+
+    async def _start_admitted(self, entry: Dict[str, Any]) -> None:
+        task_id = entry["task_id"]
+        try:
+            result = await self._start(task_id)
+            now = time.time()
+            record = self._record(entry, now)
+            await asyncio.to_thread(self._store.put, "started", record)
+            # The start result is kept in memory only, for ``submit``
+            self._started[task_id] = {**record, "result": result}
+            self._waits.append(now - entry["enqueued_at"])
+            self._starts.append(now)
+        except Exception as e:
+            logger.warning("Starting queued task %s failed: %s", task_id, e)
+            self._failures.append({"task_id": task_id, "error": str(e) or type(e).__name__, "at": time.time()})
+        finally:
+            if "result" not in self._started.get(task_id, {}):
+                # Failed or cancelled, so no longer counted as running
+                self._started.pop(task_id, None)
+            self._starting.pop(task_id).set_result(None)
+
+    def _failure(self, task_id: str) -> Optional[str]:
+        for failure in reversed(self._failures):
+            if failure["task_id"] == task_id:
+                return failure["error"]
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            await self._pending.wait()
+            self._watching_since = time.time()
+            try:
+                async with self._watcher.keep_polling():
+                    while self._queue:
+                        # Re-checked after every poll, as a running scan may
+                        # have finished without anything else changing
+                        await self._watcher.next_poll(self._watcher.max_interval)
+                        if self._fresh():
+                            await self._promote()
+            finally:
+                self._watching_since = None
+            async with self._lock:
+                if not self._queue:
+                    self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        cutoff = time.time() - THROUGHPUT_WINDOW
+        for times in (self._starts, self._finishes):
+            while times and times[0] < cutoff:
+                times.popleft()
+        waits = sorted(self._waits)
+        return {
+            "enabled": self.enabled,
+            "max_running": self.max_running,
+            "max_running_per_scanner": self.max_running_per_scanner,
+            "scanner_limits": [
+                {"manager": manager, "scanner_id": scanner_id, "limit": limit}
+                for (manager, scanner_id), limit in self.scanner_limits.items()
+            ],
+            "queued": len(self._queue),
+            "running": self._counts()[0],
+            "started_by_queue": len(self._started),
+            "started_last_hour": len(self._starts),
+            "finished_last_hour": len(self._finishes),
+            "wait_time_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_time_p95": round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0,
+            "wait_time_max": round(waits[-1], 3) if waits else 0.0,
+            "recent_failures": list(self._failures),
+        }
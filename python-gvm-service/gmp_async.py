@@ -0,0 +1,571 @@
+import asyncio
+import re
+import ssl
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from gvm.errors import GvmError, GvmResponseError
+from gvm.protocols.gmpv208 import Gmp as Gmpv208
+from gvm.protocols.gmpv214 import Gmp as Gmpv214
+from gvm.protocols.gmpv224 import Gmp as Gmpv224
+from gvm.transforms import check_command_status
+from gvm.xml import XmlCommand
+from lxml import etree
+
+from gmp_metrics import (
+    GMP_AUTH_SECONDS, GMP_COMMAND_SECONDS, GMP_CONNECT_SECONDS, GMP_ERRORS, GMP_IN_FLIGHT,
+    GMP_POOL_WAIT_SECONDS, GMP_RESPONSE_BYTES, add_to_profile, observe_phase,
+)
+
+READ_CHUNK = 64 * 1024
+
+_COMMAND_NAME = re.compile(r"<([\w-]+)")
+# Start tag of a response's root element, after an optional XML declaration
+_ROOT_START = re.compile(rb"\s*(?:<\?[^>]*\?>\s*)?<([^\s/>]+)[^>]*?(/?)>")
+
+
+def _command_name(cmd: str) -> str:
+    match = _COMMAND_NAME.match(cmd)
+    return match.group(1) if match else "unknown"
+
+
+class _CommandTimer:
+    """Records a command's round trip, response size and failure in the
+    metrics, and counts it as in flight meanwhile."""
+
+    __slots__ = ("command", "started", "received")
+
+    def __init__(self, cmd: str):
+        self.command = _command_name(cmd)
+        self.received = 0
+
+    def __enter__(self):
+        GMP_IN_FLIGHT.inc()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        GMP_IN_FLIGHT.dec()
+        if error is not None:
+            if isinstance(error, Exception):
+                GMP_ERRORS.inc(self.command, kind.__name__)
+            return
+        elapsed = time.perf_counter() - self.started
+        GMP_COMMAND_SECONDS.observe(elapsed, self.command)
+        GMP_RESPONSE_BYTES.observe(self.received, self.command)
+        add_to_profile("round_trip", elapsed)
+
+
+def _command_builder(gmp_class):
+    """Returns a python-gvm protocol instance whose commands return their XML
+    instead of sending it, so argument validation and serialization stay in
+    python-gvm while the I/O happens on asyncio streams."""
+
+    class CommandBuilder(gmp_class):
+        def send_command(self, cmd: str) -> str:
+            return cmd
+
+    return CommandBuilder(None)
+
+
+def _gmp_class_for_version(version: str):
+    major, minor = (int(part) for part in version.split(".", 1))
+    if major == 20:
+        return Gmpv208
+    if major == 21 and minor == 4:
+        return Gmpv214
+    if major == 22 and minor == 4:
+        return Gmpv224
+    raise GvmError(
+        "Remote manager daemon uses an unsupported version of GMP. "
+        f"The GMP version was {major}.{minor}"
+    )
+
+
+def default_ssl_context() -> ssl.SSLContext:
+    # Same behaviour as gvm.connections.TLSConnection without client certificates
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class _ResponseTracker:
+    """lxml parser target that keeps the root element and notices the end of
+    the response, without building the rest of the tree."""
+
+    def __init__(self):
+        self.root: Optional[etree._Element] = None
+        self.depth = 0
+        self.complete = False
+
+    def start(self, tag, attrib):
+        if self.depth == 0:
+            self.root = etree.Element(tag, attrib)
+        self.depth += 1
+
+    def end(self, tag):
+        self.depth -= 1
+        if self.depth == 0:
+            self.complete = True
+
+    def close(self):
+        return None
+
+
+class AsyncGmp:
+    """GMP over an asyncio stream (TLS or Unix socket).
+
+    Any python-gvm command is available as a coroutine, e.g.
+    ``await gmp.get_tasks(filter_string="rows=10")``, and returns the root
+    element of the parsed response, as python-gvm's ``EtreeTransform`` does.
+    The response is parsed while it is read, so it is parsed only once.
+    """
+
+    def __init__(
+        self,
+        hostname: Optional[str] = None,
+        port: Optional[int] = None,
+        path: Optional[str] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        timeout: float = 60.0,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.path = path
+        self.ssl_context = ssl_context
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._builder = None
+        self._authenticated = False
+        self._lock = asyncio.Lock()
+
+    # ---------------------- connection ----------------------
+
+    def is_connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    def is_authenticated(self) -> bool:
+        return self._authenticated
+
+    async def connect(self) -> None:
+        if self.is_connected():
+            return
+        if self.path:
+            opening = asyncio.open_unix_connection(self.path)
+        else:
+            opening = asyncio.open_connection(
+                self.hostname,
+                self.port,
+                ssl=self.ssl_context or default_ssl_context(),
+            )
+        started = time.perf_counter()
+        try:
+            self._reader, self._writer = await asyncio.wait_for(opening, self.timeout)
+        except Exception as e:
+            GMP_ERRORS.inc("connect", type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - started
+        GMP_CONNECT_SECONDS.observe(elapsed)
+        add_to_profile("connect", elapsed)
+        self._authenticated = False
+        if self._builder is None:
+            response = await self._exchange(XmlCommand("get_version").to_string())
+            version = response.findtext("version")
+            if not version:
+                raise GvmError(
+                    "Invalid response from manager daemon while requesting the "
+                    "version information."
+                )
+            self._builder = _command_builder(_gmp_class_for_version(version))
+
+    async def disconnect(self) -> None:
+        writer, self._writer, self._reader = self._writer, None, None
+        self._authenticated = False
+        if writer is None:
+            return
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+    async def _read_response(self, timer: _CommandTimer) -> etree._Element:
+        """Reads one response and returns its root element.
+
+        Each chunk is fed to the parser as it arrives. The response is over
+        once a chunk ends with the root's closing tag, which is cheaper to
+        spot than following every element's events; the parser still checks
+        the whole document when it is closed. ``self.timeout`` applies to
+        each read, as with python-gvm's connections.
+        """
+        parser = etree.XMLParser(huge_tree=True)
+        head = b""
+        end: Optional[bytes] = None
+        parsing = 0.0
+        while True:
+            data = await asyncio.wait_for(self._reader.read(READ_CHUNK), self.timeout)
+            if not data:
+                raise GvmError("Remote closed the connection")
+            timer.received += len(data)
+            started = time.perf_counter()
+            try:
+                parser.feed(data)
+            except etree.ParseError as e:
+                raise GvmError("Cannot parse XML response", e) from None
+            parsing += time.perf_counter() - started
+
+            if end is None:
+                head += data
+                match = _ROOT_START.match(head)
+                if match is None:
+                    continue
+                if match.group(2):
+                    # Self-closing root, e.g. <delete_task_response .../>
+                    complete = not head[match.end():].strip()
+                else:
+                    end = b"</" + match.group(1) + b">"
+                    tail = head
+            else:
+                tail = tail[-len(end):] + data
+            if end is not None:
+                complete = tail.rstrip().endswith(end)
+            if complete:
+                started = time.perf_counter()
+                try:
+                    root = parser.close()
+                except etree.ParseError as e:
+                    raise GvmError("Cannot parse XML response", e) from None
+                observe_phase("parse", parsing + time.perf_counter() - started)
+                return root
+
+    async def _exchange(self, cmd: str) -> etree._Element:
+        with _CommandTimer(cmd) as timer:
+            self._writer.write(cmd.encode())
+            await self._writer.drain()
+            return await self._read_response(timer)
+
+    async def send_command(self, cmd: str) -> etree._Element:
+        async with self._lock:
+            try:
+                if not self.is_connected():
+                    await self.connect()
+                return await self._exchange(cmd)
+            except BaseException:
+                await self.disconnect()
+                raise
+
+    async def iter_elements(self, command: str, tag: str, *args, **kwargs) -> AsyncIterator[etree._Element]:
+        """Sends ``command`` and yields each top-level ``tag`` child of the
+        response as soon as it has been parsed.
+
+        Yielded elements are cleared once the consumer moves on, so memory
+        stays flat however large the response is. The element is only valid
+        until the next iteration.
+        """
+        if self._builder is None:
+            await self.connect()
+        cmd = getattr(self._builder, command)(*args, **kwargs)
+
+        async with self._lock:
+            complete = False
+            try:
+                if not self.is_connected():
+                    await self.connect()
+                with _CommandTimer(cmd) as timer:
+                    self._writer.write(cmd.encode())
+                    await self._writer.drain()
+
+                    parser = etree.XMLPullParser(events=("start", "end"), huge_tree=True)
+                    depth = 0
+                    while not complete:
+                        data = await asyncio.wait_for(self._reader.read(READ_CHUNK), self.timeout)
+                        if not data:
+                            raise GvmError("Remote closed the connection")
+                        timer.received += len(data)
+                        try:
+                            parser.feed(data)
+                        except etree.ParseError as e:
+                            raise GvmError("Cannot parse XML response", e) from None
+                        for action, element in parser.read_events():
+                            if action == "start":
+                                depth += 1
+                                if depth == 1:
+                                    check_command_status(element)
+                                continue
+                            depth -= 1
+                            if depth == 0:
+                                complete = True
+                            elif depth == 1 and element.tag == tag:
+                                yield element
+                                element.clear()
+                                element.getparent().remove(element)
+            finally:
+                # A half-read response would corrupt the next command
+                if not complete:
+                    await self.disconnect()
+
+    async def iter_raw(self, command: str, *args, **kwargs) -> AsyncIterator[bytes]:
+        """Sends ``command`` and yields the response bytes as they arrive.
+
+        The response status is checked before the first chunk is yielded;
+        apart from that the body is only scanned for the end of the root
+        element, not built into a tree.
+        """
+        if self._builder is None:
+            await self.connect()
+        cmd = getattr(self._builder, command)(*args, **kwargs)
+
+        async with self._lock:
+            tracker = _ResponseTracker()
+            try:
+                if not self.is_connected():
+                    await self.connect()
+                with _CommandTimer(cmd) as timer:
+                    self._writer.write(cmd.encode())
+                    await self._writer.drain()
+
+                    parser = etree.XMLParser(target=tracker, huge_tree=True)
+                    checked = False
+                    while not tracker.complete:
+                        data = await asyncio.wait_for(self._reader.read(READ_CHUNK), self.timeout)
+                        if not data:
+                            raise GvmError("Remote closed the connection")
+                        timer.received += len(data)
+                        try:
+                            parser.feed(data)
+                        except etree.ParseError as e:
+                            raise GvmError("Cannot parse XML response", e) from None
+                        if not checked and tracker.root is not None:
+                            check_command_status(tracker.root)
+                            checked = True
+                        yield data
+            finally:
+                if not tracker.complete:
+                    await self.disconnect()
+
+    # ---------------------- commands ----------------------
+
+    async def authenticate(self, username: str, password: str) -> etree._Element:
+        cmd = XmlCommand("authenticate")
+        credentials = cmd.add_element("credentials")
+        credentials.add_element("username", username)
+        credentials.add_element("password", password)
+        started = time.perf_counter()
+        response = await self.send_command(cmd.to_string())
+        elapsed = time.perf_counter() - started
+        GMP_AUTH_SECONDS.observe(elapsed)
+        add_to_profile("auth", elapsed)
+        check_command_status(response)
+        self._authenticated = True
+        return response
+
+    async def get_version(self) -> etree._Element:
+        return await self.send_command(XmlCommand("get_version").to_string())
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def command(*args, **kwargs):
+            if self._builder is None:
+                await self.connect()
+            return await self.send_command(getattr(self._builder, name)(*args, **kwargs))
+
+        command.__name__ = name
+        return command
+
+
+class PoolTimeout(Exception):
+    """Raised when no GMP session becomes available within the checkout timeout."""
+
+
+class PooledSession:
+    """A long-lived, authenticated GMP session owned by an AsyncGmpPool."""
+
+    def __init__(self, gmp: AsyncGmp):
+        self.gmp = gmp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # Set when gvmd answered 401, i.e. dropped our authenticated session
+        self.needs_auth = False
+
+
+class AsyncGmpPool:
+    """Bounded pool of pre-authenticated asyncio GMP sessions.
+
+    Handlers borrow a session with ``async with pool.session() as gmp:``.
+    Sessions idle longer than ``health_check_after`` seconds are pinged before
+    being handed out, sessions older than ``max_lifetime`` are recycled, and
+    sessions whose socket broke during use are discarded.
+
+    ``max_size`` is also the cap on concurrent commands sent to gvmd: requests
+    beyond it wait as coroutines (not threads) for up to ``checkout_timeout``.
+    """
+
+    def __init__(
+        self,
+        factory,
+        username: str,
+        password: str,
+        max_size: int = 8,
+        checkout_timeout: float = 30.0,
+        health_check_after: float = 30.0,
+        max_lifetime: float = 3600.0,
+    ):
+        self._factory = factory
+        self._username = username
+        self._password = password
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.max_lifetime = max_lifetime
+
+        self._idle: List[PooledSession] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_use = 0
+        self._size = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._reauths = 0
+        self._discarded = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_size)
+        return self._slots
+
+    async def _open(self) -> PooledSession:
+        gmp = self._factory()
+        try:
+            await gmp.connect()
+            await gmp.authenticate(self._username, self._password)
+        except BaseException:
+            await gmp.disconnect()
+            raise
+        return PooledSession(gmp)
+
+    async def _is_healthy(self, session: PooledSession) -> bool:
+        gmp = session.gmp
+        now = time.monotonic()
+        if now - session.created_at > self.max_lifetime or not gmp.is_connected():
+            return False
+        if now - session.last_used > self.health_check_after:
+            try:
+                await gmp.get_version()
+            except Exception:
+                return False
+        return gmp.is_connected()
+
+    async def acquire(self, timeout: Optional[float] = None) -> PooledSession:
+        timeout = self.checkout_timeout if timeout is None else timeout
+        slots = self._semaphore()
+        started = time.monotonic()
+        waited = slots.locked()
+        try:
+            if waited:
+                await asyncio.wait_for(slots.acquire(), timeout)
+            else:
+                await slots.acquire()
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            GMP_ERRORS.inc("checkout", "PoolTimeout")
+            raise PoolTimeout(
+                f"No GMP session available after {timeout:.1f}s "
+                f"({self._in_use}/{self.max_size} in use)"
+            ) from None
+
+        self._in_use += 1
+        self._checkouts += 1
+        if waited:
+            wait = time.monotonic() - started
+            GMP_POOL_WAIT_SECONDS.observe(wait)
+            add_to_profile("pool_wait", wait)
+            self._waits += 1
+            self._wait_time += wait
+            self._max_wait = max(self._max_wait, wait)
+
+        session = self._idle.pop() if self._idle else None
+        try:
+            if session is not None and not await self._is_healthy(session):
+                await session.gmp.disconnect()
+                self._size -= 1
+                self._reconnects += 1
+                session = None
+            if session is None:
+                session = await self._open()
+                self._size += 1
+            elif session.needs_auth or not session.gmp.is_authenticated():
+                await session.gmp.authenticate(self._username, self._password)
+                session.needs_auth = False
+                self._reauths += 1
+        except BaseException:
+            if session is not None:
+                await session.gmp.disconnect()
+                self._size -= 1
+            self._in_use -= 1
+            slots.release()
+            raise
+        return session
+
+    async def release(self, session: PooledSession, discard: bool = False) -> None:
+        gmp = session.gmp
+        self._in_use -= 1
+        if discard or not gmp.is_connected():
+            await gmp.disconnect()
+            self._size -= 1
+            self._discarded += 1
+        else:
+            session.last_used = time.monotonic()
+            self._idle.append(session)
+        self._semaphore().release()
+
+    @asynccontextmanager
+    async def session(self, timeout: Optional[float] = None):
+        pooled = await self.acquire(timeout)
+        discard = False
+        try:
+            yield pooled.gmp
+        except GvmResponseError as e:
+            if e.status == "401":
+                pooled.needs_auth = True
+            raise
+        except (OSError, EOFError, asyncio.TimeoutError, asyncio.CancelledError):
+            discard = True
+            raise
+        except GvmError as e:
+            discard = type(e) is GvmError
+            raise
+        finally:
+            await self.release(pooled, discard=discard)
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        self._size -= len(idle)
+        for session in idle:
+            await session.gmp.disconnect()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_size": self.max_size,
+            "size": self._size,
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "checkouts": self._checkouts,
+            "waits": self._waits,
+            "wait_time_total": round(self._wait_time, 6),
+            "wait_time_avg": round(self._wait_time / self._waits, 6) if self._waits else 0.0,
+            "wait_time_max": round(self._max_wait, 6),
+            "timeouts": self._timeouts,
+            "reconnects": self._reconnects,
+            "reauths": self._reauths,
+            "discarded": self._discarded,
+        }
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List
+
+from gvm.errors import GvmResponseError
+
+
+def error_status(e: Exception) -> int:
+    """The HTTP status an item failing with ``e`` gets.
+
+    HTTPExceptions keep theirs, gvmd's error responses keep the status gvmd
+    answered with (400 for a duplicate name, 404 for an unknown id, ...),
+    anything else counts as a 500.
+    """
+    if isinstance(e, GvmResponseError) and str(e.status).isdigit() and 400 <= int(e.status) < 600:
+        return int(e.status)
+    return getattr(e, "status_code", 500)
+
+
+async def run_batch(
+    items: Iterable[Any],
+    worker: Callable[[Any], Awaitable[Dict[str, Any]]],
+    concurrency: int,
+) -> Dict[str, Any]:
+    """Runs ``worker`` over ``items`` with at most ``concurrency`` in flight.
+
+    A failing item is reported in its own entry, with the HTTP status it
+    would have had on its own, instead of failing the batch. Entries keep the order of ``items``.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_one(index: int, item: Any) -> Dict[str, Any]:
+        async with slots:
+            try:
+                return {"index": index, "ok": True, **await worker(item)}
+            except Exception as e:
+                return {
+                    "index": index,
+                    "ok": False,
+                    "status": error_status(e),
+                    "error": getattr(e, "detail", None) or getattr(e, "message", None) or str(e) or type(e).__name__,
+                }
+
+    results: List[Dict[str, Any]] = await asyncio.gather(
+        *(run_one(index, item) for index, item in enumerate(items))
+    )
+    succeeded = sum(1 for result in results if result["ok"])
+    return {
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }
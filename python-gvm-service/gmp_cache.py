@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from gmp_metrics import timed
+
+# Listings embed names of related entities (a task shows its target and
+# schedule, a target and a schedule list their tasks), so a write to one
+# entity also invalidates the entries of these.
+DEPENDENTS = {
+    "target": ("task",),
+    "schedule": ("task",),
+    "task": ("target", "schedule"),
+}
+
+LIST = "*"
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "expires")
+
+    def __init__(self, body: bytes, ttl: float):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.expires = time.monotonic() + ttl
+
+
+class LoadingCache(ABC):
+    """In-process read-through cache.
+
+    Keys are ``(entity, id, *variant)`` tuples. Each entity has its own TTL
+    (entities without one are not cached), the total size of the entries
+    (see ``_size``) is LRU-bounded by ``max_size``, and concurrent misses for
+    one key share a single load. Subclasses turn loaded data into entries,
+    which carry their ``expires`` time.
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_size: int):
+        self.ttls = ttls
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._loading: Dict[Tuple, asyncio.Future] = {}
+        self._used = 0
+        # Bumped on invalidation so loads that started earlier are not stored
+        self._generation: Dict[str, int] = {}
+
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._coalesced = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @abstractmethod
+    def _entry(self, data: Any, ttl: float) -> Any:
+        """The entry stored for freshly loaded ``data``."""
+
+    def _size(self, entry: Any) -> int:
+        return 1
+
+    async def get_or_load(
+        self,
+        key: Tuple[Hashable, ...],
+        load: Callable[[], Awaitable[Any]],
+        ttl_for: Optional[Callable[[Any, float], float]] = None,
+    ) -> Any:
+        """``ttl_for(data, ttl)`` can shorten or disable (0) caching of a
+        particular value once it has been loaded."""
+        entity = key[0]
+        ttl = self.ttls.get(entity)
+        if not ttl:
+            return self._entry(await load(), 0)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            self._entries.move_to_end(key)
+            self._hits[entity] = self._hits.get(entity, 0) + 1
+            return entry
+
+        pending = self._loading.get(key)
+        if pending is not None:
+            self._coalesced += 1
+            self._hits[entity] = self._hits.get(entity, 0) + 1
+            return await asyncio.shield(pending)
+
+        self._misses[entity] = self._misses.get(entity, 0) + 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        generation = self._generation.get(entity, 0)
+        try:
+            data = await load()
+            if ttl_for is not None:
+                ttl = ttl_for(data, ttl)
+            entry = self._entry(data, ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            del self._loading[key]
+
+        if ttl and self._generation.get(entity, 0) == generation:
+            self._store(key, entry)
+        future.set_result(entry)
+        return entry
+
+    def _store(self, key: Tuple, entry: Any) -> None:
+        size = self._size(entry)
+        if size > self.max_size:
+            return
+        self._pop(key)
+        self._entries[key] = entry
+        self._used += size
+        while self._used > self.max_size:
+            self._pop(next(iter(self._entries)))
+            self._evictions += 1
+
+    def _pop(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._used -= self._size(entry)
+
+    def _drop(self, entity: str, match: Callable[[Tuple], bool]) -> None:
+        """Drops the entries of ``entity`` whose key matches and keeps loads
+        of it that are under way from being stored."""
+        self._generation[entity] = self._generation.get(entity, 0) + 1
+        stale = [key for key in self._entries if key[0] == entity and match(key)]
+        for key in stale:
+            self._pop(key)
+        self._invalidations += len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._used = 0
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(self._hits.values())
+        misses = sum(self._misses.values())
+        return {
+            "entries": len(self._entries),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "coalesced": self._coalesced,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+            "loading": len(self._loading),
+            "by_entity": {
+                entity: {"hits": self._hits.get(entity, 0), "misses": self._misses.get(entity, 0)}
+                for entity in sorted(set(self._hits) | set(self._misses))
+            },
+        }
+
+
+class ResponseCache(LoadingCache):
+    """Serialized JSON responses, bounded to ``max_entries`` entries."""
+
+    def __init__(self, ttls: Dict[str, float], max_entries: int = 1024):
+        super().__init__(ttls, max_entries)
+
+    def _entry(self, data: Any, ttl: float) -> CacheEntry:
+        return CacheEntry(_serialize(data), ttl)
+
+    def invalidate(self, entity: str, entity_id: Optional[str] = None) -> None:
+        """Drops the listings of ``entity``, the entry of ``entity_id`` (or
+        every entry of the entity when no id is given) and the entries of
+        dependent entities."""
+        self._drop(entity, lambda key: entity_id is None or key[1] in (LIST, entity_id))
+        for dependent in DEPENDENTS.get(entity, ()):
+            self._drop(dependent, lambda key: True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "max_entries": self.max_size}
+
+
+@timed("serialize")
+def _serialize(data: Any) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates: Iterable[str] = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag == "*" or tag.removeprefix("W/") == etag for tag in candidates)
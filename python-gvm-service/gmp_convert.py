@@ -0,0 +1,383 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lxml import etree
+
+from gmp_metrics import timed
+
+
+@timed("convert")
+def element_to_dict(element: etree._Element) -> Dict[str, Any]:
+    """Recursively converts an XML element into a dictionary, handling repeated tags."""
+    return _element_to_dict(element)
+
+
+def _element_to_dict(element: etree._Element) -> Dict[str, Any]:
+    result = {}
+    for child in element:
+        child_dict = _element_to_dict(child) if len(child) else child.text
+        if child.tag in result:
+            if not isinstance(result[child.tag], list):
+                result[child.tag] = [result[child.tag]]
+            result[child.tag].append(child_dict)
+        else:
+            result[child.tag] = child_dict
+    result.update(element.attrib)
+    return result
+
+# ---------------------- schemas ----------------------
+#
+# A schema maps child tags to a type (str, int, float), a nested schema
+# (object) or a one-element list holding a nested schema (repeated element).
+# "@name" reads an attribute and "#text" the element's own text, which is
+# emitted under the "text" key. Anything not listed is skipped.
+
+NAMED = {"@id": str, "name": str}
+OWNER = {"name": str}
+COUNT = {"#text": int, "filtered": int, "page": int}
+DETAILS = {"detail": [{"name": str, "value": str}]}
+TASK_REFS = {"task": [NAMED]}
+
+RESULT = {
+    "@id": str,
+    "name": str,
+    "owner": OWNER,
+    "comment": str,
+    "creation_time": str,
+    "modification_time": str,
+    "task": NAMED,
+    "report": {"@id": str},
+    "host": {"#text": str, "asset": {"@asset_id": str}, "hostname": str},
+    "port": str,
+    "nvt": {
+        "@oid": str,
+        "type": str,
+        "name": str,
+        "family": str,
+        "cvss_base": float,
+        "severities": {
+            "@score": float,
+            "severity": [{"@type": str, "origin": str, "date": str, "score": float, "value": str}],
+        },
+        "tags": str,
+        "solution": {"@type": str, "@method": str, "#text": str},
+        "refs": {"ref": [{"@type": str, "@id": str}]},
+    },
+    "scan_nvt_version": str,
+    "threat": str,
+    "severity": float,
+    "qod": {"value": int, "type": str},
+    "description": str,
+    "original_threat": str,
+    "original_severity": float,
+    "notes": {"note": [{"@id": str, "text": str, "active": int}]},
+    "overrides": {"override": [{"@id": str, "text": str, "new_severity": float, "active": int}]},
+    "detection": {"result": {"@id": str, "details": DETAILS}},
+}
+
+REPORT_REF = {
+    "@id": str,
+    "timestamp": str,
+    "scan_start": str,
+    "scan_end": str,
+    "result_count": {"hole": int, "warning": int, "info": int, "log": int, "false_positive": int},
+    "severity": float,
+}
+
+TASK = {
+    "@id": str,
+    "name": str,
+    "owner": OWNER,
+    "comment": str,
+    "creation_time": str,
+    "modification_time": str,
+    "writable": int,
+    "in_use": int,
+    "alterable": int,
+    "usage_type": str,
+    "config": {"@id": str, "name": str, "trash": int},
+    "target": {"@id": str, "name": str, "trash": int},
+    "hosts_ordering": str,
+    "scanner": {"@id": str, "name": str, "type": int},
+    "alert": [NAMED],
+    "observers": str,
+    "schedule": {"@id": str, "name": str, "trash": int, "icalendar": str, "timezone": str},
+    "schedule_periods": int,
+    "status": str,
+    "progress": int,
+    "report_count": {"#text": int, "finished": int},
+    "trend": str,
+    "average_duration": int,
+    "current_report": {"report": REPORT_REF},
+    "last_report": {"report": REPORT_REF},
+    "preferences": {"preference": [{"name": str, "scanner_name": str, "value": str}]},
+}
+
+CREDENTIAL_REF = {"@id": str, "name": str, "port": int, "trash": int}
+
+TARGET = {
+    "@id": str,
+    "name": str,
+    "owner": OWNER,
+    "comment": str,
+    "creation_time": str,
+    "modification_time": str,
+    "writable": int,
+    "in_use": int,
+    "hosts": str,
+    "exclude_hosts": str,
+    "max_hosts": int,
+    "port_list": {"@id": str, "name": str, "trash": int},
+    "ssh_credential": CREDENTIAL_REF,
+    "smb_credential": CREDENTIAL_REF,
+    "esxi_credential": CREDENTIAL_REF,
+    "snmp_credential": CREDENTIAL_REF,
+    "reverse_lookup_only": int,
+    "reverse_lookup_unify": int,
+    "alive_tests": str,
+    "allow_simultaneous_ips": int,
+    "tasks": TASK_REFS,
+}
+
+SCHEDULE = {
+    "@id": str,
+    "name": str,
+    "owner": OWNER,
+    "comment": str,
+    "creation_time": str,
+    "modification_time": str,
+    "writable": int,
+    "in_use": int,
+    "icalendar": str,
+    "timezone": str,
+    "tasks": TASK_REFS,
+}
+
+REPORT = {
+    "@id": str,
+    "@format_id": str,
+    "@extension": str,
+    "@content_type": str,
+    "owner": OWNER,
+    "name": str,
+    "comment": str,
+    "creation_time": str,
+    "modification_time": str,
+    "task": NAMED,
+    "report_format": NAMED,
+    "report": {
+        "@id": str,
+        "scan_run_status": str,
+        "timestamp": str,
+        "scan_start": str,
+        "scan_end": str,
+        "timezone": str,
+        "hosts": {"count": int},
+        "vulns": {"count": int},
+        "ports": {"count": int},
+        "result_count": {
+            "#text": int,
+            "full": int,
+            "filtered": int,
+            "hole": {"full": int, "filtered": int},
+            "warning": {"full": int, "filtered": int},
+            "info": {"full": int, "filtered": int},
+            "log": {"full": int, "filtered": int},
+            "false_positive": {"full": int, "filtered": int},
+        },
+        "severity": {"full": float, "filtered": float},
+        "results": {"@start": int, "@max": int, "result": [RESULT]},
+        "host": [{"ip": str, "start": str, "end": str, "detail": [{"name": str, "value": str}]}],
+    },
+}
+
+# entity name, which is also its XML tag -> schema
+ENTITIES = {
+    "result": RESULT,
+    "task": TASK,
+    "target": TARGET,
+    "schedule": SCHEDULE,
+    "report": REPORT,
+}
+
+
+def response_schema(entity: str, entity_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Envelope shared by get_<entity>s and get_<entity> responses."""
+    return {
+        "@status": str,
+        "@status_text": str,
+        entity: [entity_schema],
+        "filters": {"@id": str, "term": str},
+        f"{entity}s": {"@start": int, "@max": int},
+        f"{entity}_count": COUNT,
+    }
+
+# ---------------------- compilation ----------------------
+
+class _Node:
+    __slots__ = ("attrs", "text", "children", "template", "list_keys")
+
+    def __init__(self):
+        self.attrs: List[Tuple[str, str, Callable]] = []
+        self.text: Optional[Tuple[str, Callable]] = None
+        # tag -> (output key, is list, scalar type, nested node)
+        self.children: Dict[str, Tuple[str, bool, Optional[Callable], Optional["_Node"]]] = {}
+        self.template: Dict[str, Any] = {}
+        self.list_keys: Tuple[str, ...] = ()
+
+    def empty(self) -> Dict[str, Any]:
+        out = self.template.copy()
+        for key in self.list_keys:
+            out[key] = []
+        return out
+
+
+def _scalar(kind: Callable, text: Optional[str]) -> Any:
+    if text is None or kind is str:
+        return text
+    try:
+        return kind(text)
+    except ValueError:
+        return None
+
+
+def compile_schema(schema: Dict[str, Any]) -> _Node:
+    node = _Node()
+    list_keys = []
+    for name, spec in schema.items():
+        if name == "#text":
+            node.text = ("text", spec)
+            node.template["text"] = None
+            continue
+        if name.startswith("@"):
+            node.attrs.append((name[1:], name[1:], spec))
+            node.template[name[1:]] = None
+            continue
+        is_list = isinstance(spec, list)
+        inner = spec[0] if is_list else spec
+        sub = compile_schema(inner) if isinstance(inner, dict) else None
+        node.children[name] = (name, is_list, None if sub else inner, sub)
+        if is_list:
+            list_keys.append(name)
+        node.template[name] = None
+    node.list_keys = tuple(list_keys)
+    return node
+
+
+def _project(schema: Dict[str, Any], paths: List[List[str]], prefix: str = "") -> Dict[str, Any]:
+    """Keeps only the fields named by ``paths`` (output names, dotted)."""
+    wanted: Dict[str, List[List[str]]] = {}
+    for path in paths:
+        wanted.setdefault(path[0], []).append(path[1:])
+
+    projected = {}
+    unknown = []
+    for name, spec in schema.items():
+        key = "text" if name == "#text" else name.lstrip("@")
+        if key not in wanted:
+            continue
+        rest = wanted.pop(key)
+        inner = spec[0] if isinstance(spec, list) else spec
+        if not isinstance(inner, dict):
+            unknown.extend(f"{prefix}{key}.{'.'.join(sub)}" for sub in rest if sub)
+        elif all(rest):
+            inner = _project(inner, rest, f"{prefix}{key}.")
+            spec = [inner] if isinstance(spec, list) else inner
+        projected[name] = spec
+    unknown.extend(prefix + key for key in wanted)
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+    return projected
+
+
+# fields=* converts every field of the schema, typed
+ALL_FIELDS = "*"
+
+
+def _entity_schema(entity: str, fields: Optional[str]) -> Dict[str, Any]:
+    if entity not in ENTITIES:
+        raise ValueError(f"No schema for entity '{entity}'")
+    schema = ENTITIES[entity]
+    if fields and fields != ALL_FIELDS:
+        paths = [f.strip().split(".") for f in fields.split(",") if f.strip()]
+        schema = _project(schema, paths)
+    return schema
+
+
+@lru_cache(maxsize=128)
+def compiled_entity(entity: str, fields: Optional[str] = None) -> _Node:
+    return compile_schema(_entity_schema(entity, fields))
+
+
+@lru_cache(maxsize=128)
+def compiled_response(entity: str, fields: Optional[str] = None) -> _Node:
+    return compile_schema(response_schema(entity, _entity_schema(entity, fields)))
+
+
+def validate_fields(entity: str, fields: Optional[str]) -> None:
+    """Raises ValueError for unknown entities or field names."""
+    compiled_entity(entity, fields)
+
+# ---------------------- conversion ----------------------
+
+def convert(element: etree._Element, node: _Node) -> Dict[str, Any]:
+    """Converts ``element`` following a compiled schema, without recursion.
+
+    Every key of the schema is present in the output: missing scalars and
+    objects are None, repeated elements are always lists.
+    """
+    out = node.empty()
+    stack = [(element, node, out)]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        el, node, target = pop()
+        if node.attrs:
+            get = el.get
+            for attr, key, kind in node.attrs:
+                target[key] = _scalar(kind, get(attr))
+        if node.text is not None:
+            key, kind = node.text
+            text = el.text
+            target[key] = _scalar(kind, text.strip() or None) if text is not None else None
+        get_spec = node.children.get
+        for child in el:
+            spec = get_spec(child.tag)
+            if spec is None:
+                continue
+            key, is_list, kind, sub = spec
+            if sub is None:
+                value = child.text
+                if value is not None and kind is not str:
+                    value = _scalar(kind, value)
+            else:
+                value = sub.template.copy()
+                for list_key in sub.list_keys:
+                    value[list_key] = []
+                push((child, sub, value))
+            if is_list:
+                target[key].append(value)
+            else:
+                target[key] = value
+    return out
+
+
+def convert_entity(element: etree._Element, entity: str, fields: Optional[str] = None) -> Dict[str, Any]:
+    """Converts a single <result>, <task>, ... element.
+
+    Without ``fields`` the output has element_to_dict's shape, which API
+    clients rely on; with ``fields`` only those are converted, following
+    the entity's schema, and ``fields=*`` converts all of it.
+    """
+    if not fields:
+        return _element_to_dict(element)
+    return convert(element, compiled_entity(entity, fields))
+
+
+@timed("convert")
+def convert_response(element: etree._Element, entity: str, fields: Optional[str] = None) -> Dict[str, Any]:
+    """Converts a get_<entity>s / get_<entity> response root element, like
+    ``convert_entity``."""
+    if not fields:
+        return _element_to_dict(element)
+    return convert(element, compiled_response(entity, fields))
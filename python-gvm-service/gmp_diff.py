@@ -0,0 +1,217 @@
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from gmp_cache import LoadingCache
+from gmp_summary import RESULT_FIELDS, ResultColumns
+
+CHANGES = ("new", "resolved", "changed")
+CHANGES_PATTERN = f"^({'|'.join(CHANGES)})(,({'|'.join(CHANGES)}))*$"
+# Fields of the results a ReportIndexBuilder takes
+INDEX_FIELDS = "id," + RESULT_FIELDS
+
+# Odd multiplier mixing the per-field hashes into one fingerprint
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _hashes(values: List[Optional[str]], field: bytes) -> np.ndarray:
+    """64-bit hash of each value, salted per field."""
+    digests = b"".join(
+        hashlib.blake2b((value or "").encode(), digest_size=8, person=field).digest() for value in values
+    )
+    return np.frombuffer(digests, dtype=np.uint64)
+
+
+class ReportIndex:
+    """The findings of one report keyed by fingerprint, for diffing.
+
+    A finding's fingerprint is a 64-bit hash of its host, port and NVT OID.
+    Fingerprints are kept sorted and unique, the other columns are in the
+    same order; of duplicate findings the most severe one is kept.
+    """
+
+    def __init__(self, report_id: str, task_id: Optional[str], scan_run_status: Optional[str]):
+        self.report_id = report_id
+        self.task_id = task_id
+        self.scan_run_status = scan_run_status
+        self.fingerprints = np.empty(0, dtype=np.uint64)
+        self.severity = np.empty(0, dtype=np.float32)
+        self.host = np.empty(0, dtype=np.int32)
+        self.port = np.empty(0, dtype=np.int32)
+        self.nvt = np.empty(0, dtype=np.int32)
+        self.result_ids: List[str] = []
+        self.hosts: List[Optional[str]] = []
+        self.ports: List[Optional[str]] = []
+        self.nvts: List[Optional[str]] = []
+        self.nvt_names: List[Optional[str]] = []
+        self.duplicates = 0
+        # Rough memory use, for the cache bound; set by ReportIndexBuilder.build
+        self.nbytes = 0
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def finding(self, row: int) -> Dict[str, Any]:
+        return {
+            "result_id": self.result_ids[row],
+            "host": self.hosts[self.host[row]],
+            "port": self.ports[self.port[row]],
+            "nvt": {"oid": self.nvts[self.nvt[row]], "name": self.nvt_names[self.nvt[row]]},
+            "severity": round(float(self.severity[row]), 1),
+        }
+
+
+class ReportIndexBuilder:
+    """Collects a report's results, converted with INDEX_FIELDS, into
+    gmp_summary.ResultColumns and turns them into a ReportIndex.
+    ``global_id`` maps gvmd result ids to the ids the API hands out."""
+
+    def __init__(
+        self,
+        report_id: str,
+        task_id: Optional[str],
+        scan_run_status: Optional[str],
+        global_id: Callable[[str], str],
+    ):
+        self.index = ReportIndex(report_id, task_id, scan_run_status)
+        self.global_id = global_id
+        self.columns = ResultColumns()
+        self._ids: List[str] = []
+
+    def append(self, result: Dict[str, Any]) -> None:
+        self._ids.append(self.global_id(result["id"]))
+        self.columns.append(result)
+
+    def build(self) -> ReportIndex:
+        index = self.index
+        columns = self.columns
+        index.hosts = list(columns.hosts)
+        index.ports = list(columns.ports)
+        index.nvts = list(columns.nvts)
+        index.nvt_names = columns.nvt_names
+        if self._ids:
+            self._deduplicate(index)
+        arrays = sum(a.nbytes for a in (index.fingerprints, index.severity, index.host, index.port, index.nvt))
+        strings = sum(len(value or "") + 50 for values in (index.hosts, index.ports, index.nvts, index.nvt_names)
+                      for value in values)
+        index.nbytes = arrays + strings + 100 * len(index.result_ids)
+        return index
+
+    def _deduplicate(self, index: ReportIndex) -> None:
+        columns = self.columns
+        host = np.frombuffer(columns.host, dtype=np.int32)
+        port = np.frombuffer(columns.port, dtype=np.int32)
+        nvt = np.frombuffer(columns.nvt, dtype=np.int32)
+        severity = np.frombuffer(columns.severity, dtype=np.float32)
+        # Hashed once per distinct value, then mixed per finding
+        fingerprints = (
+            (_hashes(index.hosts, b"host")[host] * _MIX + _hashes(index.ports, b"port")[port]) * _MIX
+            + _hashes(index.nvts, b"nvt")[nvt]
+        )
+        # By fingerprint, most severe first, keeping the first of each
+        order = np.lexsort((-severity, fingerprints))
+        ordered = fingerprints[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = ordered[1:] != ordered[:-1]
+        rows = order[first]
+        index.fingerprints = ordered[first]
+        index.severity = severity[rows]
+        index.host = host[rows]
+        index.port = port[rows]
+        index.nvt = nvt[rows]
+        index.result_ids = [self._ids[row] for row in rows.tolist()]
+        index.duplicates = len(order) - len(rows)
+
+
+class ReportDiff:
+    """Rows of the compare report that are new or changed severity, and
+    rows of the base report that are resolved."""
+
+    def __init__(self, base: ReportIndex, compare: ReportIndex):
+        self.base = base
+        self.compare = compare
+        if len(base):
+            position = np.minimum(np.searchsorted(base.fingerprints, compare.fingerprints), len(base) - 1)
+            found = base.fingerprints[position] == compare.fingerprints
+        else:
+            position = np.zeros(len(compare), dtype=np.intp)
+            found = np.zeros(len(compare), dtype=bool)
+        self.new = np.nonzero(~found)[0]
+        matched_compare = np.nonzero(found)[0]
+        matched_base = position[found]
+        differs = base.severity[matched_base] != compare.severity[matched_compare]
+        self.changed_compare = matched_compare[differs]
+        self.changed_base = matched_base[differs]
+        self.unchanged = int(len(matched_compare) - differs.sum())
+        kept = np.ones(len(base), dtype=bool)
+        kept[matched_base] = False
+        self.resolved = np.nonzero(kept)[0]
+
+    def counts(self) -> Dict[str, int]:
+        return {
+            "new": len(self.new),
+            "resolved": len(self.resolved),
+            "changed": len(self.changed_compare),
+            "unchanged": self.unchanged,
+        }
+
+    @staticmethod
+    def _by_severity(index: ReportIndex, rows: np.ndarray) -> np.ndarray:
+        return np.argsort(-index.severity[rows], kind="stable")
+
+    def findings(self, changes=CHANGES) -> Iterator[Dict[str, Any]]:
+        """The differences, most severe first within each kind of change."""
+        if "new" in changes:
+            for row in self.new[self._by_severity(self.compare, self.new)].tolist():
+                yield {"change": "new", **self.compare.finding(row)}
+        if "resolved" in changes:
+            for row in self.resolved[self._by_severity(self.base, self.resolved)].tolist():
+                yield {"change": "resolved", **self.base.finding(row)}
+        if "changed" in changes:
+            order = self._by_severity(self.compare, self.changed_compare)
+            for row, base_row in zip(self.changed_compare[order].tolist(), self.changed_base[order].tolist()):
+                yield {
+                    "change": "changed",
+                    **self.compare.finding(row),
+                    "previous_severity": round(float(self.base.severity[base_row]), 1),
+                    "previous_result_id": self.base.result_ids[base_row],
+                }
+
+
+class _IndexEntry:
+    __slots__ = ("index", "expires")
+
+    def __init__(self, index: ReportIndex, ttl: float):
+        self.index = index
+        self.expires = time.monotonic() + ttl
+
+
+class ReportIndexCache(LoadingCache):
+    """Report indexes by report id, LRU-bounded by their estimated size."""
+
+    def __init__(self, ttl: float, max_bytes: int):
+        super().__init__({"report": ttl}, max_bytes)
+
+    def _entry(self, index: ReportIndex, ttl: float) -> _IndexEntry:
+        return _IndexEntry(index, ttl)
+
+    def _size(self, entry: _IndexEntry) -> int:
+        return entry.index.nbytes
+
+    async def get_or_load(
+        self,
+        report_id: str,
+        load: Callable[[], Awaitable[ReportIndex]],
+        ttl_for: Optional[Callable[[ReportIndex, float], float]] = None,
+    ) -> ReportIndex:
+        entry = await super().get_or_load(("report", report_id), load, ttl_for)
+        return entry.index
+
+    def invalidate_task(self, task_id: str) -> None:
+        self._drop("report", lambda key: self._entries[key].index.task_id == task_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "bytes": self._used, "max_bytes": self.max_size}
@@ -0,0 +1,277 @@
+from array import array
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from lxml import etree
+
+from gmp_metrics import timed
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+EXPORT_FORMAT_PATTERN = f"^({'|'.join(EXPORT_FORMATS)})$"
+COMPRESSIONS = ("none", "zstd", "lz4")
+COMPRESSION_PATTERN = f"^({'|'.join(COMPRESSIONS)})$"
+
+_STRINGS = pa.dictionary(pa.int32(), pa.string())
+_TIMESTAMP = pa.timestamp("s", tz="UTC")
+
+RESULT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("task_id", _STRINGS),
+    ("report_id", _STRINGS),
+    ("host", _STRINGS),
+    ("hostname", _STRINGS),
+    ("port", _STRINGS),
+    ("port_number", pa.uint16()),
+    ("protocol", _STRINGS),
+    ("nvt_oid", _STRINGS),
+    ("nvt_name", _STRINGS),
+    ("family", _STRINGS),
+    ("cvss_base", pa.float32()),
+    ("severity", pa.float32()),
+    ("threat", _STRINGS),
+    ("qod", pa.uint8()),
+    ("qod_type", _STRINGS),
+    ("creation_time", _TIMESTAMP),
+    ("modification_time", _TIMESTAMP),
+    ("description", pa.string()),
+])
+
+
+class _Dictionary:
+    """Codes of one dictionary-encoded column; -1 stands for null."""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes = array("i")
+        self.values: Dict[str, int] = {}
+
+    def append(self, value: Optional[str]) -> None:
+        if not value:
+            self.codes.append(-1)
+            return
+        code = self.values.get(value)
+        if code is None:
+            code = self.values[value] = len(self.values)
+        self.codes.append(code)
+
+    def indices(self) -> pa.Array:
+        codes = np.frombuffer(self.codes, dtype=np.int32)
+        return pa.array(codes, mask=codes < 0)
+
+    def to_arrow(self, transform: Optional[Callable[[str], str]] = None) -> pa.DictionaryArray:
+        values = list(self.values) if transform is None else [transform(value) for value in self.values]
+        return pa.DictionaryArray.from_arrays(self.indices(), pa.array(values, pa.string()))
+
+
+def _port_number(port: str) -> Optional[int]:
+    number = port.partition("/")[0]
+    return int(number) if number.isdigit() and int(number) < 65536 else None
+
+
+class ResultBatchBuilder:
+    """Collects <result> elements into Arrow record batches of RESULT_SCHEMA.
+
+    Each element is read in one pass over its children into typed buffers:
+    repeated strings become int32 codes into per-batch dictionaries, and
+    numbers and timestamps are kept as text and parsed a column at a time
+    by Arrow. ``global_id`` maps gvmd ids to the ids the API hands out.
+    """
+
+    def __init__(self, global_id: Callable[[str], str]):
+        self.global_id = global_id
+        self._reset()
+
+    def _reset(self) -> None:
+        self.ids: List[str] = []
+        self.task_id = _Dictionary()
+        self.report_id = _Dictionary()
+        self.host = _Dictionary()
+        self.hostname = _Dictionary()
+        self.port = _Dictionary()
+        self.nvt_oid = _Dictionary()
+        self.nvt_name = _Dictionary()
+        self.family = _Dictionary()
+        self.threat = _Dictionary()
+        self.qod_type = _Dictionary()
+        self.cvss_base: List[Optional[str]] = []
+        self.severity: List[Optional[str]] = []
+        self.qod: List[Optional[str]] = []
+        self.creation_time: List[Optional[str]] = []
+        self.modification_time: List[Optional[str]] = []
+        self.description: List[Optional[str]] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, result: etree._Element) -> None:
+        task = report = host = hostname = port = oid = nvt_name = family = None
+        cvss_base = severity = threat = qod = qod_type = None
+        creation_time = modification_time = description = None
+        for child in result:
+            tag = child.tag
+            if tag == "host":
+                host = (child.text or "").strip()
+                hostname = child.findtext("hostname")
+            elif tag == "port":
+                port = child.text
+            elif tag == "nvt":
+                oid = child.get("oid")
+                for field in child:
+                    if field.tag == "name":
+                        nvt_name = field.text
+                    elif field.tag == "family":
+                        family = field.text
+                    elif field.tag == "cvss_base":
+                        cvss_base = field.text
+            elif tag == "severity":
+                severity = child.text
+            elif tag == "threat":
+                threat = child.text
+            elif tag == "qod":
+                qod = child.findtext("value")
+                qod_type = child.findtext("type")
+            elif tag == "description":
+                description = child.text
+            elif tag == "creation_time":
+                creation_time = child.text
+            elif tag == "modification_time":
+                modification_time = child.text
+            elif tag == "task":
+                task = child.get("id")
+            elif tag == "report":
+                report = child.get("id")
+        self.ids.append(self.global_id(result.get("id")))
+        self.task_id.append(task)
+        self.report_id.append(report)
+        self.host.append(host)
+        self.hostname.append(hostname)
+        self.port.append(port)
+        self.nvt_oid.append(oid)
+        self.nvt_name.append(nvt_name)
+        self.family.append(family)
+        self.threat.append(threat)
+        self.qod_type.append(qod_type)
+        # Empty elements are null rather than unparseable
+        self.cvss_base.append(cvss_base or None)
+        self.severity.append(severity or None)
+        self.qod.append(qod or None)
+        self.creation_time.append(creation_time or None)
+        self.modification_time.append(modification_time or None)
+        self.description.append(description)
+
+    @timed("convert")
+    def flush(self) -> Optional[pa.RecordBatch]:
+        """The collected results as one batch, or None if there are none."""
+        if not self.ids:
+            return None
+        port = self.port.to_arrow()
+        # Port number and protocol are worked out once per distinct port
+        protocols = _Dictionary()
+        numbers = []
+        for value in self.port.values:
+            protocols.append(value.partition("/")[2])
+            numbers.append(_port_number(value))
+        indices = port.indices
+        columns = [
+            pa.array(self.ids, pa.string()),
+            self.task_id.to_arrow(self.global_id),
+            self.report_id.to_arrow(self.global_id),
+            self.host.to_arrow(),
+            self.hostname.to_arrow(),
+            port,
+            pa.array(numbers, pa.uint16()).take(indices),
+            pa.DictionaryArray.from_arrays(
+                protocols.indices().take(indices), pa.array(list(protocols.values), pa.string())
+            ),
+            self.nvt_oid.to_arrow(),
+            self.nvt_name.to_arrow(),
+            self.family.to_arrow(),
+            pa.array(self.cvss_base, pa.string()).cast(pa.float32()),
+            pa.array(self.severity, pa.string()).cast(pa.float32()),
+            self.threat.to_arrow(),
+            pa.array(self.qod, pa.string()).cast(pa.uint8()),
+            self.qod_type.to_arrow(),
+            pa.array(self.creation_time, pa.string()).cast(_TIMESTAMP),
+            pa.array(self.modification_time, pa.string()).cast(_TIMESTAMP),
+            pa.array(self.description, pa.string()),
+        ]
+        self._reset()
+        return pa.RecordBatch.from_arrays(columns, schema=RESULT_SCHEMA)
+
+
+class _Sink:
+    """Write-only file object whose contents are taken out piece by piece."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ResultExportWriter:
+    """Turns record batches into an Arrow IPC stream or a Parquet file, one
+    piece of bytes per batch.
+
+    Arrow streams are uncompressed by default so they can be memory-mapped
+    without copies; Parquet defaults to zstd. Each batch brings its own
+    dictionaries (replacement dictionaries in the stream, one row group
+    per batch in Parquet), so memory does not grow with the export.
+    """
+
+    def __init__(self, format: str, compression: Optional[str] = None):
+        self.format = format
+        self._sink = _Sink()
+        file = pa.PythonFile(self._sink, mode="w")
+        if format == "arrow":
+            codec = None if compression in (None, "none") else compression
+            self._writer = pa.ipc.new_stream(file, RESULT_SCHEMA, options=pa.ipc.IpcWriteOptions(compression=codec))
+        elif format == "parquet":
+            self._writer = pq.ParquetWriter(file, RESULT_SCHEMA, compression=compression or "zstd")
+        else:
+            raise ValueError(f"Unknown export format '{format}', expected one of: {', '.join(EXPORT_FORMATS)}")
+
+    @timed("serialize")
+    def write(self, batch: Optional[pa.RecordBatch]) -> bytes:
+        self._write(batch)
+        return self._sink.take()
+
+    def _write(self, batch: Optional[pa.RecordBatch]) -> None:
+        if batch is not None:
+            if self.format == "arrow":
+                self._writer.write_batch(batch)
+            else:
+                self._writer.write_batch(batch, row_group_size=batch.num_rows)
+
+    @timed("serialize")
+    def close(self, batch: Optional[pa.RecordBatch] = None) -> bytes:
+        """Writes the last batch, if any, and the end of the stream or file."""
+        self._write(batch)
+        self._writer.close()
+        return self._sink.take()
@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+# gvmd filter values must not be able to inject further keywords
+FILTER_VALUE_PATTERN = r"^[A-Za-z0-9_.:/\-]+$"
+SORT_PATTERN = r"^-?[a-z_]+$"
+
+# Severities are reported with one decimal and gvmd filters only know a
+# strict ">", so an inclusive minimum is expressed half a step lower.
+SEVERITY_STEP = 0.1
+
+
+def build_results_filter(
+    first: Optional[int] = None,
+    rows: Optional[int] = None,
+    min_severity: Optional[float] = None,
+    host: Optional[str] = None,
+    sort: Optional[str] = None,
+    terms: Optional[List[str]] = None,
+) -> Optional[str]:
+    """Builds a GMP filter string so paging and filtering happen inside gvmd.
+
+    ``sort`` is a field name, prefixed with ``-`` for descending order.
+    Returns None when nothing was requested, which keeps gvmd's defaults.
+    """
+    parts = list(terms or [])
+    if first is not None:
+        parts.append(f"first={first}")
+    if rows is not None:
+        parts.append(f"rows={rows}")
+    if min_severity is not None:
+        parts.append(f"severity>{min_severity - SEVERITY_STEP / 2:.2f}")
+    if host:
+        parts.append(f"host={host}")
+    if sort:
+        if sort.startswith("-"):
+            parts.append(f"sort-reverse={sort[1:]}")
+        else:
+            parts.append(f"sort={sort}")
+    return " ".join(parts) if parts else None
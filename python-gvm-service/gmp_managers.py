@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from gvm.transforms import check_command_status
+
+MANAGER_NAME_PATTERN = r"^[A-Za-z0-9_\-]+$"
+
+# Separates the manager name from the gvmd id, e.g. "scan2.<uuid>"
+ID_SEPARATOR = "."
+
+# Keys holding gvmd entities owned by one manager, either the entities of a
+# response (e.g. "task" in get_tasks) or references to them (task.target.id)
+ENTITY_KEYS = frozenset({"result", "task", "target", "report", "schedule"})
+
+
+class Manager:
+    """One gvmd backend and its session pool.
+
+    Ids of the default manager are passed through unchanged, so a single
+    manager setup keeps the plain gvmd ids; every other manager prefixes
+    its ids with its name.
+    """
+
+    def __init__(self, name: str, pool, prefixed: bool = True):
+        self.name = name
+        self.pool = pool
+        self.prefix = name + ID_SEPARATOR if prefixed else ""
+
+    def global_id(self, local_id: Optional[str]) -> Optional[str]:
+        if not local_id or not self.prefix:
+            return local_id
+        return self.prefix + local_id
+
+    def globalize(self, data: Any) -> Any:
+        """Prefixes the id of the converted entity ``data`` and the ids of
+        the entities it references (see ENTITY_KEYS), in place.
+
+        Other "id" keys, such as NVT refs (CVE ids, URLs), filters and
+        built-in catalog ids, are gvmd data rather than references and are
+        left alone.
+        """
+        if not self.prefix:
+            return data
+        if isinstance(data, dict):
+            self._prefix(data)
+        stack = [data]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                for key, value in item.items():
+                    if key in ENTITY_KEYS:
+                        for ref in value if isinstance(value, list) else (value,):
+                            self._prefix(ref)
+                    if isinstance(value, (dict, list)):
+                        stack.append(value)
+            elif isinstance(item, list):
+                stack.extend(value for value in item if isinstance(value, (dict, list)))
+        return data
+
+    def _prefix(self, entity: Any) -> None:
+        if isinstance(entity, dict):
+            value = entity.get("id")
+            if isinstance(value, str) and value:
+                entity["id"] = self.prefix + value
+
+
+class ManagerRegistry:
+    """The configured gvmd managers, the first one being the default."""
+
+    def __init__(self, managers: List[Manager], placement):
+        for manager in managers:
+            if not re.match(MANAGER_NAME_PATTERN, manager.name):
+                raise ValueError(f"Invalid manager name '{manager.name}'")
+        self.default = managers[0]
+        self.placement = placement
+        self._managers = {manager.name: manager for manager in managers}
+
+    def __iter__(self) -> Iterator[Manager]:
+        return iter(self._managers.values())
+
+    def __len__(self) -> int:
+        return len(self._managers)
+
+    def get(self, name: str) -> Manager:
+        try:
+            return self._managers[name]
+        except KeyError:
+            raise ValueError(f"Unknown manager '{name}'") from None
+
+    def route(self, global_id: str) -> Tuple[Manager, str]:
+        """The manager owning ``global_id`` and the id gvmd knows it by."""
+        name, separator, local_id = global_id.partition(ID_SEPARATOR)
+        manager = self._managers.get(name) if separator else None
+        if manager is not None and manager.prefix:
+            return manager, local_id
+        return self.default, global_id
+
+    def local_ref(self, manager: Manager, global_id: Optional[str]) -> Optional[str]:
+        """Translates a reference used on ``manager``; unprefixed ids (such as
+        the built-in scan config and port list ids) are taken as they are."""
+        if not global_id:
+            return global_id
+        owner, local_id = self.route(global_id)
+        if owner is manager or owner is self.default:
+            return local_id
+        raise ValueError(f"{global_id} belongs to manager '{owner.name}', not '{manager.name}'")
+
+    async def place(self, key: str, name: Optional[str] = None) -> Manager:
+        """Manager for a new entity: ``name`` if given, else the placement's choice."""
+        if name:
+            return self.get(name)
+        if len(self) == 1:
+            return self.default
+        return await self.placement.choose(list(self), key)
+
+    async def gather(self, call: Callable[[Manager], Awaitable[Any]]) -> Tuple[List[Tuple[Manager, Any]], Dict[str, str]]:
+        """Runs ``call`` on every manager in parallel.
+
+        Returns the successful ``(manager, result)`` pairs and the errors of
+        the managers that failed; raises if all of them failed.
+        """
+        managers = list(self)
+        outcomes = await asyncio.gather(*(call(manager) for manager in managers), return_exceptions=True)
+        results, errors = [], {}
+        for manager, outcome in zip(managers, outcomes):
+            if isinstance(outcome, BaseException):
+                errors[manager.name] = str(outcome) or type(outcome).__name__
+            else:
+                results.append((manager, outcome))
+        if not results:
+            raise next(outcome for outcome in outcomes if isinstance(outcome, BaseException))
+        return results, errors
+
+    async def close(self) -> None:
+        for manager in self:
+            await manager.pool.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default": self.default.name,
+            "placement": type(self.placement).__name__,
+            "managers": {manager.name: manager.pool.stats() for manager in self},
+            **self.placement.stats(),
+        }
+
+
+def _items(value: Any) -> List[Any]:
+    # element_to_dict gives a single entity as a dict and none as no key
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _count(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def merge_responses(entity: str, responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merges converted get_<entity>s responses of several managers."""
+    if len(responses) == 1:
+        return responses[0]
+    merged = dict(responses[0])
+    merged[entity] = [item for response in responses for item in _items(response.get(entity))]
+    counts = [response.get(f"{entity}_count") or {} for response in responses]
+    merged[f"{entity}_count"] = {
+        key: sum(_count(count.get(key)) for count in counts) for key in counts[0]
+    }
+    return merged
+
+# ---------------------- placement ----------------------
+
+class HashPlacement:
+    """Rendezvous hashing of the placement key (e.g. a target's hosts): the
+    same key always lands on the same manager, and adding a manager only
+    moves the keys it wins."""
+
+    async def choose(self, managers: List[Manager], key: str) -> Manager:
+        return max(managers, key=lambda manager: hashlib.sha1(f"{manager.name}:{key}".encode()).digest())
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class LeastLoadedPlacement:
+    """Picks the manager with the fewest running tasks.
+
+    Counts are asked from gvmd at most every ``refresh`` seconds; entities
+    placed in between are added to the count so that a burst of creations
+    is spread instead of all landing on the same manager.
+    """
+
+    def __init__(self, refresh: float = 10.0):
+        self.refresh = refresh
+        self._running: Dict[str, Optional[int]] = {}
+        self._placed: Dict[str, int] = {}
+        self._refreshed = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _count_running(self, manager: Manager) -> int:
+        async with manager.pool.session() as gmp:
+            root = await gmp.get_tasks(filter_string="status=Running rows=1")
+        check_command_status(root)
+        return int(root.findtext("task_count/filtered") or 0)
+
+    async def _update(self, managers: List[Manager]) -> None:
+        counts = await asyncio.gather(*(self._count_running(m) for m in managers), return_exceptions=True)
+        self._running = {
+            manager.name: None if isinstance(count, BaseException) else count
+            for manager, count in zip(managers, counts)
+        }
+        self._placed = {}
+        self._refreshed = time.monotonic()
+
+    def _load(self, manager: Manager) -> float:
+        running = self._running.get(manager.name, 0)
+        if running is None:
+            # Unreachable at the last refresh: only chosen when all of them are
+            return float("inf")
+        return running + self._placed.get(manager.name, 0)
+
+    async def choose(self, managers: List[Manager], key: str) -> Manager:
+        async with self._lock:
+            if time.monotonic() - self._refreshed > self.refresh:
+                await self._update(managers)
+            manager = min(managers, key=self._load)
+            self._placed[manager.name] = self._placed.get(manager.name, 0) + 1
+            return manager
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "placed_since_refresh": self._placed,
+        }
+
+
+PLACEMENTS = {
+    "least_loaded": LeastLoadedPlacement,
+    "hash": HashPlacement,
+}
@@ -0,0 +1,261 @@
+import functools
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds, from sub-millisecond parsing up to a slow report download
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 256 B to 256 MiB, by factors of 4
+BYTE_BUCKETS = tuple(256 * 4 ** i for i in range(11))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """The metric's lines in the Prometheus text format, header included."""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labels, labels)} {_number(value)}" for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class CallbackGauge(Metric):
+    """Gauge read at scrape time: ``collect()`` returns ``(label values,
+    value)`` pairs."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], collect: Callable[[], Iterable]):
+        super().__init__(name, help, labels)
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labels, labels)} {_number(value)}" for labels, value in self._collect()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = self.header()
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _labels(self.labels, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+GMP_CONNECT_SECONDS = REGISTRY.register(Histogram(
+    "gmp_connect_seconds", "Opening a connection to gvmd, TLS handshake included."
+))
+GMP_AUTH_SECONDS = REGISTRY.register(Histogram(
+    "gmp_auth_seconds", "GMP authenticate commands."
+))
+GMP_COMMAND_SECONDS = REGISTRY.register(Histogram(
+    "gmp_command_seconds", "GMP command round trips, from sending to the end of the response.", ("command",)
+))
+GMP_RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "gmp_response_bytes", "Size of GMP responses.", ("command",), buckets=BYTE_BUCKETS
+))
+GMP_ERRORS = REGISTRY.register(Counter(
+    "gmp_errors_total", "Failed GMP commands by exception type.", ("command", "type")
+))
+GMP_POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "gmp_pool_wait_seconds", "Waits for a free GMP session, for checkouts that had to wait."
+))
+GMP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "gmp_commands_in_flight", "GMP commands waiting for their response."
+))
+PROCESSING_SECONDS = REGISTRY.register(Histogram(
+    "gvm_processing_seconds", "Local work on responses: XML parsing, conversion and JSON serialization.", ("phase",)
+))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_seconds", "HTTP requests, until the last byte of the body.", ("method", "route", "status")
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being handled."
+))
+
+# ---------------------- profiles ----------------------
+
+# Phase times of the current request while it is being profiled
+_profile: ContextVar[Optional[Dict[str, float]]] = ContextVar("gvm_profile", default=None)
+
+
+def add_to_profile(phase: str, seconds: float) -> None:
+    profile = _profile.get()
+    if profile is not None:
+        profile[phase] = profile.get(phase, 0.0) + seconds
+
+
+def observe_phase(phase: str, seconds: float) -> None:
+    PROCESSING_SECONDS.observe(seconds, phase)
+    add_to_profile(phase, seconds)
+
+
+def timed(phase: str):
+    """Decorator recording the wrapped function's run time as ``phase``."""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe_phase(phase, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorate
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests by route template and status.
+
+    A ``sample_rate`` share of requests is profiled: the time spent per
+    phase (pool_wait, connect, auth, round_trip, parse, convert,
+    serialize) is appended to ``profiles``.
+    """
+
+    def __init__(self, app, sample_rate: float = 0.0, profiles: Optional[deque] = None):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.profiles = profiles if profiles is not None else deque(maxlen=100)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profile = {} if self.sample_rate and random.random() < self.sample_rate else None
+        token = _profile.set(profile)
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _profile.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.observe(elapsed, scope["method"], path, str(status))
+            if profile is not None:
+                self.profiles.append({
+                    "method": scope["method"],
+                    "route": path,
+                    "path": scope["path"],
+                    "status": status,
+                    "at": time.time(),
+                    "seconds": round(elapsed, 6),
+                    "phases": {phase: round(seconds, 6) for phase, seconds in profile.items()},
+                })
@@ -0,0 +1,196 @@
+import binascii
+import glob
+import os
+import tempfile
+import time
+from typing import AsyncIterator, List, Optional
+
+from lxml import etree
+
+# Report ids end up in spool file names, so only UUID characters are allowed
+REPORT_ID_PATTERN = r"^[A-Za-z0-9_.\-]+$"
+
+# Report formats shipped with gvmd (name -> report format id)
+DEFAULT_REPORT_FORMATS = {
+    "pdf": "c402cc3e-b531-11e1-9163-406186ea4fc5",
+    "xml": "a994b278-1f62-11e1-96ac-406186ea4fc5",
+    "anonymous_xml": "5057e5cc-b825-11e4-9d0e-28d24461215b",
+    "csv": "c1645568-627a-11e3-a660-406186ea4fc5",
+    "csv_hosts": "9087b18c-626c-11e3-8892-406186ea4fc5",
+    "txt": "a3810a62-1f62-11e1-9219-406186ea4fc5",
+    "latex": "a684c02c-b531-11e1-bdc2-406186ea4fc5",
+    "itg": "77bd6c4a-1f62-11e1-abf0-406186ea4fc5",
+}
+
+_WHITESPACE = b" \t\r\n"
+# What follows the report in a get_reports response (filters, sort, counts)
+# is dropped, so that much of an XML report is held back until it ends
+_XML_TAIL_BYTES = 64 * 1024
+_REPORT_START = b"<report"
+_REPORT_END = b"</report>"
+
+
+class ReportDecoder:
+    """Turns a get_reports response, fed chunk by chunk, into the report file.
+
+    gvmd sends XML based formats as a nested <report> element and every
+    other format base64 encoded as the text of the outer <report>. The former
+    is passed through as received, minus the response around the <report>
+    element, the latter is decoded as it arrives, so neither is ever held in
+    memory as a whole.
+    """
+
+    def __init__(self):
+        self.content_type: Optional[str] = None
+        self.extension: Optional[str] = None
+        self._parser = etree.XMLParser(target=self, huge_tree=True)
+        self._depth = 0
+        self._raw: Optional[bool] = None  # unknown until <report> starts
+        self._held: List[bytes] = []
+        self._held_bytes = 0
+        self._decoded: List[bytes] = []
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Returns the part of the report body completed by ``chunk``."""
+        if self._raw:
+            return self._pass_through(chunk)
+        self._parser.feed(chunk)
+        if self._raw is None:
+            self._held.append(chunk)
+            return b""
+        if self._raw:
+            held = b"".join(self._held) + chunk
+            self._held = []
+            return self._pass_through(held[held.find(_REPORT_START):])
+        body = b"".join(self._decoded)
+        self._decoded.clear()
+        return body
+
+    def _pass_through(self, chunk: bytes) -> bytes:
+        self._held.append(chunk)
+        self._held_bytes += len(chunk)
+        if self._held_bytes <= 2 * _XML_TAIL_BYTES:
+            return b""
+        held = b"".join(self._held)
+        self._held = [held[-_XML_TAIL_BYTES:]]
+        self._held_bytes = _XML_TAIL_BYTES
+        return held[:-_XML_TAIL_BYTES]
+
+    def finish(self) -> bytes:
+        """Returns the rest of the report body. Raises ValueError if the
+        response ended before the report did."""
+        if self._raw is None:
+            raise ValueError("Response does not contain a report")
+        if self._raw:
+            held = b"".join(self._held)
+            self._held = []
+            end = held.rfind(_REPORT_END)
+            if end < 0:
+                raise ValueError("Report content is truncated")
+            return held[:end + len(_REPORT_END)]
+        if self._pending.rstrip(b"="):
+            raise ValueError("Report content is truncated")
+        return b""
+
+    # lxml parser target interface
+
+    def start(self, tag, attrib):
+        self._depth += 1
+        if self._depth == 2 and tag == "report" and self._raw is None:
+            self.content_type = attrib.get("content_type") or "application/octet-stream"
+            self.extension = attrib.get("extension") or "bin"
+            self._raw = self.content_type.endswith("xml")
+
+    def end(self, tag):
+        self._depth -= 1
+
+    def data(self, text):
+        if self._depth != 2 or self._raw is not False:
+            return
+        data = self._pending + text.encode("ascii").translate(None, _WHITESPACE)
+        usable = len(data) - len(data) % 4
+        self._pending = data[usable:]
+        if usable:
+            try:
+                self._decoded.append(binascii.a2b_base64(data[:usable]))
+            except binascii.Error as e:
+                raise ValueError(f"Report content is not valid base64: {e}") from None
+
+    def close(self):
+        return None
+
+
+class ReportSpool:
+    """On-disk cache of downloaded reports, keyed by report id and format.
+
+    Files are written next to their final name and renamed once complete, so
+    a reader never sees a partial report. Entries older than ``max_age``
+    seconds are not served, and the oldest files are removed once the
+    directory grows beyond ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_age: float = 3600.0, max_bytes: int = 0):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, report_id: str, report_format: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{report_id}.{report_format}.{extension}")
+
+    def lookup(self, report_id: str, report_format: str) -> Optional[str]:
+        """Returns the path of a fresh spooled copy, if there is one."""
+        pattern = os.path.join(self.directory, glob.escape(f"{report_id}.{report_format}.") + "*")
+        for path in glob.glob(pattern):
+            try:
+                if time.time() - os.path.getmtime(path) <= self.max_age:
+                    return path
+                os.unlink(path)
+            except OSError:
+                pass
+        return None
+
+    async def tee(
+        self,
+        chunks: AsyncIterator[bytes],
+        report_id: str,
+        report_format: str,
+        decoder: ReportDecoder,
+    ) -> AsyncIterator[bytes]:
+        """Passes ``chunks`` through while writing them to the spool."""
+        fd, partial = tempfile.mkstemp(dir=self.directory, prefix=".partial-")
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(partial, self._path(report_id, report_format, decoder.extension))
+            complete = True
+        finally:
+            if not complete:
+                try:
+                    os.unlink(partial)
+                except OSError:
+                    pass
+        self._evict()
+
+    def _evict(self) -> None:
+        if not self.max_bytes:
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(".partial-"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
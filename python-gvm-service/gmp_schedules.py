@@ -0,0 +1,405 @@
+import functools
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytz
+from dateutil.rrule import rrulestr
+from icalendar import Calendar, Event, vRecur
+
+ICAL_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# Recurrences with a fixed length, in seconds
+FIXED_FREQUENCIES = {
+    "SECONDLY": 1,
+    "MINUTELY": 60,
+    "HOURLY": 3600,
+    "DAILY": 86400,
+    "WEEKLY": 7 * 86400,
+}
+# Recurrences counted in months
+MONTH_FREQUENCIES = {"MONTHLY": 1, "YEARLY": 12}
+# RRULE parts handled by the array expansion; anything else goes to dateutil
+SIMPLE_PARTS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "WKST"}
+
+# Upper bound of runs in one forecast
+MAX_RUNS = 10_000_000
+
+DAY = 86400
+# Widening of the window in local time, covering any UTC offset
+OFFSET_MARGIN = DAY
+
+
+class ForecastTooLarge(ValueError):
+    pass
+
+
+@functools.lru_cache(maxsize=1024)
+def build_icalendar(time: str, period: Optional[str] = "FREQ=DAILY", until: Optional[str] = None) -> str:
+    """iCalendar for a schedule starting at ``time`` (YYYYMMDDTHHMMSSZ) and
+    repeating by the RRULE ``period``, up to ``until`` if given.
+
+    Identical requests share the built calendar, DTSTAMP included.
+    """
+    cal = Calendar()
+    cal.add('prodid', '-//OpenVOC Scheduler//')
+    cal.add('version', '2.0')
+
+    event = Event()
+    event.add('dtstamp', datetime.now(tz=pytz.UTC))
+
+    dtstart = datetime.strptime(time, ICAL_TIME_FORMAT).replace(tzinfo=pytz.UTC)
+    event.add('dtstart', dtstart)
+
+    if period:
+        rrule = vRecur.from_ical(period)
+        if until:
+            rrule["UNTIL"] = datetime.strptime(until, ICAL_TIME_FORMAT).replace(tzinfo=pytz.UTC)
+        event.add('rrule', rrule)
+
+    cal.add_component(event)
+    return cal.to_ical().decode("utf-8")
+
+# ---------------------- recurrences ----------------------
+
+_PROPERTY = re.compile(r"^(DTSTART|RRULE|RDATE|EXDATE)((?:;[^:\r\n]*)?):(.*)$", re.M)
+
+
+class Recurrence:
+    """Start and RRULE of a schedule, in the schedule's local time.
+
+    ``rule`` is None for a one-off schedule. ``text`` holds the RRULE,
+    RDATE and EXDATE lines for the dateutil fallback, for rules the array
+    expansion does not handle.
+    """
+
+    __slots__ = ("tz", "start", "rule", "simple", "text")
+
+    def __init__(self, tz: str, start: datetime, rule: Optional[Dict[str, str]], simple: bool, text: str):
+        self.tz = tz
+        self.start = start
+        self.rule = rule
+        self.simple = simple
+        self.text = text
+
+
+def _parse_time(value: str, params: str, tz: ZoneInfo) -> datetime:
+    """Naive local time of an iCalendar DATE or DATE-TIME value."""
+    value = value.strip()
+    if len(value) == 8:
+        return datetime.strptime(value, "%Y%m%d")
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).astimezone(tz).replace(tzinfo=None)
+    parsed = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    zone = re.search(r"TZID=([^;]+)", params)
+    if zone:
+        parsed = parsed.replace(tzinfo=ZoneInfo(zone.group(1))).astimezone(tz).replace(tzinfo=None)
+    return parsed
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_recurrence(icalendar: str, tz: str = "UTC") -> Recurrence:
+    """Reads a gvmd schedule's iCalendar. gvmd repeats schedules in their
+    own timezone, so everything is converted to local time of ``tz``."""
+    zone = ZoneInfo(tz or "UTC")
+    # Undo line folding
+    text = re.sub(r"\r?\n[ \t]", "", icalendar)
+    start = None
+    rule = None
+    extra = []
+    for name, params, value in _PROPERTY.findall(text):
+        if name == "DTSTART" and start is None:
+            start = _parse_time(value, params, zone)
+        elif name == "RRULE" and rule is None:
+            rule = dict(part.split("=", 1) for part in value.strip().split(";") if "=" in part)
+        else:
+            extra.append(f"{name}{params}:{value.strip()}")
+    if start is None:
+        raise ValueError("Schedule has no DTSTART")
+
+    simple = not extra
+    if rule is not None:
+        if "UNTIL" in rule:
+            # dateutil wants UNTIL in the same (naive local) terms as DTSTART
+            until = _parse_time(rule["UNTIL"], "", zone)
+            rule["UNTIL"] = until.strftime("%Y%m%dT%H%M%S")
+        freq = rule.get("FREQ")
+        simple = simple and set(rule) <= SIMPLE_PARTS and (freq in FIXED_FREQUENCIES or freq in MONTH_FREQUENCIES)
+        # COUNT only counts existing dates, e.g. no February 30
+        if freq in MONTH_FREQUENCIES and "COUNT" in rule and start.day > 28:
+            simple = False
+        extra.insert(0, "RRULE:" + ";".join(f"{key}={value}" for key, value in rule.items()))
+    return Recurrence(tz or "UTC", start, rule, simple, "\n".join(extra))
+
+
+def _seconds(value: datetime) -> int:
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+
+def _ragged(lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """For runs of ``lengths``: the run each element belongs to and its
+    index within the run."""
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    return owner, np.arange(len(owner)) - offsets[owner]
+
+
+def _check_size(total: int) -> None:
+    if total > MAX_RUNS:
+        raise ForecastTooLarge(f"Forecast window expands to more than {MAX_RUNS} runs")
+
+
+def _expand_fixed(items, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Local start times within [start, end] of fixed-length recurrences,
+    all schedules at once."""
+    index = np.array([i for i, _ in items], dtype=np.int64)
+    first = np.array([_seconds(r.start) for _, r in items], dtype=np.int64)
+    step = np.array(
+        [FIXED_FREQUENCIES[r.rule["FREQ"]] * int(r.rule.get("INTERVAL", 1)) if r.rule else 1 for _, r in items],
+        dtype=np.int64,
+    )
+    last = np.array(
+        [_seconds(datetime.strptime(r.rule["UNTIL"], "%Y%m%dT%H%M%S")) if r.rule and "UNTIL" in r.rule else end
+         for _, r in items],
+        dtype=np.int64,
+    )
+    count = np.array(
+        [int(r.rule["COUNT"]) if r.rule and "COUNT" in r.rule else (1 if not r.rule else -1) for _, r in items],
+        dtype=np.int64,
+    )
+    k0 = np.maximum(0, -((first - start) // step))
+    k1 = (np.minimum(last, end) - first) // step
+    k1 = np.where(count > 0, np.minimum(k1, count - 1), k1)
+    lengths = np.maximum(0, k1 - k0 + 1)
+    _check_size(int(lengths.sum()))
+    owner, k = _ragged(lengths)
+    return index[owner], first[owner] + (k0[owner] + k) * step[owner]
+
+
+def _expand_months(items, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Same for monthly and yearly recurrences, with month arithmetic;
+    dates that do not exist in a month (e.g. the 31st) are skipped."""
+    index = np.array([i for i, _ in items], dtype=np.int64)
+    first_month = np.array([(r.start.year - 1970) * 12 + r.start.month - 1 for _, r in items], dtype=np.int64)
+    day = np.array([r.start.day - 1 for _, r in items], dtype=np.int64)
+    time_of_day = np.array([_seconds(r.start) % DAY for _, r in items], dtype=np.int64)
+    step = np.array([MONTH_FREQUENCIES[r.rule["FREQ"]] * int(r.rule.get("INTERVAL", 1)) for _, r in items], dtype=np.int64)
+    last = np.array(
+        [_seconds(datetime.strptime(r.rule["UNTIL"], "%Y%m%dT%H%M%S")) if "UNTIL" in r.rule else end for _, r in items],
+        dtype=np.int64,
+    )
+    count = np.array([int(r.rule.get("COUNT", -1)) for _, r in items], dtype=np.int64)
+    start_month = np.datetime64(start, "s").astype("datetime64[M]").astype(np.int64)
+    end_month = np.datetime64(end, "s").astype("datetime64[M]").astype(np.int64)
+    k0 = np.maximum(0, -((first_month - start_month) // step))
+    k1 = (end_month - first_month) // step
+    k1 = np.where(count > 0, np.minimum(k1, count - 1), k1)
+    lengths = np.maximum(0, k1 - k0 + 1)
+    _check_size(int(lengths.sum()))
+    owner, k = _ragged(lengths)
+    months = first_month[owner] + (k0[owner] + k) * step[owner]
+    dates = months.astype("datetime64[M]").astype("datetime64[D]") + day[owner]
+    times = dates.astype("datetime64[s]").astype(np.int64) + time_of_day[owner]
+    keep = (dates.astype("datetime64[M]").astype(np.int64) == months) & (times <= last[owner])
+    return index[owner][keep], times[keep]
+
+
+def _expand_rrule(items, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+    """dateutil for everything else (BYDAY and friends, RDATE, EXDATE)."""
+    index, times = [], []
+    window_start = datetime(1970, 1, 1) + timedelta(seconds=start)
+    window_end = datetime(1970, 1, 1) + timedelta(seconds=end)
+    for i, recurrence in items:
+        for run in rrulestr(recurrence.text, dtstart=recurrence.start, forceset=True).between(
+            window_start, window_end, inc=True
+        ):
+            index.append(i)
+            times.append(_seconds(run))
+        _check_size(len(times))
+    return np.array(index, dtype=np.int64), np.array(times, dtype=np.int64)
+
+
+@functools.lru_cache(maxsize=64)
+def _utc_offsets(tz: str, first_hour: int, hours: int) -> np.ndarray:
+    """UTC offset in seconds for each local hour from ``first_hour`` (hours
+    since the epoch, local time) on."""
+    zone = ZoneInfo(tz)
+    base = datetime(1970, 1, 1)
+    return np.array(
+        [zone.utcoffset(base + timedelta(hours=first_hour + h)).total_seconds() for h in range(hours)],
+        dtype=np.int64,
+    )
+
+
+def expand(recurrences: List[Recurrence], start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray, Dict[int, str]]:
+    """Runs of ``recurrences`` within [start, end) (aware datetimes).
+
+    Returns the index of the recurrence of each run, the run times as
+    seconds since the epoch (UTC), and the errors of recurrences that
+    could not be expanded.
+    """
+    start_utc = int(start.timestamp())
+    end_utc = int(end.timestamp())
+    local_start = start_utc - OFFSET_MARGIN
+    local_end = end_utc + OFFSET_MARGIN
+
+    fixed, months, other = [], [], []
+    for i, recurrence in enumerate(recurrences):
+        if not recurrence.simple:
+            other.append((i, recurrence))
+        elif recurrence.rule and recurrence.rule["FREQ"] in MONTH_FREQUENCIES:
+            months.append((i, recurrence))
+        else:
+            fixed.append((i, recurrence))
+
+    errors: Dict[int, str] = {}
+    parts = []
+    if fixed:
+        parts.append(_expand_fixed(fixed, local_start, local_end))
+    if months:
+        parts.append(_expand_months(months, local_start, local_end))
+    for item in other:
+        try:
+            parts.append(_expand_rrule([item], local_start, local_end))
+        except ForecastTooLarge:
+            raise
+        except (ValueError, TypeError) as e:
+            errors[item[0]] = str(e)
+    if not parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), errors
+    index = np.concatenate([part[0] for part in parts])
+    local = np.concatenate([part[1] for part in parts])
+
+    # Local to UTC, by a table of hourly offsets per timezone
+    utc = local.copy()
+    zones = np.array([recurrence.tz for recurrence in recurrences], dtype=object)[index]
+    first_hour = local_start // 3600
+    hours = (local_end - local_start) // 3600 + 2
+    for tz in set(zones):
+        if tz == "UTC":
+            continue
+        mask = zones == tz
+        offsets = _utc_offsets(tz, first_hour, hours)
+        utc[mask] = local[mask] - offsets[np.clip(local[mask] // 3600 - first_hour, 0, hours - 1)]
+
+    keep = (utc >= start_utc) & (utc < end_utc)
+    return index[keep], utc[keep], errors
+
+# ---------------------- forecast ----------------------
+
+def _iso(seconds: int) -> str:
+    return datetime.fromtimestamp(int(seconds), tz=timezone.utc).strftime(ICAL_TIME_FORMAT)
+
+
+def forecast(
+    schedules: List[Dict[str, Any]],
+    tasks: List[Dict[str, Any]],
+    targets: List[Dict[str, Any]],
+    start: datetime,
+    end: datetime,
+    bucket: int,
+    default_duration: int,
+) -> Dict[str, Any]:
+    """Scan load expected from the schedules within [start, end).
+
+    Every run of a schedule starts each of its tasks, which is assumed to
+    run for its average duration (``default_duration`` for tasks without
+    one) and to scan its target's hosts. Returns per ``bucket`` seconds the
+    number of task starts, of running tasks and of hosts being scanned.
+    """
+    buckets = -(-int((end - start).total_seconds()) // bucket)
+
+    # Tasks grouped by schedule
+    schedule_index = {schedule["id"]: i for i, schedule in enumerate(schedules)}
+    target_hosts = {target["id"]: target.get("max_hosts") or 0 for target in targets}
+    scheduled = [task for task in tasks if (task.get("schedule") or {}).get("id") in schedule_index]
+    task_schedule = np.array([schedule_index[task["schedule"]["id"]] for task in scheduled], dtype=np.int64)
+    task_duration = np.array(
+        [task.get("average_duration") or default_duration for task in scheduled], dtype=np.int64
+    )
+    task_hosts = np.array(
+        [target_hosts.get((task.get("target") or {}).get("id"), 0) for task in scheduled], dtype=np.int64
+    )
+    order = np.argsort(task_schedule, kind="stable")
+    tasks_per_schedule = np.bincount(task_schedule, minlength=len(schedules))
+    first_task = np.cumsum(tasks_per_schedule) - tasks_per_schedule
+
+    # Runs starting before the window may still be going on in it
+    longest = int(task_duration.max()) if len(task_duration) else 0
+    recurrences, errors = {}, {}
+    for i, schedule in enumerate(schedules):
+        if not tasks_per_schedule[i]:
+            continue
+        try:
+            recurrences[i] = parse_recurrence(schedule.get("icalendar") or "", schedule.get("timezone") or "UTC")
+        except (ValueError, KeyError) as e:
+            # KeyError covers unknown timezones
+            errors[i] = str(e)
+    expanded = list(recurrences)
+    run_schedule, run_time, expand_errors = expand(
+        list(recurrences.values()), start - timedelta(seconds=longest), end
+    )
+    run_schedule = np.array(expanded, dtype=np.int64)[run_schedule]
+    errors.update((expanded[i], error) for i, error in expand_errors.items())
+
+    # One entry per task start
+    owner, k = _ragged(tasks_per_schedule[run_schedule])
+    _check_size(len(owner))
+    task = order[first_task[run_schedule][owner] + k]
+    started = run_time[owner]
+    duration = task_duration[task]
+    hosts = task_hosts[task]
+
+    window_start = int(start.timestamp())
+    first_bucket = (started - window_start) // bucket
+    # A task runs in every bucket its run overlaps, and in at least one
+    last_bucket = np.maximum(-(-(started + duration - window_start) // bucket), first_bucket + 1)
+    in_window = started >= window_start
+    begin = np.clip(first_bucket, 0, buckets)
+    stop = np.clip(last_bucket, 0, buckets)
+    running = np.cumsum(np.bincount(begin, minlength=buckets + 1) - np.bincount(stop, minlength=buckets + 1))[:buckets]
+    scanning = np.cumsum(
+        np.bincount(begin, weights=hosts, minlength=buckets + 1) - np.bincount(stop, weights=hosts, minlength=buckets + 1)
+    )[:buckets].astype(np.int64)
+    starts = np.bincount(first_bucket[in_window], minlength=buckets)[:buckets]
+
+    runs_per_schedule = np.bincount(run_schedule[run_time >= window_start], minlength=len(schedules))
+    hosts_per_schedule = np.bincount(task_schedule, weights=task_hosts, minlength=len(schedules)).astype(np.int64)
+    peak = int(np.argmax(running)) if buckets else 0
+    return {
+        "from": _iso(window_start),
+        "to": _iso(end.timestamp()),
+        "bucket": bucket,
+        "schedules": len(schedules),
+        "scheduled_tasks": len(scheduled),
+        "task_starts": int(in_window.sum()),
+        "peak": {
+            "start": _iso(window_start + peak * bucket),
+            "running": int(running[peak]) if buckets else 0,
+            "hosts": int(scanning[peak]) if buckets else 0,
+        },
+        "histogram": [
+            {
+                "start": _iso(window_start + b * bucket),
+                "starts": int(starts[b]),
+                "running": int(running[b]),
+                "hosts": int(scanning[b]),
+            }
+            for b in range(buckets)
+        ],
+        "by_schedule": [
+            {
+                "id": schedules[i]["id"],
+                "name": schedules[i].get("name"),
+                "timezone": schedules[i].get("timezone"),
+                "runs": int(runs_per_schedule[i]),
+                "tasks": int(tasks_per_schedule[i]),
+                "hosts": int(hosts_per_schedule[i]),
+            }
+            for i in np.argsort(-runs_per_schedule * np.maximum(tasks_per_schedule, 1), kind="stable")
+            if runs_per_schedule[i]
+        ],
+        "errors": [{"id": schedules[i]["id"], "error": error} for i, error in sorted(errors.items())],
+    }
@@ -0,0 +1,128 @@
+from array import array
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Severity classes as shown by GSA (CVSS v3 ratings). gvmd 22.4 only counts
+# "hole" (high and critical together), so critical is counted separately.
+CRITICAL = 9.0
+HIGH = 7.0
+MEDIUM = 4.0
+
+# gvmd's default result filter, spelled out so both code paths count the same
+SUMMARY_FILTER = "apply_overrides=0 min_qod=70"
+
+REPORT_COUNT_FIELDS = "id,task.id,report.scan_run_status,report.result_count"
+RESULT_FIELDS = "host,port,nvt.oid,nvt.name,nvt.family,severity"
+
+FINISHED_STATUSES = {"Done", "Stopped", "Interrupted"}
+
+
+def severity_classes(severities: np.ndarray) -> Dict[str, int]:
+    return {
+        "critical": int(np.count_nonzero(severities >= CRITICAL)),
+        "high": int(np.count_nonzero((severities >= HIGH) & (severities < CRITICAL))),
+        "medium": int(np.count_nonzero((severities >= MEDIUM) & (severities < HIGH))),
+        "low": int(np.count_nonzero((severities > 0) & (severities < MEDIUM))),
+        "log": int(np.count_nonzero(severities == 0)),
+        "false_positive": int(np.count_nonzero(severities < 0)),
+    }
+
+
+def classes_from_result_count(result_count: Dict[str, Any], critical: int) -> Dict[str, int]:
+    """Severity classes from a report's <result_count>; ``critical`` comes
+    from a separate pushed-down count."""
+
+    def filtered(level: str) -> int:
+        return ((result_count or {}).get(level) or {}).get("filtered") or 0
+
+    return {
+        "critical": critical,
+        "high": filtered("hole") - critical,
+        "medium": filtered("warning"),
+        "low": filtered("info"),
+        "log": filtered("log"),
+        "false_positive": filtered("false_positive"),
+    }
+
+
+class ResultColumns:
+    """Results of one report as compact columns: one float32 array for the
+    severity and int32 codes into interned value lists for the rest."""
+
+    def __init__(self):
+        self.severity = array("f")
+        self.host = array("i")
+        self.port = array("i")
+        self.family = array("i")
+        self.nvt = array("i")
+        self.hosts: Dict[Optional[str], int] = {}
+        self.ports: Dict[Optional[str], int] = {}
+        self.families: Dict[Optional[str], int] = {}
+        self.nvts: Dict[Optional[str], int] = {}
+        self.nvt_names: List[Optional[str]] = []
+
+    @staticmethod
+    def _code(values: Dict[Optional[str], int], value: Optional[str]) -> int:
+        code = values.get(value)
+        if code is None:
+            code = values[value] = len(values)
+        return code
+
+    def append(self, result: Dict[str, Any]) -> None:
+        """Adds a converted <result> (see RESULT_FIELDS)."""
+        nvt = result["nvt"] or {}
+        severity = result["severity"]
+        self.severity.append(severity if severity is not None else 0.0)
+        self.host.append(self._code(self.hosts, (result["host"] or {}).get("text")))
+        self.port.append(self._code(self.ports, result["port"]))
+        self.family.append(self._code(self.families, nvt.get("family")))
+        oid = nvt.get("oid")
+        if oid not in self.nvts:
+            self.nvt_names.append(nvt.get("name"))
+        self.nvt.append(self._code(self.nvts, oid))
+
+    def __len__(self) -> int:
+        return len(self.severity)
+
+
+def _grouped(
+    codes: array,
+    values: Dict[Optional[str], int],
+    severity: np.ndarray,
+    key: str,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Count and highest severity per value, most frequent first."""
+    if not values:
+        return []
+    codes = np.frombuffer(codes, dtype=np.int32)
+    counts = np.bincount(codes, minlength=len(values))
+    highest = np.full(len(values), -np.inf, dtype=np.float32)
+    np.maximum.at(highest, codes, severity)
+    order = np.lexsort((-highest, -counts))
+    if limit is not None:
+        order = order[:limit]
+    names = list(values)
+    return [
+        {key: names[code], "count": int(counts[code]), "max_severity": round(float(highest[code]), 1)}
+        for code in order
+    ]
+
+
+def summarize(columns: ResultColumns, top: int = 10) -> Dict[str, Any]:
+    severity = np.frombuffer(columns.severity, dtype=np.float32)
+    # One bin per severity point: [0, 1), [1, 2), ..., [9, 10]
+    bins = np.clip(np.floor(severity[severity >= 0]), 0, 9).astype(np.int64)
+    top_nvts = _grouped(columns.nvt, columns.nvts, severity, "oid", limit=top)
+    for entry in top_nvts:
+        entry["name"] = columns.nvt_names[columns.nvts[entry["oid"]]]
+    return {
+        "total": len(columns),
+        "by_severity": severity_classes(severity),
+        "severity_histogram": np.bincount(bins, minlength=10).tolist(),
+        "by_host": _grouped(columns.host, columns.hosts, severity, "host"),
+        "by_port": _grouped(columns.port, columns.ports, severity, "port"),
+        "by_family": _grouped(columns.family, columns.families, severity, "family"),
+        "top_nvts": top_nvts,
+    }
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from gmp_convert import convert_entity
+
+SYNC_FIELDS = (
+    "id,name,task.id,report.id,host,port,nvt.oid,nvt.name,nvt.family,nvt.cvss_base,"
+    "nvt.tags,nvt.solution,severity,threat,qod,description,creation_time,modification_time"
+)
+
+# Columns of a normalized result row, in storage order
+COLUMNS = (
+    "id", "task_id", "report_id", "name", "host", "hostname", "port",
+    "nvt_oid", "nvt_name", "family", "cvss_base", "tags", "solution",
+    "severity", "threat", "qod", "qod_type", "description",
+    "creation_time", "modification_time",
+)
+
+
+def normalize_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Flattens a converted <result> (see SYNC_FIELDS) into a store row."""
+    host = result["host"] or {}
+    nvt = result["nvt"] or {}
+    qod = result["qod"] or {}
+    return {
+        "id": result["id"],
+        "task_id": (result["task"] or {}).get("id"),
+        "report_id": (result["report"] or {}).get("id"),
+        "name": result["name"],
+        "host": host.get("text"),
+        "hostname": host.get("hostname"),
+        "port": result["port"],
+        "nvt_oid": nvt.get("oid"),
+        "nvt_name": nvt.get("name"),
+        "family": nvt.get("family"),
+        "cvss_base": nvt.get("cvss_base"),
+        "tags": nvt.get("tags"),
+        "solution": (nvt.get("solution") or {}).get("text"),
+        "severity": result["severity"],
+        "threat": result["threat"],
+        "qod": qod.get("value"),
+        "qod_type": qod.get("type"),
+        "description": result["description"],
+        "creation_time": result["creation_time"],
+        "modification_time": result["modification_time"],
+    }
+
+
+def parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def format_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+# ---------------------- stores ----------------------
+
+class ResultStore(ABC):
+    """Where synced results live. Every change to a row gets a new, increasing
+    sequence number, which is the cursor for ``changes``."""
+
+    @abstractmethod
+    def get_watermark(self, task_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set_watermark(self, task_id: str, modification_time: str) -> None:
+        ...
+
+    @abstractmethod
+    def upsert(self, rows: List[Dict[str, Any]]) -> int:
+        """Stores ``rows`` and returns how many were new or different."""
+
+    @abstractmethod
+    def changes(self, since: int, task_id: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Rows changed after sequence ``since``, oldest first, each with its
+        ``seq``."""
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteResultStore(ResultStore):
+    def __init__(self, path: str = ":memory:"):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "id TEXT PRIMARY KEY, task_id TEXT, report_id TEXT, name TEXT,"
+                " host TEXT, hostname TEXT, port TEXT, nvt_oid TEXT, nvt_name TEXT,"
+                " family TEXT, cvss_base REAL, tags TEXT, solution TEXT,"
+                " severity REAL, threat TEXT, qod INTEGER, qod_type TEXT,"
+                " description TEXT, creation_time TEXT, modification_time TEXT,"
+                " digest TEXT NOT NULL, seq INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_seq ON results (seq)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_task_seq ON results (task_id, seq)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks (task_id TEXT PRIMARY KEY, modification_time TEXT)"
+            )
+        self._seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM results").fetchone()[0]
+
+    def get_watermark(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT modification_time FROM watermarks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, task_id: str, modification_time: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO watermarks VALUES (?, ?)"
+                " ON CONFLICT (task_id) DO UPDATE SET modification_time = excluded.modification_time",
+                (task_id, modification_time),
+            )
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> int:
+        columns = ", ".join(COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[1:])
+        sql = (
+            f"INSERT INTO results ({columns}, digest, seq) VALUES ({', '.join('?' * (len(COLUMNS) + 2))})"
+            f" ON CONFLICT (id) DO UPDATE SET {updates}, digest = excluded.digest, seq = excluded.seq"
+            " WHERE results.digest != excluded.digest"
+        )
+        changed = 0
+        with self._lock, self._db:
+            for row in rows:
+                values = [row[column] for column in COLUMNS]
+                digest = hashlib.sha1(json.dumps(values).encode()).hexdigest()
+                cursor = self._db.execute(sql, (*values, digest, self._seq + 1))
+                if cursor.rowcount:
+                    self._seq += 1
+                    changed += 1
+        return changed
+
+    def changes(self, since: int, task_id: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        sql = f"SELECT {', '.join(COLUMNS)}, seq FROM results WHERE seq > ?"
+        params: List[Any] = [since]
+        if task_id:
+            sql += " AND task_id = ?"
+            params.append(task_id)
+        sql += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params)]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+RESULT_STORES = {
+    "sqlite": SQLiteResultStore,
+}
+
+
+def open_result_store(url: str) -> ResultStore:
+    """Opens a store from a ``<kind>://<location>`` URL, e.g.
+    ``sqlite:///var/lib/gvm/results.db`` or ``sqlite://:memory:``."""
+    kind, _, location = url.partition("://")
+    if kind not in RESULT_STORES:
+        raise ValueError(f"Unknown result store '{kind}', expected one of: {', '.join(RESULT_STORES)}")
+    return RESULT_STORES[kind](location)
+
+# ---------------------- sync ----------------------
+
+class ResultSync:
+    """Copies results into a store, fetching only what changed since the
+    task's watermark (the newest modification_time seen).
+
+    Pages are read by keyset: each page asks for the results modified at or
+    after the newest second of the previous one, skipping only the rows of
+    that second already read. A result modified during the run moves past
+    the cursor and is read again at the end instead of shifting the rows
+    still to come, as it would with plain offsets.
+    """
+
+    def __init__(self, managers, store: Optional[ResultStore] = None, page_size: int = 1000):
+        self._managers = managers
+        self.store = store
+        self.page_size = page_size
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _filter(self, task_id: str, since: Optional[datetime], skip: int) -> str:
+        terms = [f"task_id={task_id}"]
+        if since:
+            # gvmd only compares with ">" and to the second; unchanged rows
+            # are skipped by the store, so re-reading that second is cheap
+            terms.append(f"modified>{int(since.timestamp()) - 1}")
+        terms += ["sort=modified", f"first={skip + 1}", f"rows={self.page_size}"]
+        return " ".join(terms)
+
+    async def _fetch_page(self, task_id: str, since: Optional[datetime], skip: int) -> List[Dict[str, Any]]:
+        manager, local_id = self._managers.route(task_id)
+        async with manager.pool.session() as gmp:
+            rows = [
+                normalize_result(convert_entity(result, "result", SYNC_FIELDS))
+                async for result in gmp.iter_elements(
+                    "get_results",
+                    "result",
+                    task_id=local_id,
+                    filter_string=self._filter(local_id, since, skip),
+                )
+            ]
+        for row in rows:
+            for key in ("id", "task_id", "report_id"):
+                row[key] = manager.global_id(row[key])
+        return rows
+
+    async def sync_task(self, task_id: str) -> Dict[str, Any]:
+        lock = self._locks.setdefault(task_id, asyncio.Lock())
+        async with lock:
+            watermark = await asyncio.to_thread(self.store.get_watermark, task_id)
+            cursor = parse_time(watermark) if watermark else None
+            # Rows of the cursor's second already read in this run
+            skip = 0
+            fetched = changed = pages = 0
+            while True:
+                rows = await self._fetch_page(task_id, cursor, skip)
+                pages += 1
+                fetched += len(rows)
+                if rows:
+                    changed += await asyncio.to_thread(self.store.upsert, rows)
+                times = [parse_time(row["modification_time"]) for row in rows if row["modification_time"]]
+                newest = max(times) if times else None
+                if newest is not None and (cursor is None or newest > cursor):
+                    cursor = newest
+                    skip = times.count(newest)
+                    # Everything before the cursor is stored, so a failed run
+                    # resumes from here
+                    await asyncio.to_thread(self.store.set_watermark, task_id, format_time(cursor))
+                else:
+                    # The whole page shares the cursor's second
+                    skip += len(rows)
+                if len(rows) < self.page_size:
+                    break
+            return {
+                "task_id": task_id,
+                "fetched": fetched,
+                "changed": changed,
+                "pages": pages,
+                "watermark": format_time(cursor) if cursor else None,
+            }
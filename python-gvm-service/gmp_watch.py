@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# gvmd task statuses after which nothing changes until someone acts
+IDLE_STATUSES = {"New", "Done", "Stopped", "Interrupted"}
+
+Snapshot = Dict[str, Dict[str, Any]]
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Dict[str, Any]:
+    """Tasks that were added or changed, and ids of tasks that went away."""
+    return {
+        "changed": [task for task_id, task in new.items() if old.get(task_id) != task],
+        "removed": [task_id for task_id in old if task_id not in new],
+    }
+
+
+def snapshot_event(snapshot: Snapshot) -> Dict[str, Any]:
+    return {"type": "snapshot", "tasks": list(snapshot.values())}
+
+
+class Subscription:
+    def __init__(self, max_queued: int):
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(max_queued)
+
+    def publish(self, event: Dict[str, Any], snapshot: Snapshot) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A slow consumer gets the full state instead of a backlog of diffs
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(snapshot_event(snapshot))
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None when nothing happened within ``timeout``."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class TaskWatcher:
+    """Polls task status once for every subscriber and pushes the changes.
+
+    ``fetch`` returns the current state as ``{task_id: task}``. Polling only
+    runs while there are subscribers. The interval drops to ``min_interval``
+    while a task is active or something changed and doubles up to
+    ``max_interval`` while everything is idle; ``poke`` forces a poll.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[Snapshot]],
+        min_interval: float = 2.0,
+        max_interval: float = 30.0,
+        max_queued: int = 100,
+    ):
+        self._fetch = fetch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_queued = max_queued
+        self.interval = min_interval
+
+        self._snapshot: Optional[Snapshot] = None
+        # Wall clock time the current snapshot's poll started
+        self.polled_at = 0.0
+        self._subscribers: Set[Subscription] = set()
+        self._keepers = 0
+        self._polled = asyncio.Condition()
+        self._wanted = asyncio.Event()
+        self._poke = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self._polls = 0
+        self._errors = 0
+        self._events = 0
+        self._last_poll = 0.0
+        self._last_duration = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def poke(self) -> None:
+        self._poke.set()
+
+    @property
+    def snapshot(self) -> Optional[Snapshot]:
+        return self._snapshot
+
+    @asynccontextmanager
+    async def subscribe(self):
+        subscription = Subscription(self.max_queued)
+        if self._snapshot is not None:
+            subscription.publish(snapshot_event(self._snapshot), self._snapshot)
+        self._want()
+        self._subscribers.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscribers.discard(subscription)
+            self._unwant()
+
+    @asynccontextmanager
+    async def keep_polling(self):
+        """Keeps polling going without receiving events, for users of
+        ``snapshot`` and ``next_poll``."""
+        self._want()
+        self._keepers += 1
+        try:
+            yield
+        finally:
+            self._keepers -= 1
+            self._unwant()
+
+    def _want(self) -> None:
+        if not self._subscribers and not self._keepers:
+            # Polling was paused, so the state may be stale
+            self.poke()
+        self._wanted.set()
+
+    def _unwant(self) -> None:
+        if not self._subscribers and not self._keepers:
+            self._wanted.clear()
+
+    async def next_poll(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the next successful poll; False on timeout."""
+        async with self._polled:
+            try:
+                await asyncio.wait_for(self._polled.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await self._wanted.wait()
+            self._poke.clear()
+            await self._poll()
+            try:
+                await asyncio.wait_for(self._poke.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self) -> None:
+        started = time.monotonic()
+        polled_at = time.time()
+        try:
+            snapshot = await self._fetch()
+        except Exception:
+            self._errors += 1
+            self.interval = min(self.interval * 2, self.max_interval)
+            logger.exception("Polling task status failed")
+            return
+        finally:
+            self._polls += 1
+            self._last_poll = time.time()
+            self._last_duration = time.monotonic() - started
+
+        if self._snapshot is None:
+            event = snapshot_event(snapshot)
+            changed = True
+        else:
+            event = {"type": "changes", **diff_snapshots(self._snapshot, snapshot)}
+            changed = bool(event["changed"] or event["removed"])
+        self._snapshot = snapshot
+        self.polled_at = polled_at
+        async with self._polled:
+            self._polled.notify_all()
+
+        active = any(task.get("status") not in IDLE_STATUSES for task in snapshot.values())
+        if changed or active:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+        if changed:
+            self._events += 1
+            for subscription in list(self._subscribers):
+                subscription.publish(event, snapshot)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "subscribers": len(self._subscribers),
+            "keepers": self._keepers,
+            "tasks": len(self._snapshot or ()),
+            "interval": self.interval,
+            "polls": self._polls,
+            "errors": self._errors,
+            "events": self._events,
+            "last_poll": self._last_poll,
+            "last_poll_duration": round(self._last_duration, 6),
+        }
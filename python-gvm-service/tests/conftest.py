@@ -0,0 +1,41 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from gmp_simulator import CHUNK_SIZE, GmpSimulator  # noqa: E402
+
+
+@pytest.fixture
+def simulator(tmp_path):
+    """A GmpSimulator served on a Unix socket from a thread of its own;
+    yields the simulator and the socket path."""
+    simulator = GmpSimulator(results=250, tasks=2, targets=1, schedules=1, scan_duration=1.0)
+    path = str(tmp_path / "gmp.sock")
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def serve():
+        server = await asyncio.start_unix_server(simulator.handle, path, limit=CHUNK_SIZE)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def run():
+        try:
+            loop.run_until_complete(serving)
+        except asyncio.CancelledError:
+            pass
+
+    serving = loop.create_task(serve())
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert ready.wait(5), "simulator did not start"
+    yield simulator, path
+    loop.call_soon_threadsafe(serving.cancel)
+    thread.join(5)
+    loop.close()
@@ -0,0 +1,161 @@
+import asyncio
+
+from gmp_admission import PRIORITIES, AdmissionQueue, AdmissionStore
+from gmp_watch import TaskWatcher
+
+
+class FakeGvmd:
+    """Task states as the watcher sees them; started tasks run until finished."""
+
+    def __init__(self, start_delay: float = 0.0):
+        self.tasks = {}
+        self.start_delay = start_delay
+        self.started = []
+
+    async def fetch(self):
+        return {task_id: dict(task) for task_id, task in self.tasks.items()}
+
+    async def start(self, task_id: str):
+        await asyncio.sleep(self.start_delay)
+        self.started.append(task_id)
+        self.tasks[task_id] = {"status": "Running", "scanner": {"id": "scanner"}}
+        return {"report_id": f"report-{task_id}"}
+
+
+def queue_row(task_id: str, team: str, priority: str, seq: int):
+    return {
+        "task_id": task_id, "team": team, "priority": PRIORITIES[priority],
+        "scanner_id": "scanner", "enqueued_at": 0.0, "seq": seq,
+    }
+
+
+def test_queue_order_and_persistence(tmp_path):
+    path = str(tmp_path / "admission.db")
+    store = AdmissionStore(path)
+    for row in (
+        queue_row("a1", "a", "normal", 1),
+        queue_row("a2", "a", "normal", 2),
+        queue_row("a3", "a", "normal", 3),
+        queue_row("b1", "b", "normal", 4),
+        queue_row("low", "b", "low", 5),
+        queue_row("urgent", "c", "high", 6),
+    ):
+        store.put("queue", row)
+    store.close()
+
+    async def run():
+        queue = AdmissionQueue(TaskWatcher(FakeGvmd().fetch), FakeGvmd().start, max_running=1)
+        # A restart finds the queue where it was
+        queue.open(AdmissionStore(path))
+        try:
+            return [entry["task_id"] for entry in queue.queued()]
+        finally:
+            queue.close()
+
+    # Priority first, then the team with fewer tasks started, then submission order
+    assert asyncio.run(run()) == ["urgent", "a1", "b1", "a2", "a3", "low"]
+
+
+def test_team_weights():
+    queue = AdmissionQueue(TaskWatcher(FakeGvmd().fetch), FakeGvmd().start, team_weights={"a": 2})
+    queue.open(AdmissionStore())
+    for seq, (task_id, team) in enumerate([("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("b2", "b")], 1):
+        queue._queue[task_id] = queue_row(task_id, team, "normal", seq)
+
+    assert [entry["task_id"] for entry in queue.queued()] == ["a1", "b1", "a2", "a3", "b2"]
+
+
+def test_starts_wait_for_room_and_do_not_hold_the_lock():
+    gvmd = FakeGvmd(start_delay=0.2)
+
+    async def run():
+        watcher = TaskWatcher(gvmd.fetch, min_interval=0.01, max_interval=0.05)
+        queue = AdmissionQueue(watcher, gvmd.start, max_running=1)
+        queue.open(AdmissionStore())
+        watcher.start()
+        queue.start()
+        try:
+            first = asyncio.create_task(queue.submit("t1", "scanner", "default", PRIORITIES["normal"]))
+            await asyncio.sleep(0.05)
+            # t1 is still being started and takes the only slot
+            second = await asyncio.wait_for(queue.submit("t2", "scanner", "default", PRIORITIES["normal"]), 0.1)
+            third = await asyncio.wait_for(queue.submit("t3", "scanner", "default", PRIORITIES["normal"]), 0.1)
+            removed = await asyncio.wait_for(queue.discard("t3"), 0.1)
+            started = await first
+
+            gvmd.tasks["t1"]["status"] = "Done"
+            for _ in range(100):
+                if "t2" in gvmd.started:
+                    break
+                await asyncio.sleep(0.02)
+            return started, second, third, removed, queue.stats()
+        finally:
+            await queue.stop()
+            await watcher.stop()
+
+    started, second, third, removed, stats = asyncio.run(run())
+    assert started == {"task_id": "t1", "started": True, "report_id": "report-t1"}
+    assert second["started"] is False and second["position"] == 1
+    assert third["position"] == 2
+    assert removed is True
+    assert gvmd.started == ["t1", "t2"]
+    assert stats["queued"] == 0
+
+
+def test_failed_start_frees_its_slot():
+    gvmd = FakeGvmd()
+
+    async def start(task_id: str):
+        if task_id == "broken":
+            raise RuntimeError("Failed to find task")
+        return await gvmd.start(task_id)
+
+    async def run():
+        watcher = TaskWatcher(gvmd.fetch, min_interval=0.01, max_interval=0.05)
+        queue = AdmissionQueue(watcher, start, max_running=1)
+        queue.open(AdmissionStore())
+        watcher.start()
+        queue.start()
+        try:
+            try:
+                await queue.submit("broken", "scanner", "default", PRIORITIES["normal"])
+            except RuntimeError as e:
+                error = str(e)
+            started = await queue.submit("ok", "scanner", "default", PRIORITIES["normal"])
+            return error, started, queue.stats()
+        finally:
+            await queue.stop()
+            await watcher.stop()
+
+    error, started, stats = asyncio.run(run())
+    assert error == "Failed to find task"
+    assert started["started"] is True
+    assert stats["recent_failures"][0]["task_id"] == "broken"
+
+
+def test_scanner_limits_apply_per_manager():
+    gvmd = FakeGvmd()
+
+    async def run():
+        watcher = TaskWatcher(gvmd.fetch, min_interval=0.01, max_interval=0.05)
+        queue = AdmissionQueue(
+            watcher,
+            gvmd.start,
+            max_running_per_scanner=1,
+            scanner_limits={("scan2", "scanner"): 2},
+            manager_of=lambda task_id: task_id.split(".")[0] if "." in task_id else "default",
+        )
+        queue.open(AdmissionStore())
+        watcher.start()
+        queue.start()
+        try:
+            # The same built-in scanner id on two gvmds is two scanners
+            return [
+                (await queue.submit(task_id, "scanner", "default", PRIORITIES["normal"]))["started"]
+                for task_id in ("t1", "t2", "scan2.t1", "scan2.t2", "scan2.t3")
+            ]
+        finally:
+            await queue.stop()
+            await watcher.stop()
+
+    assert asyncio.run(run()) == [True, False, True, True, False]
@@ -0,0 +1,61 @@
+import asyncio
+
+from fastapi import HTTPException
+from gvm.errors import GvmResponseError
+
+from gmp_batch import run_batch
+
+
+def test_failures_are_reported_per_item_in_order():
+    async def worker(item):
+        await asyncio.sleep(0.01 * (3 - item))
+        if item == 1:
+            raise RuntimeError("Failed to find port list")
+        if item == 2:
+            raise HTTPException(status_code=404, detail="Task 2 not found")
+        return {"id": f"id-{item}"}
+
+    result = asyncio.run(run_batch([0, 1, 2, 3], worker, 4))
+
+    assert result["succeeded"] == 2
+    assert result["failed"] == 2
+    assert result["results"] == [
+        {"index": 0, "ok": True, "id": "id-0"},
+        {"index": 1, "ok": False, "status": 500, "error": "Failed to find port list"},
+        {"index": 2, "ok": False, "status": 404, "error": "Task 2 not found"},
+        {"index": 3, "ok": True, "id": "id-3"},
+    ]
+
+
+def test_error_without_message_reports_its_type():
+    async def worker(item):
+        raise TimeoutError()
+
+    result = asyncio.run(run_batch([0], worker, 1))
+    assert result["results"][0]["error"] == "TimeoutError"
+
+
+def test_gvmd_errors_keep_their_status():
+    async def worker(item):
+        raise GvmResponseError(item, "Task name already exists")
+
+    result = asyncio.run(run_batch(["400", "503", None], worker, 3))
+    assert [entry["status"] for entry in result["results"]] == [400, 503, 500]
+    assert result["results"][0]["error"] == "Task name already exists"
+
+
+def test_concurrency_is_bounded():
+    in_flight = 0
+    highest = 0
+
+    async def worker(item):
+        nonlocal in_flight, highest
+        in_flight += 1
+        highest = max(highest, in_flight)
+        await asyncio.sleep(0.005)
+        in_flight -= 1
+        return {}
+
+    result = asyncio.run(run_batch(range(20), worker, 3))
+    assert result["succeeded"] == 20
+    assert highest == 3
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from gmp_cache import LIST, ResponseCache, etag_matches
+
+
+def counting_load(data, calls, delay=0.0):
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return data
+    return load
+
+
+def test_hit_within_ttl():
+    async def run():
+        cache = ResponseCache({"task": 60})
+        calls = []
+        first = await cache.get_or_load(("task", LIST), counting_load({"tasks": []}, calls))
+        second = await cache.get_or_load(("task", LIST), counting_load({"tasks": [1]}, calls))
+        return cache, calls, first, second
+
+    cache, calls, first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert second is first
+    assert first.body == b'{"tasks":[]}'
+    assert cache.stats()["hits"] == 1
+
+
+def test_entity_without_ttl_is_not_cached():
+    async def run():
+        cache = ResponseCache({"task": 60})
+        calls = []
+        for _ in range(3):
+            await cache.get_or_load(("report", "r1"), counting_load({}, calls))
+        return cache, calls
+
+    cache, calls = asyncio.run(run())
+    assert len(calls) == 3
+    assert cache.stats()["entries"] == 0
+
+
+def test_concurrent_misses_share_one_load():
+    async def run():
+        cache = ResponseCache({"target": 60})
+        calls = []
+        entries = await asyncio.gather(
+            *(cache.get_or_load(("target", "t1"), counting_load({"id": "t1"}, calls, 0.01)) for _ in range(10))
+        )
+        return cache, calls, entries
+
+    cache, calls, entries = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(entry is entries[0] for entry in entries)
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_failed_load_reaches_every_waiter_and_is_not_cached():
+    async def run():
+        cache = ResponseCache({"target": 60})
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("gvmd down")
+
+        results = await asyncio.gather(
+            *(cache.get_or_load(("target", "t1"), fail) for _ in range(3)), return_exceptions=True
+        )
+        return cache, results
+
+    cache, results = asyncio.run(run())
+    assert [str(result) for result in results] == ["gvmd down"] * 3
+    assert cache.stats()["entries"] == 0
+
+
+def test_ttl_for_can_disable_caching():
+    async def run():
+        cache = ResponseCache({"task": 60})
+        calls = []
+        for _ in range(2):
+            await cache.get_or_load(("task", LIST), counting_load({"partial": True}, calls), lambda data, ttl: 0)
+        return calls
+
+    assert len(asyncio.run(run())) == 2
+
+
+def test_invalidate_drops_entity_listing_and_dependents():
+    async def run():
+        cache = ResponseCache({"target": 60, "task": 60})
+        for key in (("target", LIST), ("target", "t1"), ("target", "t2"), ("task", LIST), ("task", "k1")):
+            await cache.get_or_load(key, counting_load({}, []))
+        cache.invalidate("target", "t1")
+        return set(cache._entries)
+
+    # Tasks embed their target's name, so they go too
+    assert asyncio.run(run()) == {("target", "t2")}
+
+
+def test_load_started_before_invalidation_is_not_stored():
+    async def run():
+        cache = ResponseCache({"task": 60})
+        pending = asyncio.create_task(cache.get_or_load(("task", "k1"), counting_load({"status": "New"}, [], 0.01)))
+        await asyncio.sleep(0)
+        cache.invalidate("task", "k1")
+        stale = await pending
+        calls = []
+        fresh = await cache.get_or_load(("task", "k1"), counting_load({"status": "Running"}, calls))
+        return stale, fresh, calls
+
+    stale, fresh, calls = asyncio.run(run())
+    assert stale.body == b'{"status":"New"}'
+    assert fresh.body == b'{"status":"Running"}'
+    assert len(calls) == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    async def run():
+        cache = ResponseCache({"target": 60}, max_entries=2)
+        for target_id in ("t1", "t2"):
+            await cache.get_or_load(("target", target_id), counting_load({}, []))
+        await cache.get_or_load(("target", "t1"), counting_load({}, []))
+        await cache.get_or_load(("target", "t3"), counting_load({}, []))
+        return cache
+
+    cache = asyncio.run(run())
+    assert set(cache._entries) == {("target", "t1"), ("target", "t3")}
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [(None, False), ('"abc"', True), ('W/"abc"', True), ('"x", "abc"', True), ("*", True), ('"x"', False)],
+)
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
@@ -0,0 +1,39 @@
+import pytest
+from lxml import etree
+
+from gmp_convert import convert_response, element_to_dict, validate_fields
+
+RESPONSE = etree.fromstring(
+    '<get_results_response status="200" status_text="OK">'
+    '<result id="r1"><name>Check</name><host>10.0.0.1<hostname>web</hostname></host>'
+    "<severity>7.5</severity><qod><value>80</value><type>remote_banner</type></qod></result>"
+    '<result id="r2"><severity>bogus</severity></result>'
+    "<result_count>2<filtered>2</filtered><page>2</page></result_count>"
+    "</get_results_response>"
+)
+
+
+def test_without_fields_keeps_element_to_dict_shape():
+    assert convert_response(RESPONSE, "result") == element_to_dict(RESPONSE)
+
+
+def test_all_fields_are_typed():
+    data = convert_response(RESPONSE, "result", "*")
+    first, second = data["result"]
+    assert first["severity"] == 7.5
+    assert first["qod"] == {"value": 80, "type": "remote_banner"}
+    assert first["host"]["text"] == "10.0.0.1"
+    assert second["severity"] is None
+    assert second["nvt"] is None
+    assert data["result_count"] == {"text": 2, "filtered": 2, "page": 2}
+
+
+def test_projection():
+    data = convert_response(RESPONSE, "result", "id,qod.value")
+    assert data["result"][0] == {"id": "r1", "qod": {"value": 80}}
+
+
+@pytest.mark.parametrize("fields", ["nope", "qod.nope", "severity.foo", "qod,severity.foo", "*,id"])
+def test_unknown_fields_are_rejected(fields):
+    with pytest.raises(ValueError, match="Unknown field"):
+        validate_fields("result", fields)
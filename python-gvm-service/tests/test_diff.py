@@ -0,0 +1,115 @@
+import asyncio
+
+from lxml import etree
+
+from gmp_convert import convert_entity
+from gmp_diff import INDEX_FIELDS, ReportDiff, ReportIndexBuilder, ReportIndexCache
+
+
+def result(result_id: str, host: str, port: str, oid: str, severity: float):
+    return etree.fromstring(
+        f'<result id="{result_id}"><name>Check {oid}</name><host>{host}<asset asset_id=""/></host>'
+        f'<port>{port}</port><nvt oid="{oid}"><name>NVT {oid}</name><family>General</family></nvt>'
+        f"<severity>{severity}</severity></result>"
+    )
+
+
+def build(report_id: str, results, task_id: str = "task"):
+    builder = ReportIndexBuilder(report_id, task_id, "Done", lambda local_id: "scan2." + local_id)
+    for element in results:
+        builder.append(convert_entity(element, "result", INDEX_FIELDS))
+    return builder.build()
+
+
+BASE = [
+    result("b1", "10.0.0.1", "80/tcp", "1.1", 5.0),
+    result("b2", "10.0.0.1", "443/tcp", "1.2", 7.5),
+    result("b3", "10.0.0.2", "22/tcp", "1.3", 2.0),
+    result("b4", "10.0.0.3", "22/tcp", "1.3", 9.8),
+]
+COMPARE = [
+    result("c1", "10.0.0.1", "80/tcp", "1.1", 5.0),
+    result("c2", "10.0.0.1", "443/tcp", "1.2", 9.0),
+    result("c3", "10.0.0.4", "80/tcp", "1.1", 4.0),
+    result("c4", "10.0.0.5", "80/tcp", "1.1", 6.5),
+]
+
+
+def test_diff_counts_and_findings():
+    diff = ReportDiff(build("base", BASE), build("compare", COMPARE))
+
+    assert diff.counts() == {"new": 2, "resolved": 2, "changed": 1, "unchanged": 1}
+    findings = list(diff.findings())
+    # Most severe first within each kind of change
+    assert [(f["change"], f["result_id"]) for f in findings] == [
+        ("new", "scan2.c4"),
+        ("new", "scan2.c3"),
+        ("resolved", "scan2.b4"),
+        ("resolved", "scan2.b3"),
+        ("changed", "scan2.c2"),
+    ]
+    assert findings[-1] == {
+        "change": "changed",
+        "result_id": "scan2.c2",
+        "host": "10.0.0.1",
+        "port": "443/tcp",
+        "nvt": {"oid": "1.2", "name": "NVT 1.2"},
+        "severity": 9.0,
+        "previous_severity": 7.5,
+        "previous_result_id": "scan2.b2",
+    }
+    assert [f["change"] for f in diff.findings(["resolved"])] == ["resolved", "resolved"]
+
+
+def test_duplicate_findings_keep_the_most_severe():
+    index = build("r", [
+        result("r1", "10.0.0.1", "80/tcp", "1.1", 3.0),
+        result("r2", "10.0.0.1", "80/tcp", "1.1", 8.0),
+        result("r3", "10.0.0.1", "80/tcp", "1.1", 5.0),
+    ])
+
+    assert len(index) == 1
+    assert index.duplicates == 2
+    assert index.finding(0)["result_id"] == "scan2.r2"
+
+
+def test_diff_against_empty_report():
+    diff = ReportDiff(build("empty", []), build("compare", COMPARE))
+    assert diff.counts() == {"new": 4, "resolved": 0, "changed": 0, "unchanged": 0}
+
+    diff = ReportDiff(build("base", BASE), build("empty", []))
+    assert diff.counts() == {"new": 0, "resolved": 4, "changed": 0, "unchanged": 0}
+
+
+def test_size_is_known_after_build():
+    assert build("empty", []).nbytes == 0
+    assert build("base", BASE).nbytes > 0
+
+
+def test_index_cache_shares_loads_and_is_bounded_by_size():
+    size = build("base", BASE).nbytes
+
+    async def run():
+        cache = ReportIndexCache(60, max_bytes=2 * size)
+        loads = []
+
+        async def load(report_id, task_id="task"):
+            loads.append(report_id)
+            await asyncio.sleep(0.01)
+            return build(report_id, BASE, task_id)
+
+        shared = await asyncio.gather(*(cache.get_or_load("r1", lambda: load("r1")) for _ in range(5)))
+        await cache.get_or_load("r2", lambda: load("r2", "other"))
+        await cache.get_or_load("r3", lambda: load("r3", "other"))
+        bounded = cache.stats()
+        cache.invalidate_task("other")
+        return shared, loads, bounded, cache.stats()
+
+    shared, loads, bounded, invalidated = asyncio.run(run())
+    assert loads == ["r1", "r2", "r3"]
+    assert all(index is shared[0] for index in shared)
+    assert bounded["entries"] == 2
+    assert bounded["evictions"] == 1
+    assert bounded["bytes"] == 2 * size
+    assert invalidated["entries"] == 0
+    assert invalidated["bytes"] == 0
@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import os
+import time
+
+import pytest
+
+from gmp_reports import ReportDecoder, ReportSpool
+
+PDF = bytes(range(256)) * 40
+
+
+def pdf_response(payload: bytes = PDF, encoded: str = None) -> bytes:
+    encoded = base64.encodebytes(payload).decode() if encoded is None else encoded
+    return (
+        '<get_reports_response status="200" status_text="OK">'
+        '<report id="r1" format_id="f1" extension="pdf" content_type="application/pdf">'
+        f'<owner><name>admin</name></owner>{encoded}<report_format id="f1"><name>PDF</name></report_format>'
+        "</report><filters id=\"\"><term>first=1</term></filters></get_reports_response>"
+    ).encode()
+
+
+def xml_report(results: int = 0) -> bytes:
+    return (
+        '<report id="r1" format_id="f2" extension="xml" content_type="text/xml">'
+        '<report id="r1"><scan_run_status>Done</scan_run_status><results>'
+        + '<result id="x"><name>Check</name><severity>5.0</severity></result>' * results
+        + "</results></report></report>"
+    ).encode()
+
+
+def xml_response(results: int = 0) -> bytes:
+    return (
+        b'<get_reports_response status="200" status_text="OK">'
+        + xml_report(results)
+        + b'<filters id=""><term>first=1</term></filters><report_count>1<filtered>1</filtered></report_count>'
+        b"</get_reports_response>"
+    )
+
+
+def decode(response: bytes, chunk_size: int) -> tuple:
+    decoder = ReportDecoder()
+    body = b"".join(decoder.feed(response[i:i + chunk_size]) for i in range(0, len(response), chunk_size))
+    return decoder, body + decoder.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_base64_report_is_decoded_across_chunks(chunk_size):
+    decoder, body = decode(pdf_response(), chunk_size)
+    assert body == PDF
+    assert decoder.content_type == "application/pdf"
+    assert decoder.extension == "pdf"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4096])
+@pytest.mark.parametrize("results", [0, 5000])
+def test_xml_report_is_passed_through_without_the_response(chunk_size, results):
+    decoder, body = decode(xml_response(results), chunk_size)
+    assert body == xml_report(results)
+    assert decoder.content_type == "text/xml"
+
+
+def test_xml_report_is_streamed():
+    decoder = ReportDecoder()
+    response = xml_response(20000)
+    assert len(decoder.feed(response[:len(response) // 2])) > 0
+
+
+def test_truncated_xml_report_is_an_error():
+    decoder = ReportDecoder()
+    response = xml_response(3)
+    decoder.feed(response[:response.index(b"</results>")])
+    with pytest.raises(ValueError, match="truncated"):
+        decoder.finish()
+
+
+def test_truncated_report_is_an_error():
+    decoder = ReportDecoder()
+    # "abcde" is YWJjZGU=
+    decoder.feed(pdf_response(encoded="YWJjZ"))
+    with pytest.raises(ValueError, match="truncated"):
+        decoder.finish()
+
+
+def test_response_without_report_is_an_error():
+    decoder = ReportDecoder()
+    decoder.feed(b'<get_reports_response status="200" status_text="OK"></get_reports_response>')
+    with pytest.raises(ValueError, match="does not contain a report"):
+        decoder.finish()
+
+
+def test_invalid_base64_is_an_error():
+    decoder = ReportDecoder()
+    with pytest.raises(ValueError, match="not valid base64"):
+        decoder.feed(pdf_response().replace(b"AAEC", b"A=EC", 1))
+
+
+async def chunks(parts, fail=False):
+    for part in parts:
+        yield part
+    if fail:
+        raise ConnectionError("gvmd went away")
+
+
+async def drain(iterator):
+    return b"".join([chunk async for chunk in iterator])
+
+
+def test_spool_keeps_complete_downloads(tmp_path):
+    spool = ReportSpool(str(tmp_path))
+    decoder = ReportDecoder()
+    decoder.extension = "pdf"
+    body = asyncio.run(drain(spool.tee(chunks([b"%PDF", b"-1.4"]), "r1", "pdf", decoder)))
+
+    assert body == b"%PDF-1.4"
+    path = spool.lookup("r1", "pdf")
+    assert path == str(tmp_path / "r1.pdf.pdf")
+    assert open(path, "rb").read() == b"%PDF-1.4"
+    assert spool.lookup("r1", "xml") is None
+
+
+def test_spool_drops_failed_downloads(tmp_path):
+    spool = ReportSpool(str(tmp_path))
+    decoder = ReportDecoder()
+    decoder.extension = "pdf"
+    with pytest.raises(ConnectionError):
+        asyncio.run(drain(spool.tee(chunks([b"%PDF"], fail=True), "r1", "pdf", decoder)))
+
+    assert spool.lookup("r1", "pdf") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_spool_expires_and_evicts(tmp_path):
+    spool = ReportSpool(str(tmp_path), max_age=60, max_bytes=10)
+    decoder = ReportDecoder()
+    decoder.extension = "txt"
+    asyncio.run(drain(spool.tee(chunks([b"123456"]), "old", "txt", decoder)))
+    stale = time.time() - 120
+    os.utime(tmp_path / "old.txt.txt", (stale, stale))
+    assert spool.lookup("old", "txt") is None
+
+    asyncio.run(drain(spool.tee(chunks([b"123456"]), "r1", "txt", decoder)))
+    os.utime(tmp_path / "r1.txt.txt", (stale, stale))
+    asyncio.run(drain(spool.tee(chunks([b"123456"]), "r2", "txt", decoder)))
+    # Over max_bytes, so the older file goes
+    assert sorted(os.listdir(tmp_path)) == ["r2.txt.txt"]
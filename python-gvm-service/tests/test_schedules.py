@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from dateutil.rrule import rrulestr
+
+from gmp_schedules import ForecastTooLarge, build_icalendar, expand, forecast, parse_recurrence
+
+UTC = timezone.utc
+
+
+def reference(time: str, period, until, tz: str, start: datetime, end: datetime):
+    """Run times by plain dateutil, repeating in the schedule's timezone."""
+    first = datetime.strptime(time, "%Y%m%dT%H%M%SZ").replace(tzinfo=UTC).astimezone(ZoneInfo(tz))
+    if not period:
+        runs = [first]
+    else:
+        rule = period + (f";UNTIL={until}" if until else "")
+        runs = rrulestr(rule, dtstart=first).between(start, end, inc=True)
+    return sorted(int(run.timestamp()) for run in runs if start <= run < end)
+
+
+CASES = [
+    # Crosses the start of daylight saving time
+    ("20240301T080000Z", "FREQ=DAILY", None, "Europe/Berlin"),
+    ("20240101T120000Z", "FREQ=HOURLY;INTERVAL=5", None, "UTC"),
+    ("20240101T000000Z", "FREQ=DAILY", "20240110T000000Z", "UTC"),
+    ("20240101T090000Z", "FREQ=WEEKLY;COUNT=3", None, "UTC"),
+    # Months without a 31st are skipped
+    ("20240131T100000Z", "FREQ=MONTHLY", None, "UTC"),
+    ("20240229T100000Z", "FREQ=YEARLY", None, "UTC"),
+    ("20240115T140000Z", "FREQ=MONTHLY;INTERVAL=2", None, "America/New_York"),
+    # Not handled by the array expansion, so dateutil's
+    ("20240101T140000Z", "FREQ=WEEKLY;BYDAY=MO,WE,FR", None, "America/New_York"),
+    ("20240301T080000Z", None, None, "Europe/Berlin"),
+]
+
+
+@pytest.mark.parametrize("time, period, until, tz", CASES)
+def test_expansion_matches_dateutil(time, period, until, tz):
+    start = datetime(2024, 1, 5, tzinfo=UTC)
+    end = datetime(2025, 1, 1, tzinfo=UTC) if period != "FREQ=YEARLY" else datetime(2033, 1, 1, tzinfo=UTC)
+    recurrence = parse_recurrence(build_icalendar(time, period, until), tz)
+
+    index, times, errors = expand([recurrence], start, end)
+
+    assert errors == {}
+    assert sorted(times.tolist()) == reference(time, period, until, tz, start, end)
+    assert set(index.tolist()) <= {0}
+
+
+def test_schedules_are_expanded_together():
+    start = datetime(2024, 3, 1, tzinfo=UTC)
+    end = datetime(2024, 4, 1, tzinfo=UTC)
+    recurrences = [parse_recurrence(build_icalendar(time, period, until), tz) for time, period, until, tz in CASES]
+
+    index, times, _ = expand(recurrences, start, end)
+
+    for i, (time, period, until, tz) in enumerate(CASES):
+        assert sorted(times[index == i].tolist()) == reference(time, period, until, tz, start, end)
+
+
+def test_forecast_histogram():
+    schedules = [{"id": "s1", "name": "nightly", "icalendar": build_icalendar("20240101T220000Z"), "timezone": "UTC"}]
+    tasks = [
+        {"id": "t1", "schedule": {"id": "s1"}, "target": {"id": "g1"}, "average_duration": 3 * 3600},
+        {"id": "t2", "schedule": {"id": "s1"}, "target": {"id": "g1"}, "average_duration": None},
+        {"id": "t3", "schedule": None, "target": {"id": "g1"}},
+    ]
+    targets = [{"id": "g1", "max_hosts": 5}]
+    start = datetime(2024, 2, 1, tzinfo=UTC)
+
+    data = forecast(schedules, tasks, targets, start, datetime(2024, 2, 2, tzinfo=UTC), 3600, 1800)
+
+    histogram = data["histogram"]
+    assert len(histogram) == 24
+    assert data["scheduled_tasks"] == 2
+    assert data["task_starts"] == 2
+    # The run of the evening before is still going on at midnight
+    assert [hour["running"] for hour in histogram[:2]] == [1, 0]
+    assert histogram[22] == {"start": "20240201T220000Z", "starts": 2, "running": 2, "hosts": 10}
+    assert histogram[23]["running"] == 1
+    assert data["peak"] == {"start": "20240201T220000Z", "running": 2, "hosts": 10}
+    assert data["by_schedule"][0]["runs"] == 1
+
+
+def test_forecast_too_large():
+    schedules = [{"id": "s1", "icalendar": build_icalendar("20240101T000000Z", "FREQ=SECONDLY"), "timezone": "UTC"}]
+    tasks = [{"id": "t1", "schedule": {"id": "s1"}}]
+    with pytest.raises(ForecastTooLarge):
+        forecast(schedules, tasks, [], datetime(2024, 1, 1, tzinfo=UTC), datetime(2024, 6, 1, tzinfo=UTC), 86400, 60)
@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime, timezone
+
+from gmp_async import AsyncGmp, AsyncGmpPool
+from gmp_managers import HashPlacement, Manager, ManagerRegistry
+from gmp_simulator import BASE_TIME, task_id
+from gmp_sync import ResultSync, SQLiteResultStore, format_time
+
+
+def registry(path: str) -> ManagerRegistry:
+    pool = AsyncGmpPool(lambda: AsyncGmp(path=path), "admin", "admin", max_size=2)
+    return ManagerRegistry([Manager("default", pool, prefixed=False)], HashPlacement())
+
+
+def result_time(i: int) -> str:
+    return format_time(datetime.fromtimestamp(BASE_TIME + i, tz=timezone.utc))
+
+
+def test_sync_pages_through_everything_then_only_new_results(simulator):
+    sim, path = simulator
+    task = task_id(0)
+
+    async def run():
+        managers = registry(path)
+        sync = ResultSync(managers, SQLiteResultStore(), page_size=100)
+        try:
+            first = await sync.sync_task(task)
+            # Still the same results: only the watermark's second is re-read
+            again = await sync.sync_task(task)
+            sim.results = 330
+            grown = await sync.sync_task(task)
+            rows = sync.store.changes(0, task_id=task, limit=1000)
+            return first, again, grown, rows
+        finally:
+            await managers.close()
+
+    first, again, grown, rows = asyncio.run(run())
+
+    assert first["fetched"] == 250
+    assert first["changed"] == 250
+    assert first["watermark"] == result_time(249)
+    assert again["fetched"] == 1
+    assert again["changed"] == 0
+    assert grown["changed"] == 80
+    assert grown["watermark"] == result_time(329)
+    ids = [row["id"] for row in rows]
+    assert len(ids) == len(set(ids)) == 330